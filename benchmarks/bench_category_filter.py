@@ -0,0 +1,142 @@
+"""
+Benchmark category-filtered Overture queries on raw and clustered extracts.
+
+Runs the category and bbox predicates of the places-within-buffer query on an
+extract as downloaded, and on its copy clustered by `cluster_places`, for
+frequent and rare categories. Reports the query time and the row groups that
+DuckDB can't skip on the category statistics.
+
+Without `--extract`, a synthetic extract of `--rows` places over a few
+thousand categories of Zipf-like frequencies is generated.
+
+Run with `uv run python benchmarks/bench_category_filter.py [--extract PATH]`.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+
+from geo_assistant.vector.categories import (
+    CATEGORY_COLUMN,
+    CLUSTER_ROW_GROUP_SIZE,
+    category_filter,
+    cluster_places,
+)
+
+REPEATS = 5
+
+
+def synthetic_extract(path: Path, rows: int, row_group_size: int) -> None:
+    """Write places in random order, as in a downloaded extract."""
+    duckdb.execute(
+        f"""
+        COPY (
+            SELECT
+                'place-' || i AS id,
+                {{'primary': 'place_name_' || i}} AS names,
+                {{
+                    'primary': 'category_' || floor(pow(random(), 3) * 2000)::INT,
+                    'alternate': NULL::VARCHAR[]
+                }} AS categories,
+                {{'xmin': x, 'xmax': x + 0.0001, 'ymin': y, 'ymax': y + 0.0001}}
+                    AS bbox,
+                NULL::BLOB AS geometry
+            FROM (
+                SELECT i, random() * 360 - 180 AS x, random() * 170 - 85 AS y
+                FROM range({rows}) t(i)
+            )
+        ) TO '{path}' (FORMAT parquet, ROW_GROUP_SIZE {row_group_size});
+        """,
+    )
+
+
+def category_query(
+    connection: duckdb.DuckDBPyConnection,
+    path: Path,
+    category: str,
+) -> str:
+    """Category and bbox predicates of the places-within-buffer query."""
+    return f"""
+        SELECT id, names.primary AS name
+        FROM read_parquet('{path}')
+        WHERE {category_filter(connection, str(path), category)}
+        AND bbox.xmin <= 10 AND bbox.xmax >= -10
+        AND bbox.ymin <= 60 AND bbox.ymax >= 30
+        LIMIT 10
+    """
+
+
+def candidate_row_groups(path: Path, column: str, category: str) -> tuple[int, int]:
+    """Row groups whose category statistics include `category`, and in total."""
+    return duckdb.execute(
+        f"""
+        SELECT
+            count(*) FILTER (
+                WHERE stats_min_value <= '{category}'
+                AND stats_max_value >= '{category}'
+            ),
+            count(*)
+        FROM parquet_metadata('{path}')
+        WHERE path_in_schema = '{column}'
+        """,
+    ).fetchone()
+
+
+def main() -> None:
+    """Print query time and candidate row groups per extract and category."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--extract", type=Path, help="Overture places Parquet file")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--row-group-size", type=int, default=CLUSTER_ROW_GROUP_SIZE)
+    parser.add_argument(
+        "--categories",
+        nargs="+",
+        help="categories to query (default: a frequent and a rare one)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = args.extract
+        if raw is None:
+            raw = Path(tmp) / "raw.parquet"
+            synthetic_extract(raw, args.rows, args.row_group_size)
+        clustered = Path(tmp) / "clustered.parquet"
+        start = time.perf_counter()
+        cluster_places(str(raw), clustered, args.row_group_size)
+        print(f"Clustered {raw} in {time.perf_counter() - start:.1f}s\n")
+
+        if args.categories:
+            categories = args.categories
+        else:
+            by_frequency = duckdb.execute(
+                f"""
+                SELECT categories.primary FROM read_parquet('{raw}')
+                WHERE categories.primary IS NOT NULL
+                GROUP BY ALL ORDER BY count(*) DESC
+                """,
+            ).fetchall()
+            categories = [by_frequency[0][0], by_frequency[len(by_frequency) // 2][0]]
+
+        connection = duckdb.connect()
+        print(f"{'category':>24} {'extract':>10} {'time':>9} {'row groups':>12}")
+        for category in categories:
+            for name, path in [("raw", raw), ("clustered", clustered)]:
+                query = category_query(connection, path, category)
+                times = []
+                for _ in range(REPEATS):
+                    start = time.perf_counter()
+                    connection.execute(query).fetchall()
+                    times.append(time.perf_counter() - start)
+                column = CATEGORY_COLUMN if path == clustered else "categories, primary"
+                candidates, total = candidate_row_groups(path, column, category)
+                print(
+                    f"{category:>24} {name:>10} {min(times) * 1000:>7.1f}ms "
+                    f"{candidates:>5}/{total:<6}",
+                )
+
+
+if __name__ == "__main__":
+    main()
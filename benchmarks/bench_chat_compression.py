@@ -0,0 +1,101 @@
+"""
+Benchmark bytes transferred and time to last byte of compressed chat streams.
+
+Streams the NDJSON lines of a synthetic chat turn (place, search area, places,
+NAIP image, messages) through `compress_stream`, with every line flushed, and
+replays the measured compression times and chunk sizes over throttled links:
+each chunk is sent once it is compressed and the link is free, at the link's
+bandwidth, and arrives after half the round trip time. All lines are ready at
+the start, so the numbers are the transfer cost the agent's own latency adds to.
+
+Run with `uv run python benchmarks/bench_chat_compression.py [--places 200]`.
+"""
+
+import argparse
+import asyncio
+import time
+
+from chat_updates import chat_turn_updates
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.api.compression import compress_stream
+from geo_assistant.api.schemas.chat import ChatResponse
+
+# (name, bandwidth in bit/s, round trip time in s)
+LINKS = [
+    ("3G 750k", 750_000, 0.1),
+    ("DSL 2M", 2_000_000, 0.05),
+    ("Wifi 20M", 20_000_000, 0.02),
+]
+ENCODINGS = [None, "gzip", "zstd"]
+
+
+def ndjson_lines(updates: list[tuple[str, dict]]) -> list[bytes]:
+    """Lines of the chat stream, as written by `stream_chat`."""
+    return [
+        (
+            ChatResponse(
+                thread_id="00000000-0000-0000-0000-000000000000",
+                state=GeoAssistantState(**update),
+            ).model_dump_json()
+            + "\n"
+        ).encode()
+        for _, update in updates
+    ]
+
+
+async def compressed_chunks(
+    lines: list[bytes],
+    encoding: str | None,
+) -> list[tuple[float, bytes]]:
+    """Chunks of the stream and the time at which each is ready."""
+
+    async def source():
+        for line in lines:
+            yield line
+
+    stream = source() if encoding is None else compress_stream(source(), encoding)
+    start = time.perf_counter()
+    return [(time.perf_counter() - start, chunk) async for chunk in stream]
+
+
+def time_to_last_byte(
+    chunks: list[tuple[float, bytes]],
+    bandwidth: float,
+    rtt: float,
+) -> float:
+    """Arrival time of the last byte over a link with a bandwidth and RTT."""
+    link_free = 0.0
+    for ready, chunk in chunks:
+        link_free = max(link_free, ready) + len(chunk) * 8 / bandwidth
+    return link_free + rtt / 2
+
+
+def main() -> None:
+    """Print stream size and time to last byte per encoding and link."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--places", type=int, default=200)
+    parser.add_argument("--image-size", type=int, default=512)
+    args = parser.parse_args()
+
+    lines = ndjson_lines(
+        chat_turn_updates(places=args.places, image_size=args.image_size),
+    )
+    print(f"{len(lines)} lines, {args.places} places, {args.image_size}px image\n")
+    print(
+        f"{'encoding':>8} {'bytes':>9} {'ratio':>6} {'cpu':>8} "
+        + " ".join(f"{name:>10}" for name, _, _ in LINKS),
+    )
+    identity = sum(len(line) for line in lines)
+    for encoding in ENCODINGS:
+        chunks = asyncio.run(compressed_chunks(lines, encoding))
+        size = sum(len(chunk) for _, chunk in chunks)
+        ttlb = [time_to_last_byte(chunks, bw, rtt) for _, bw, rtt in LINKS]
+        print(
+            f"{encoding or 'identity':>8} {size:>9} {identity / size:>5.1f}x "
+            f"{chunks[-1][0] * 1000:>6.1f}ms " + " ".join(f"{t:>9.3f}s" for t in ttlb),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark serialization CPU time and payload size of the chat stream formats.
+
+Encodes the state updates of a synthetic chat turn (see `chat_updates.py`) as
+NDJSON lines and as MessagePack frames with raw image bytes, both dumped from
+the graph's objects as in `stream_chat`, for a growing number of places.
+
+Run with `uv run python benchmarks/bench_chat_serialization.py`.
+"""
+
+import argparse
+import time
+
+import zstandard
+from chat_updates import chat_turn_updates
+
+from geo_assistant.api.compression import ZSTD_LEVEL
+from geo_assistant.api.encoders import ENCODERS
+
+REPEATS = 5
+
+
+def main() -> None:
+    """Print encoding time and size per number of places and format."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--places", type=int, nargs="+", default=[10, 200, 2000])
+    args = parser.parse_args()
+
+    print(f"{'places':>7} {'format':>8} {'cpu':>9} {'bytes':>9} {'zstd bytes':>11}")
+    for places in args.places:
+        updates = [update for _, update in chat_turn_updates(places=places)]
+        for name, encode in ENCODERS.items():
+            times = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                chunks = [encode("thread", update) for update in updates]
+                times.append(time.perf_counter() - start)
+            compressed = len(
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(b"".join(chunks)),
+            )
+            print(
+                f"{places:>7} {name:>8} {min(times) * 1000:>7.2f}ms "
+                f"{sum(len(chunk) for chunk in chunks):>9} {compressed:>11}",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark geometry compaction: payload size and places query time.
+
+For search areas buffered around a point, like `get_search_area` makes them,
+compares the exact buffer with the compacted one (`GEOMETRY_PRECISION` digits,
+`GEOMETRY_TOLERANCE_M` simplification) on:
+
+- vertices and JSON size in the agent state, as streamed to the client.
+- time of the exact intersects predicate over an Overture-like places table,
+  on every row, or on the rows kept by the bbox prefilter.
+
+The places table is a synthetic GeoParquet-like file with Overture's `bbox`
+columns, spatially sorted like the Overture releases, so that DuckDB can prune
+row groups on the prefilter. The exact predicate is evaluated with shapely, as
+the DuckDB spatial extension may not be installed.
+
+Run with `uv run python benchmarks/bench_geometry_compaction.py [--rows 2000000]`.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import Point
+
+from geo_assistant.vector.compact import (
+    GEOMETRY_PRECISION,
+    GEOMETRY_TOLERANCE_M,
+    compact_geometry,
+    geometry_bounds,
+)
+
+CENTER = (-9.1393, 38.7223)
+BUFFERS_KM = [0.5, 2, 10]
+# Extent of the synthetic places around the center, in degrees.
+EXTENT = 1.0
+REPEATS = 3
+
+
+def search_area(buffer_km: float) -> dict:
+    """GeoJSON buffer of `buffer_km` around CENTER, as in `get_search_area`."""
+    gdf = gpd.GeoSeries([Point(*CENTER)], crs="EPSG:4326").to_crs(epsg=3857)
+    return shapely.geometry.mapping(
+        gdf.buffer(buffer_km * 1000).to_crs(epsg=4326).iloc[0],
+    )
+
+
+def write_places(path: Path, rows: int) -> None:
+    """Write a spatially sorted Parquet file of random places with bbox columns."""
+    rng = np.random.default_rng(0)
+    x = CENTER[0] + rng.uniform(-EXTENT, EXTENT, rows)
+    y = CENTER[1] + rng.uniform(-EXTENT, EXTENT, rows)
+    order = np.lexsort((y, np.floor(x * 20)))
+    with duckdb.connect() as con:
+        con.register("xy", {"x": x[order], "y": y[order]})
+        con.execute(
+            f"""
+            COPY (
+                SELECT
+                    {{'xmin': x, 'xmax': x, 'ymin': y, 'ymax': y}} AS bbox,
+                    x, y
+                FROM xy
+            ) TO '{path}' (FORMAT parquet, ROW_GROUP_SIZE 20000)
+            """,
+        )
+
+
+def query(path: Path, geometry: dict, prefilter: bool) -> tuple[float, int, int]:
+    """
+    Time a places query, return seconds, candidate rows and matching rows.
+
+    Without prefilter every row is tested with the exact predicate, with it
+    only the rows whose bbox intersects the geometry's.
+    """
+    where = ""
+    if prefilter:
+        minx, miny, maxx, maxy = geometry_bounds(geometry)
+        where = (
+            f"WHERE bbox.xmin <= {maxx} AND bbox.xmax >= {minx} "
+            f"AND bbox.ymin <= {maxy} AND bbox.ymax >= {miny}"
+        )
+    polygon = shapely.geometry.shape(geometry)
+    shapely.prepare(polygon)
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        with duckdb.connect() as con:
+            x, y = (
+                con.execute(
+                    f"SELECT x, y FROM read_parquet('{path}') {where}",
+                )
+                .fetchnumpy()
+                .values()
+            )
+        matches = int(shapely.intersects_xy(polygon, x, y).sum())
+        times.append(time.perf_counter() - start)
+    return min(times), len(x), matches
+
+
+def main() -> None:
+    """Print payload sizes and query times per search area size."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "places.parquet"
+        write_places(path, args.rows)
+
+        print(
+            f"precision {GEOMETRY_PRECISION} digits, tolerance "
+            f"{GEOMETRY_TOLERANCE_M} m, {args.rows} places\n",
+        )
+        print(
+            f"{'buffer':>7} {'geometry':>9} {'vertices':>8} {'state B':>8} "
+            f"{'query':>12} {'rows':>8} {'time':>8} {'matches':>8}",
+        )
+        for buffer_km in BUFFERS_KM:
+            exact = search_area(buffer_km)
+            geometries = {
+                "exact": exact,
+                "compact": compact_geometry(
+                    exact,
+                    GEOMETRY_PRECISION,
+                    GEOMETRY_TOLERANCE_M,
+                ),
+            }
+            for name, geometry in geometries.items():
+                vertices = shapely.get_num_coordinates(shapely.geometry.shape(geometry))
+                state_bytes = len(json.dumps(geometry))
+                for prefilter in (False, True):
+                    seconds, rows, matches = query(path, geometry, prefilter)
+                    print(
+                        f"{buffer_km:>5}km {name:>9} {vertices:>8} {state_bytes:>8} "
+                        f"{'bbox+exact' if prefilter else 'exact':>12} {rows:>8} "
+                        f"{seconds * 1000:>6.1f}ms {matches:>8}",
+                    )
+
+
+if __name__ == "__main__":
+    main()
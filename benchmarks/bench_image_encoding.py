@@ -0,0 +1,82 @@
+"""
+Benchmark contrast stretch + encode time and peak memory of NAIP RGB images.
+
+Compares the previous float32 pipeline (full float copy, two full
+`np.nanpercentile` passes, float clip and scale) with the sampled
+histogram stretch and lookup-table conversion in `geo_assistant.raster.encode`,
+for every output format. Peak memory is measured with tracemalloc, which
+tracks numpy allocations.
+
+Run with `uv run python benchmarks/bench_image_encoding.py [--sizes 512 2048 8192]`.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from geo_assistant.raster.encode import encode_image, stretch_limits, stretch_to_uint8
+
+
+def float_stretch(rgb: np.ndarray) -> np.ndarray:
+    """Contrast stretch as previously done in `fetch_naip_img`."""
+    arr = rgb.astype("float32")
+    vmin = np.nanpercentile(arr, 2)
+    vmax = np.nanpercentile(arr, 98)
+    if vmax <= vmin:
+        vmin, vmax = np.nanmin(arr), np.nanmax(arr)
+    arr = np.clip((arr - vmin) / (vmax - vmin + 1e-6), 0, 1)
+    return (arr * 255).astype("uint8")
+
+
+def sampled_stretch(rgb: np.ndarray) -> np.ndarray:
+    """Contrast stretch from a sampled histogram with lookup-table conversion."""
+    vmin, vmax = stretch_limits(rgb)
+    return stretch_to_uint8(rgb, vmin, vmax)
+
+
+def measure(fn, *args, **kwargs) -> tuple[float, float]:
+    """Return the wall time in seconds and peak traced memory in MiB of a call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main() -> None:
+    """Print stretch+encode time and peak memory per image size and pipeline."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 8192])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'pixels':>8} {'stretch':>8} {'format':>6} {'time':>9} {'peak MiB':>9}")
+    for size in args.sizes:
+        # Smooth-ish synthetic imagery so encoders see realistic redundancy.
+        base = rng.normal(110, 35, size=(size // 8, size // 8, 3)).clip(0, 255)
+        rgb = np.repeat(np.repeat(base, 8, axis=0), 8, axis=1).astype("uint8")
+
+        for stretch_name, stretch in [
+            ("float", float_stretch),
+            ("sampled", sampled_stretch),
+        ]:
+            for fmt in ["jpeg", "webp", "png"]:
+
+                def pipeline(stretch=stretch, fmt=fmt):
+                    encode_image(stretch(rgb.copy()), format=fmt)
+
+                # Exclude the input copy from the measurement.
+                copy_time, copy_peak = measure(rgb.copy)
+                elapsed, peak = measure(pipeline)
+                print(
+                    f"{size:>6}^2 {stretch_name:>8} {fmt:>6} "
+                    f"{elapsed - copy_time:>8.3f}s {peak - copy_peak:>9.1f}",
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark the throughput of the Overture places export, in rows per second.
+
+Exports every place of a category in an area of a synthetic GeoParquet
+extract, and compares:
+
+- featurecollection: the rows fetched into pandas and converted to a pydantic
+  FeatureCollection, as the places are kept in the agent state.
+- arrow: the export streamed as Arrow IPC record batches.
+- parquet: the export streamed as GeoParquet, a row group per batch.
+
+Reports rows per second and the size of the output. Needs the DuckDB spatial
+extension, provisioned with `python -m geo_assistant.vector.extensions`.
+
+Run with `uv run python benchmarks/bench_places_export.py [--rows 2000000]`.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import geopandas as gpd
+import numpy as np
+import shapely
+from geojson_pydantic import FeatureCollection
+from geojson_pydantic.geometries import Geometry
+from pydantic import TypeAdapter
+
+from geo_assistant.tools.overture import (
+    _export_places,
+    create_database_connection,
+    places_export_query,
+)
+
+CATEGORIES = ["cafe", "restaurant", "bar", "bakery"]
+# Places of the extract are spread over a 1x1 degree square, the area covers
+# most of it.
+AREA = TypeAdapter(Geometry).validate_python(
+    shapely.geometry.mapping(shapely.Point(0.5, 0.5).buffer(0.45)),
+)
+
+
+def synthetic_extract(path: Path, rows: int) -> None:
+    """Write Overture-like places of a few categories to a GeoParquet file."""
+    rng = np.random.default_rng(0)
+    x, y = rng.random(rows), rng.random(rows)
+    gpd.GeoDataFrame(
+        {
+            "id": [f"place-{i}" for i in range(rows)],
+            "names": [{"primary": f"Place {i}"} for i in range(rows)],
+            "categories": [
+                {"primary": category, "alternate": None}
+                for category in rng.choice(CATEGORIES, rows)
+            ],
+            "confidence": rng.random(rows),
+            "websites": [None] * rows,
+            "socials": [None] * rows,
+            "bbox": [
+                {"xmin": xi, "xmax": xi, "ymin": yi, "ymax": yi}
+                for xi, yi in zip(x, y, strict=True)
+            ],
+            "geometry": shapely.points(x, y),
+        },
+        crs="EPSG:4326",
+    ).to_parquet(path, row_group_size=100_000)
+
+
+def export(connection: duckdb.DuckDBPyConnection, path: Path, mode: str) -> int:
+    """Export the cafes of AREA in `mode`, return the size of the output in bytes."""
+    if mode == "featurecollection":
+        places = connection.execute(
+            places_export_query(connection, str(path), "cafe", AREA),
+        ).fetchdf()
+        places["geometry"] = shapely.from_wkb(places["geometry"])
+        gdf = gpd.GeoDataFrame(places, geometry="geometry", crs="EPSG:4326")
+        collection = FeatureCollection.model_validate(
+            json.loads(json.dumps(gdf.__geo_interface__, default=str)),
+        )
+        return len(collection.model_dump_json())
+
+    chunks = _export_places(connection, str(path), "cafe", AREA, mode)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main() -> None:
+    """Print the export throughput per mode."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=["featurecollection", "arrow", "parquet"],
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "places.parquet"
+        synthetic_extract(path, args.rows)
+        connection = create_database_connection("local")
+        query = places_export_query(connection, str(path), "cafe", AREA)
+        rows = connection.execute(f"SELECT count(*) FROM ({query})").fetchone()[0]
+
+        print(f"{'mode':>18} {'rows':>9} {'time':>8} {'rows/s':>11} {'MiB':>8}")
+        for mode in args.modes:
+            start = time.perf_counter()
+            size = export(connection, path, mode)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{mode:>18} {rows:>9} {elapsed:>7.2f}s {rows / elapsed:>11,.0f} "
+                f"{size / 2**20:>8.1f}",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark NAIP loads over HTTP with and without the shared raster I/O runtime.
+
+A synthetic COG is served by a local HTTP/1.1 server supporting range
+requests and keep-alive, with a simulated latency per request and per new
+connection. Each run loads the RGB bands of several AOIs of the COG one after
+the other, in a fresh subprocess so that the GDAL configuration and caches
+start empty:
+
+- default: what `fetch_naip_img` did before the runtime, odc-stac default GDAL
+  settings and a new thread pool of 5 threads per load.
+- runtime: `_load_naip_cube`, GDAL options of `geo_assistant.raster.runtime`
+  and the reads on the shared thread pool.
+
+The server counts the requests, new connections and bytes sent of each run.
+HTTP/2 multiplexing has no effect here, the server only speaks HTTP/1.1.
+
+Run with `uv run python benchmarks/bench_raster_io.py [--size 8192] [--loads 4]`.
+"""
+
+import argparse
+import http.server
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from naip_cog import ORIGIN, lonlat_bbox, make_naip_cog, naip_item
+from shapely.geometry import box, mapping
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class Counters:
+    """Requests, connections and bytes served since the last reset."""
+
+    def __init__(self) -> None:
+        """Start at zero."""
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset every counter to zero."""
+        self.requests = 0
+        self.connections = 0
+        self.bytes = 0
+
+    def add(self, requests: int = 0, connections: int = 0, nbytes: int = 0) -> None:
+        """Add to the counters."""
+        with self.lock:
+            self.requests += requests
+            self.connections += connections
+            self.bytes += nbytes
+
+
+def cog_server(root: Path, latency: float, connect_latency: float, counters: Counters):
+    """HTTP server of the files of `root` with range requests and keep-alive."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self) -> None:
+            # Stands for the TCP and TLS handshakes of a new connection.
+            time.sleep(connect_latency)
+            counters.add(connections=1)
+            super().setup()
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_HEAD(self) -> None:
+            self.respond(body=False)
+
+        def do_GET(self) -> None:
+            self.respond(body=True)
+
+        def respond(self, body: bool) -> None:
+            time.sleep(latency)
+            path = root / self.path.lstrip("/").split("?")[0]
+            if not path.is_file():
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                counters.add(requests=1)
+                return
+            size = path.stat().st_size
+            start, end = 0, size - 1
+            match = _RANGE.fullmatch(self.headers.get("Range", ""))
+            if match:
+                start = int(match[1])
+                end = min(int(match[2] or end), size - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            nbytes = 0
+            if body:
+                with path.open("rb") as f:
+                    f.seek(start)
+                    self.wfile.write(f.read(end - start + 1))
+                nbytes = end - start + 1
+            counters.add(requests=1, nbytes=nbytes)
+
+    return http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+
+def aois(size: int, loads: int) -> list[dict]:
+    """GeoJSON geometries of `loads` side by side AOIs of 1/4 of a `size` px COG."""
+    x0, y1 = ORIGIN
+    side = size // 4
+    return [
+        mapping(
+            box(
+                *lonlat_bbox(
+                    x0 + i % 4 * side + 10,
+                    y1 - (i // 4 + 1) * side + 10,
+                    x0 + (i % 4 + 1) * side - 10,
+                    y1 - i // 4 * side - 10,
+                ),
+            ),
+        )
+        for i in range(loads)
+    ]
+
+
+def run(mode: str, href: str, size: int, loads: int) -> float:
+    """Load `loads` AOIs of the COG at `href` in `mode`, return the elapsed time."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from geojson_pydantic import Feature
+    from odc.stac import stac_load
+
+    from geo_assistant.tools import naip
+
+    items = [naip_item(href, size)]
+    start = time.perf_counter()
+    for geometry in aois(size, loads):
+        geometry = Feature(type="Feature", geometry=geometry, properties={}).geometry
+        if mode == "runtime":
+            naip._load_naip_cube(items, geometry)
+        else:
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                stac_load(
+                    items,
+                    bands=naip.RGB_BANDS,
+                    geopolygon=geometry,
+                    resolution=1.0,
+                    groupby="solar_day",
+                    pool=executor,
+                    crs=items[0].properties["proj:code"],
+                )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Print the time and HTTP traffic of the loads per mode."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--loads", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["default", "runtime"])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--connect-latency", type=float, default=0.05)
+    parser.add_argument("--run", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        mode, href, size, loads = args.run
+        print(run(mode, href, int(size), int(loads)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_naip_cog(root / f"naip_{args.size}.tif", args.size)
+        counters = Counters()
+        server = cog_server(root, args.latency, args.connect_latency, counters)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        href = f"http://127.0.0.1:{server.server_port}/naip_{args.size}.tif"
+
+        print(
+            f"{args.loads} loads of {args.size // 4}^2 px, "
+            f"{args.latency * 1000:.0f} ms per request, "
+            f"{args.connect_latency * 1000:.0f} ms per connection",
+        )
+        print(f"{'mode':>8} {'time':>9} {'requests':>9} {'connections':>12} {'MiB':>7}")
+        for mode in args.modes:
+            counters.reset()
+            proc = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--run",
+                    mode,
+                    href,
+                    str(args.size),
+                    str(args.loads),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            elapsed = float(proc.stdout.split()[-1])
+            print(
+                f"{mode:>8} {elapsed:>8.2f}s {counters.requests:>9} "
+                f"{counters.connections:>12} {counters.bytes / 2**20:>7.1f}",
+            )
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
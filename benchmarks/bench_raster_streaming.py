@@ -0,0 +1,90 @@
+"""
+Benchmark peak RSS and time of NAIP processing in memory and streaming mode.
+
+Each run loads an RGB cube from a synthetic local COG and encodes it, in a
+fresh subprocess so that its peak resident set size can be measured:
+
+- memory: the cube is loaded eagerly as float32 and stretched in memory
+  (the size cap of `fetch_naip_img` is bypassed).
+- streaming: the cube stays dask-chunked and is written to the cube cache
+  chunk by chunk, then a preview is encoded.
+
+The `baseline` row is the peak RSS of a subprocess that only imports the tool.
+
+Run with `uv run python benchmarks/bench_raster_streaming.py [--sizes 2048 4096 8192]`.
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from naip_cog import aoi, make_naip_cog, naip_item
+
+
+def run(mode: str, size: int, workdir: Path) -> float:
+    """Process a `size` px synthetic COG in `mode` and return the elapsed time."""
+    from geojson_pydantic import Feature
+
+    from geo_assistant.raster import streaming
+    from geo_assistant.tools import naip
+
+    if mode == "baseline":
+        return 0.0
+
+    start = time.perf_counter()
+    streaming.CACHE_DIR = workdir / "cache" / str(size)
+    items = [naip_item(str(workdir / f"naip_{size}.tif"), size)]
+    geometry = Feature(type="Feature", geometry=aoi(size), properties={}).geometry
+    ds = naip._load_naip_cube(items, geometry, mode == "streaming")
+    if mode == "streaming":
+        naip._encode_rgb_streaming(ds, [items[0].id])
+    else:
+        naip._encode_rgb(ds)
+    return time.perf_counter() - start
+
+
+def measure(mode: str, size: int, workdir: Path) -> tuple[float, float]:
+    """Return the processing time in seconds and peak RSS in MiB of a subprocess run."""
+    proc = subprocess.run(
+        [sys.executable, __file__, "--run", mode, str(size), str(workdir)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, peak = proc.stdout.split()
+    return float(elapsed), float(peak)
+
+
+def main() -> None:
+    """Print peak RSS and time per COG size and processing mode."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096, 8192])
+    parser.add_argument("--modes", nargs="+", default=["memory", "streaming"])
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        mode, size, workdir = args.run
+        elapsed = run(mode, int(size), Path(workdir))
+        # ru_maxrss is in KiB on Linux.
+        print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        _, baseline = measure("baseline", 0, workdir)
+        print(f"{'pixels':>8} {'mode':>10} {'time':>9} {'peak RSS MiB':>13}")
+        print(f"{'-':>8} {'baseline':>10} {'-':>9} {baseline:>13.0f}")
+        for size in args.sizes:
+            make_naip_cog(workdir / f"naip_{size}.tif", size)
+            for mode in args.modes:
+                elapsed, peak = measure(mode, size, workdir)
+                print(f"{size:>6}^2 {mode:>10} {elapsed:>8.2f}s {peak:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
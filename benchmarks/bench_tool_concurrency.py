@@ -0,0 +1,124 @@
+"""
+Benchmark agent turn latency for prompts that make several tool calls.
+
+The model is scripted and the tools simulate their I/O latency, so the numbers
+only reflect how the graph schedules tool calls within a turn:
+
+- blocking: tools block the event loop, like the tools did before they moved
+  their I/O into worker threads.
+- serialized: tools run one at a time (`max_concurrency=1`).
+- concurrent: independent tools run concurrently.
+
+Run with `uv run python benchmarks/bench_tool_concurrency.py`.
+"""
+
+import asyncio
+import statistics
+import time
+from typing import Annotated
+
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.types import Command
+
+from geo_assistant.agent.scheduler import ToolCallSchedulerMiddleware
+from geo_assistant.agent.state import GeoAssistantState
+
+# Simulated latency of each tool in seconds.
+TOOL_LATENCY = {
+    "get_place": 0.3,
+    "get_search_area": 0.05,
+    "get_places_within_buffer": 0.4,
+    "fetch_naip_img": 0.8,
+    "summarize_sat_img": 1.0,
+}
+
+PROMPTS = {
+    "places + naip": ["get_places_within_buffer", "fetch_naip_img"],
+    "place + area + places + naip": [
+        "get_place",
+        "get_search_area",
+        "get_places_within_buffer",
+        "fetch_naip_img",
+    ],
+    "all tools": list(TOOL_LATENCY),
+}
+
+REPEATS = 3
+
+
+class ScriptedChatModel(FakeMessagesListChatModel):
+    """Fake chat model that replays AI messages and accepts tool binding."""
+
+    def bind_tools(self, tools, **kwargs):
+        """Ignore the tools, the responses are scripted."""
+        return self
+
+
+def make_tool(name: str, blocking: bool):
+    """Create a tool named `name` that sleeps for its simulated latency."""
+
+    async def _run(tool_call_id: Annotated[str, InjectedToolCallId]) -> Command:
+        if blocking:
+            time.sleep(TOOL_LATENCY[name])
+        else:
+            await asyncio.to_thread(time.sleep, TOOL_LATENCY[name])
+        return Command(
+            update={"messages": [ToolMessage(content=name, tool_call_id=tool_call_id)]},
+        )
+
+    _run.__doc__ = f"Simulated {name}."
+    return tool(name)(_run)
+
+
+async def turn_latency(
+    tool_names: list[str],
+    blocking: bool,
+    max_concurrency: int | None,
+) -> float:
+    """Run one agent turn that calls `tool_names` and return its latency."""
+    responses = [
+        AIMessage(
+            content="",
+            tool_calls=[
+                {"name": name, "args": {}, "id": str(i), "type": "tool_call"}
+                for i, name in enumerate(tool_names)
+            ],
+        ),
+        AIMessage(content="done"),
+    ]
+    agent = create_agent(
+        model=ScriptedChatModel(responses=responses),
+        tools=[make_tool(name, blocking) for name in tool_names],
+        state_schema=GeoAssistantState,
+        middleware=[ToolCallSchedulerMiddleware(max_concurrency=max_concurrency)],
+    )
+    start = time.perf_counter()
+    await agent.ainvoke({"messages": [HumanMessage(content="benchmark")]})
+    return time.perf_counter() - start
+
+
+async def main() -> None:
+    """Print the median turn latency per prompt and scheduling mode."""
+    modes = {
+        "blocking": (True, None),
+        "serialized": (False, 1),
+        "concurrent": (False, None),
+    }
+    print(f"{'prompt':<32}" + "".join(f"{mode:>14}" for mode in modes))
+    for prompt, tool_names in PROMPTS.items():
+        row = f"{prompt:<32}"
+        for blocking, max_concurrency in modes.values():
+            latencies = [
+                await turn_latency(tool_names, blocking, max_concurrency)
+                for _ in range(REPEATS)
+            ]
+            row += f"{statistics.median(latencies):>13.2f}s"
+        print(row)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
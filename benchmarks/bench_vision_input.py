@@ -0,0 +1,99 @@
+"""
+Benchmark the images sent to the vision model, as-is and at its input size.
+
+For NAIP-like images of increasing size, compares:
+
+- as-is: the JPEG data URL uploaded unchanged, as `summarize_sat_img` did
+  before the images were fitted to the model.
+- fitted: the data URL shrunk to the input size of the model by `image_url`,
+  from the JPEG (decoded at a reduced DCT scale) and from the raw raster
+  (resized and encoded once).
+
+Reports the preprocessing time, the upload size and an estimate of the vision
+tokens, one per 16x16 pixel patch. With `--summarize`, each image is also
+summarized by the configured Ollama image model and the latency is reported.
+
+Run with `uv run python benchmarks/bench_vision_input.py [--sizes 512 1024 2048 4096]`.
+"""
+
+import argparse
+import base64
+import time
+
+import numpy as np
+
+from geo_assistant.raster.encode import encode_image, image_size
+from geo_assistant.tools.summarize import (
+    IMAGE_MODEL_NAME,
+    SUMMARY_IMAGE_QUALITY,
+    image_url,
+    model_input_size,
+)
+
+_PATCH = 16
+
+
+def naip_like(size: int) -> np.ndarray:
+    """Smooth-ish synthetic RGB imagery, so the encoder sees realistic redundancy."""
+    rng = np.random.default_rng(0)
+    base = rng.normal(110, 35, size=(size // 8, size // 8, 3)).clip(0, 255)
+    return np.repeat(np.repeat(base, 8, axis=0), 8, axis=1).astype("uint8")
+
+
+def vision_tokens(url: str) -> int:
+    """Estimated vision tokens of a data URL, one per 16x16 pixel patch."""
+    width, height = image_size(url.partition(";base64,")[2])
+    return -(-width // _PATCH) * -(-height // _PATCH)
+
+
+def main() -> None:
+    """Print the preprocessing time, upload size and tokens per image size."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096])
+    parser.add_argument("--model", default=IMAGE_MODEL_NAME)
+    parser.add_argument("--summarize", action="store_true")
+    args = parser.parse_args()
+
+    max_size = model_input_size(args.model)
+    agent = None
+    if args.summarize:
+        from geo_assistant.tools.summarize import SatImgSummaryAgent
+
+        agent = SatImgSummaryAgent(model=args.model)
+    print(f"{args.model}: input size {max_size} px")
+    header = f"{'pixels':>8} {'mode':>12} {'prep':>8} {'KiB':>8} {'tokens':>7}"
+    print(header + (f" {'summary':>9}" if agent else ""))
+    for size in args.sizes:
+        rgb = naip_like(size)
+        jpeg = base64.b64encode(encode_image(rgb, "jpeg")).decode("utf-8")
+        as_is = f"data:image/jpeg;base64,{jpeg}"
+        modes = [
+            ("as-is", lambda as_is=as_is: as_is),
+            (
+                "fitted",
+                lambda as_is=as_is: image_url(as_is, max_size, SUMMARY_IMAGE_QUALITY),
+            ),
+            (
+                "fitted raw",
+                lambda rgb=rgb: image_url(rgb, max_size, SUMMARY_IMAGE_QUALITY),
+            ),
+        ]
+        for name, prepare in modes:
+            start = time.perf_counter()
+            url = prepare()
+            elapsed = time.perf_counter() - start
+            line = (
+                f"{size:>6}^2 {name:>12} {elapsed * 1000:>6.1f}ms "
+                f"{len(url) / 2**10:>8.1f} {vision_tokens(url):>7}"
+            )
+            if agent is not None:
+                # Pass the prepared URL to the model unchanged, as in 'as-is'.
+                agent.image_size = max(size, max_size)
+                start = time.perf_counter()
+                agent(url)
+                line += f" {time.perf_counter() - start:>8.2f}s"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
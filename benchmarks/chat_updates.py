@@ -0,0 +1,135 @@
+"""Synthetic agent graph updates of a chat turn, for stream benchmarks."""
+
+import base64
+
+import numpy as np
+from geojson_pydantic import Feature, FeatureCollection
+from langchain_core.messages import AIMessage, ToolMessage
+
+from geo_assistant.raster.encode import encode_image
+
+CENTER = (-71.0589, 42.3601)
+
+
+def _call(name: str, call_id: str, **args) -> dict:
+    return {"name": name, "args": args, "id": call_id, "type": "tool_call"}
+
+
+def _naip_image(size: int) -> str:
+    """Base64 JPEG of smooth noise, like a stretched NAIP RGB image."""
+    rng = np.random.default_rng(0)
+    base = rng.normal(110, 35, size=(size // 8, size // 8, 3)).clip(0, 255)
+    rgb = np.repeat(np.repeat(base, 8, axis=0), 8, axis=1).astype("uint8")
+    return base64.b64encode(encode_image(rgb, format="jpeg")).decode()
+
+
+def _search_area(vertices: int) -> Feature:
+    angles = np.linspace(0, 2 * np.pi, vertices)
+    ring = [
+        [
+            round(CENTER[0] + 0.01 * np.cos(a), 6),
+            round(CENTER[1] + 0.007 * np.sin(a), 6),
+        ]
+        for a in angles
+    ]
+    ring[-1] = ring[0]
+    return Feature(
+        type="Feature",
+        geometry={"type": "Polygon", "coordinates": [ring]},
+        properties={"name": "The Whitney Hotel Boston"},
+    )
+
+
+def _places(count: int) -> FeatureCollection:
+    rng = np.random.default_rng(1)
+    return FeatureCollection(
+        type="FeatureCollection",
+        features=[
+            Feature(
+                type="Feature",
+                geometry={
+                    "type": "Point",
+                    "coordinates": [
+                        round(CENTER[0] + rng.uniform(-0.01, 0.01), 6),
+                        round(CENTER[1] + rng.uniform(-0.007, 0.007), 6),
+                    ],
+                },
+                properties={
+                    "id": f"08f2a306{i:08x}ffff",
+                    "name": f"Cafe number {i}",
+                    "websites": [f"https://cafe{i}.example.com"],
+                    "socials": [f"https://www.facebook.com/{100000 + i}"],
+                    "categories": {
+                        "primary": "cafe",
+                        "alternate": ["coffee_shop", "bakery"],
+                    },
+                },
+            )
+            for i in range(count)
+        ],
+    )
+
+
+def chat_turn_updates(
+    places: int = 200,
+    vertices: int = 65,
+    image_size: int = 512,
+) -> list[tuple[str, dict]]:
+    """
+    Updates streamed by the graph for a turn calling every tool.
+
+    Args:
+        places: Number of places found within the search area.
+        vertices: Number of vertices of the search area.
+        image_size: Width and height of the NAIP image.
+
+    Returns:
+        (node, update) pairs as streamed with `stream_mode="updates"`.
+    """
+    place = Feature(
+        type="Feature",
+        geometry={"type": "Point", "coordinates": list(CENTER)},
+        properties={"name": "The Whitney Hotel Boston", "socials": None},
+    )
+    search_area = _search_area(vertices)
+    steps = [
+        ("get_place", {"place": place}, {"place_name": "The Whitney Hotel Boston"}),
+        ("get_search_area", {"search_area": search_area}, {"buffer_size_km": 1}),
+        (
+            "get_places_within_buffer",
+            {"places_within_buffer": _places(places)},
+            {"place": "cafe"},
+        ),
+        (
+            "fetch_naip_img",
+            {"naip_img_bytes": _naip_image(image_size), "naip_cube": "0" * 40},
+            {"start_date": "2021-01-01", "end_date": "2021-12-31"},
+        ),
+    ]
+    updates = []
+    for i, (name, update, args) in enumerate(steps):
+        call_id = f"call-{i}"
+        updates.append(
+            (
+                "model",
+                {
+                    "messages": [
+                        AIMessage("", tool_calls=[_call(name, call_id, **args)]),
+                    ],
+                },
+            ),
+        )
+        updates.append(
+            (
+                "tools",
+                update
+                | {"messages": [ToolMessage(f"{name} done.", tool_call_id=call_id)]},
+            ),
+        )
+    updates.append(
+        (
+            "model",
+            {"messages": [AIMessage("Here are the cafes around the hotel. " * 10)]},
+        ),
+    )
+    return updates
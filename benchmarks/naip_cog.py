@@ -0,0 +1,83 @@
+"""Synthetic NAIP-like COGs and STAC items for benchmarks."""
+
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pystac
+import rasterio
+import rasterio.shutil
+from pyproj import Transformer
+from pystac.extensions.eo import Band, EOExtension
+from pystac.extensions.raster import RasterBand
+from rasterio.transform import from_origin
+from shapely.geometry import box, mapping
+
+CRS = "EPSG:26918"
+ORIGIN = (325_000, 4_310_000)
+
+
+def make_naip_cog(path: Path, size: int, block_rows: int = 1024) -> None:
+    """Write a `size`x`size` px, 1 m, 4 band uint8 COG of smooth noise."""
+    if path.exists():
+        return
+    rng = np.random.default_rng(0)
+    x0, y1 = ORIGIN
+    tmp_path = path.with_suffix(".tmp.tif")
+    with rasterio.open(
+        tmp_path,
+        "w",
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=4,
+        dtype="uint8",
+        crs=CRS,
+        transform=from_origin(x0, y1, 1.0, 1.0),
+        tiled=True,
+        blockxsize=512,
+        blockysize=512,
+    ) as dst:
+        for row in range(0, size, block_rows):
+            rows = min(block_rows, size - row)
+            base = rng.normal(110, 35, (4, rows // 8 + 1, size // 8 + 1)).clip(0, 255)
+            block = np.repeat(np.repeat(base, 8, axis=1), 8, axis=2)[:, :rows, :size]
+            dst.write(block.astype("uint8"), window=((row, row + rows), (0, size)))
+    rasterio.shutil.copy(tmp_path, path, driver="COG")
+    tmp_path.unlink()
+
+
+def lonlat_bbox(x0: float, y0: float, x1: float, y1: float) -> tuple:
+    """Longitude/latitude bounds of a box in the COG CRS."""
+    to_lonlat = Transformer.from_crs(CRS, "EPSG:4326", always_xy=True)
+    corners = [to_lonlat.transform(x, y) for x in (x0, x1) for y in (y0, y1)]
+    lons, lats = zip(*corners, strict=True)
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def naip_item(href: str, size: int) -> pystac.Item:
+    """STAC item for a synthetic COG, shaped like `_search_naip_items` output."""
+    x0, y1 = ORIGIN
+    bbox = lonlat_bbox(x0, y1 - size, x0 + size, y1)
+    item = pystac.Item(
+        id=f"naip_{size}",
+        geometry=mapping(box(*bbox)),
+        bbox=list(bbox),
+        datetime=datetime.datetime(2021, 6, 1, tzinfo=datetime.UTC),
+        properties={"proj:code": CRS},
+    )
+    item.add_asset("image", pystac.Asset(href=href, media_type=pystac.MediaType.COG))
+    EOExtension.ext(item.assets["image"], add_if_missing=True).bands = [
+        Band.create(name=name, common_name=name)
+        for name in ("red", "green", "blue", "nir")
+    ]
+    item.assets["image"].ext.add("raster")
+    item.assets["image"].ext.raster.bands = [RasterBand.create() for _ in range(4)]
+    return item
+
+
+def aoi(size: int) -> dict:
+    """GeoJSON geometry covering the inner part of a `size` px synthetic COG."""
+    x0, y1 = ORIGIN
+    margin = size * 0.01
+    return mapping(box(*lonlat_bbox(x0 + margin, y1 - size, x0 + size, y1 - margin)))
@@ -0,0 +1,233 @@
+"""Disk-backed cache of the agent model's responses."""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from dotenv import load_dotenv
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: 'disk' caches the agent model's responses, 'off' disables the cache.
+LLM_CACHE = os.environ.get("LLM_CACHE", "off")
+LLM_CACHE_DIR = Path(os.environ.get("LLM_CACHE_DIR", "data/llm_cache"))
+# Size of the cached responses beyond which the least recently used are evicted.
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", "256"))
+
+# Set to skip cache lookups for the current request, fresh responses are still
+# stored so that the cache is refreshed.
+LLM_CACHE_BYPASS: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "LLM_CACHE_BYPASS",
+    default=False,
+)
+
+# Message fields that differ between identical conversations.
+_VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize serialized messages so that identical conversations match.
+
+    Message ids and metadata are dropped, and tool call ids, random for every
+    model call, are replaced by their order of appearance.
+
+    Args:
+        prompt: Messages serialized by `langchain_core.load.dumps`.
+
+    Returns:
+        Canonical JSON of the messages.
+    """
+    messages = json.loads(prompt)
+    call_ids: dict[str, str] = {}
+
+    def call_id(value: str | None) -> str | None:
+        if value is None:
+            return None
+        return call_ids.setdefault(value, str(len(call_ids)))
+
+    for message in messages:
+        kwargs = message.get("kwargs", {})
+        for field in _VOLATILE_FIELDS:
+            kwargs.pop(field, None)
+        for call in kwargs.get("tool_calls", []):
+            call["id"] = call_id(call.get("id"))
+        if "tool_call_id" in kwargs:
+            kwargs["tool_call_id"] = call_id(kwargs["tool_call_id"])
+    return json.dumps(messages, sort_keys=True)
+
+
+class DiskLLMCache(BaseCache):
+    """
+    LLM response cache in a SQLite database, bounded in size.
+
+    Responses are keyed by model name, normalized messages and a hash of the
+    invocation parameters, which include the schemas of the bound tools. Least
+    recently used responses are evicted beyond `max_bytes`. The database can be
+    shared by the worker processes of a host.
+    """
+
+    def __init__(self, path: Path, model: str, max_bytes: int):
+        """
+        Open or create the cache.
+
+        Args:
+            path: SQLite database file.
+            model: Name of the cached model.
+            max_bytes: Size of the cached responses beyond which the least
+                recently used ones are evicted.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.max_bytes = max_bytes
+        self.counts: Counter[str] = Counter()
+        # Lookups and updates run in executor threads.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """,
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)",
+        )
+
+    def key(self, prompt: str, llm_string: str) -> str:
+        """Cache key of a model call."""
+        params = hashlib.sha256(llm_string.encode()).hexdigest()
+        return hashlib.sha256(
+            f"{self.model}\n{params}\n{normalize_prompt(prompt)}".encode(),
+        ).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        """Cached generations of a model call, None on a miss or bypass."""
+        if LLM_CACHE_BYPASS.get():
+            self.counts["bypasses"] += 1
+            return None
+        key = self.key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        if row is None:
+            self.counts["misses"] += 1
+            return None
+        self.counts["hits"] += 1
+        return [_fresh_ids(generation) for generation in loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Store the generations of a model call, then evict beyond the size limit."""
+        value = dumps([_without_ids(generation) for generation in return_val])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (self.key(prompt, llm_string), value, len(value), time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses",
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed",
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.counts["evictions"] += len(evicted)
+        logger.info("Evicted %d cached LLM responses", len(evicted))
+
+    def clear(self, **kwargs: Any) -> None:
+        """Remove every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """Hit, miss, bypass and eviction counts, and the size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses",
+            ).fetchone()
+        return {
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            "bypasses": self.counts["bypasses"],
+            "evictions": self.counts["evictions"],
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _without_ids(generation: Any) -> Any:
+    """Drop the message id, a fresh one is assigned to every cache hit."""
+    message = getattr(generation, "message", None)
+    if isinstance(message, AIMessage) and message.id is not None:
+        return generation.model_copy(
+            update={"message": message.model_copy(update={"id": None})},
+        )
+    return generation
+
+
+def _fresh_ids(generation: Any) -> Any:
+    """Give new ids to cached tool calls, which may be replayed in one thread."""
+    message = getattr(generation, "message", None)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        tool_calls = [
+            call | {"id": f"call_{uuid.uuid4().hex}"} for call in message.tool_calls
+        ]
+        return generation.model_copy(
+            update={"message": message.model_copy(update={"tool_calls": tool_calls})},
+        )
+    return generation
+
+
+def create_llm_cache(model: str) -> DiskLLMCache | None:
+    """The response cache of `model` set up by LLM_CACHE, None if disabled."""
+    if LLM_CACHE == "off":
+        return None
+    if LLM_CACHE == "disk":
+        return DiskLLMCache(
+            LLM_CACHE_DIR / "responses.sqlite",
+            model=model,
+            max_bytes=int(LLM_CACHE_MAX_MB * 2**20),
+        )
+    raise ValueError(f"Unsupported LLM cache {LLM_CACHE!r}")
@@ -0,0 +1,142 @@
+"""Time limits of tool calls, and cancellation of the blocking work they run."""
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from dotenv import load_dotenv
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds a tool call may run before it is cancelled (0 disables the limit),
+# and per-tool overrides as a JSON object, e.g. {"fetch_naip_img": 900}.
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "300"))
+TOOL_TIMEOUTS: dict[str, float] = json.loads(os.environ.get("TOOL_TIMEOUTS", "{}"))
+# Seconds to wait for the worker thread of a cancelled call to stop.
+CANCEL_GRACE_SECONDS = float(os.environ.get("TOOL_CANCEL_GRACE", "5"))
+
+# Seconds between interrupts of a cancelled worker thread.
+_INTERRUPT_INTERVAL = 0.05
+
+
+class ToolTimeoutError(TimeoutError):
+    """A tool call did not finish within its time limit."""
+
+
+def tool_timeout(name: str) -> float | None:
+    """Time limit in seconds of the calls of tool `name`, None if unlimited."""
+    timeout = float(TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT))
+    return timeout if timeout > 0 else None
+
+
+async def with_time_limit[T](name: str, call: Awaitable[T]) -> T:
+    """
+    Await a call of tool `name`, cancelling it beyond the tool's time limit.
+
+    Args:
+        name: Name of the tool.
+        call: The tool call.
+
+    Returns:
+        The result of the call.
+
+    Raises:
+        ToolTimeoutError: If the call was cancelled at its time limit.
+    """
+    timeout = tool_timeout(name)
+    try:
+        async with asyncio.timeout(timeout) as deadline:
+            return await call
+    except TimeoutError as e:
+        # Timeouts raised by the tool itself are not ours to rename.
+        if not deadline.expired():
+            raise
+        raise ToolTimeoutError(
+            f"Tool {name} was cancelled after {timeout:g} s, it did not finish in time.",
+        ) from e
+
+
+async def to_thread_cancellable[T](
+    func: Callable[..., T],
+    /,
+    *args: Any,
+    interrupt: Callable[[], None],
+) -> T:
+    """
+    Run a blocking function in a worker thread, interrupting it on cancellation.
+
+    `asyncio.to_thread` leaves the thread running when the awaiting task is
+    cancelled, so a DuckDB scan or a raster read goes on after the client has
+    gone. Here `interrupt` is called instead, and called again until the
+    thread returns, as it may race with the start of the blocking work. The
+    cancellation only propagates once the thread has stopped, or after
+    CANCEL_GRACE_SECONDS.
+
+    Args:
+        func: The blocking function.
+        *args: Its arguments.
+        interrupt: Thread-safe callable making `func` return early, e.g.
+            interrupting a DuckDB connection. It may be called several times.
+
+    Returns:
+        The result of `func`.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(None, functools.partial(context.run, func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # The interrupted function raises, nobody is waiting for its result.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        deadline = loop.time() + CANCEL_GRACE_SECONDS
+        while not future.done() and loop.time() < deadline:
+            interrupt()
+            await asyncio.wait({future}, timeout=_INTERRUPT_INTERVAL)
+        if not future.done():
+            logger.warning(
+                "%s still running %g s after its cancellation.",
+                getattr(func, "__name__", func),
+                CANCEL_GRACE_SECONDS,
+            )
+        raise
+
+
+class ToolTimeLimitMiddleware(AgentMiddleware):
+    """
+    Cancel tool calls running longer than their time limit.
+
+    The cancelled call is answered by an error message, so that the agent can
+    tell the user instead of failing the run. Placed after the tool call
+    scheduler, the time spent waiting for other calls of the turn is not
+    counted.
+    """
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]],
+    ) -> ToolMessage | Command:
+        """Run a tool call within its time limit."""
+        name = request.tool_call["name"]
+        try:
+            return await with_time_limit(name, handler(request))
+        except ToolTimeoutError as e:
+            logger.warning("Tool call %s: %s", request.tool_call["id"], e)
+            return ToolMessage(
+                content=str(e),
+                name=name,
+                tool_call_id=request.tool_call["id"],
+                status="error",
+            )
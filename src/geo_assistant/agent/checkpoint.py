@@ -0,0 +1,158 @@
+"""Checkpoint stores for the agent graph."""
+
+import hashlib
+import os
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Literal
+
+import aiosqlite
+from dotenv import load_dotenv
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+load_dotenv()
+
+StateStore = Literal["memory", "sqlite"]
+
+# 'memory' keeps conversations in the process, 'sqlite' in a SQLite database
+# shared by every worker on the host, so any worker can serve any thread.
+STATE_STORE: StateStore = os.environ.get("STATE_STORE", "memory")  # type: ignore[assignment]
+STATE_DIR = Path(os.environ.get("STATE_DIR", "data/state"))
+# Seconds a write waits for another worker holding the SQLite write lock.
+SQLITE_BUSY_TIMEOUT = 30.0
+# State fields of at least this many bytes, e.g. the base64 NAIP image, are
+# stored in blob files next to the SQLite database rather than in checkpoints.
+STATE_BLOB_MIN_BYTES = int(os.environ.get("STATE_BLOB_MIN_BYTES", 2**16))
+
+# Serialized type of a value stored in a blob file.
+_BLOB_TYPE = "blob"
+
+
+class BlobSerializer(SerializerProtocol):
+    """
+    Checkpoint serializer storing large string and bytes fields in blob files.
+
+    Every checkpoint holds the whole state of its thread, so an image fetched
+    once would be stored again at each later step. Large values are written
+    once to a file named by their SHA-256 digest, that checkpoints and pending
+    writes refer to.
+    """
+
+    def __init__(
+        self,
+        blob_dir: Path,
+        serde: SerializerProtocol | None = None,
+        min_bytes: int = STATE_BLOB_MIN_BYTES,
+    ) -> None:
+        """
+        Initialize the serializer.
+
+        Args:
+            blob_dir: Directory of the blob files, shared by the workers.
+            serde: Serializer of the other values, JsonPlusSerializer by default.
+            min_bytes: Size from which values are stored in blob files.
+        """
+        blob_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_dir = blob_dir
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+
+    def _is_blob(self, value: Any) -> bool:
+        return isinstance(value, str | bytes) and len(value) >= self.min_bytes
+
+    def _put(self, value: str | bytes) -> tuple[str, str]:
+        """Write a value to its blob file, returns its kind and digest."""
+        kind = "str" if isinstance(value, str) else "bytes"
+        data = value.encode() if isinstance(value, str) else value
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_dir / digest
+        if not path.exists():
+            # Renamed once complete, so that other workers never read a partial
+            # blob.
+            tmp_path = path.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        return kind, digest
+
+    def _get(self, kind: str, digest: str) -> str | bytes:
+        data = (self.blob_dir / digest).read_bytes()
+        return data.decode() if kind == "str" else data
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        """Serialize a checkpoint or a pending write."""
+        if self._is_blob(obj):
+            kind, digest = self._put(obj)
+            return f"{_BLOB_TYPE}:{kind}", digest.encode()
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            values = obj["channel_values"]
+            blobs = {
+                key: self._put(value)
+                for key, value in values.items()
+                if self._is_blob(value)
+            }
+            if blobs:
+                values = {k: v for k, v in values.items() if k not in blobs}
+                obj = {**obj, "channel_values": values, "channel_blobs": blobs}
+        return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        """Deserialize a checkpoint or a pending write."""
+        type_, payload = data
+        if type_.startswith(f"{_BLOB_TYPE}:"):
+            return self._get(type_.partition(":")[2], payload.decode())
+        obj = self.serde.loads_typed(data)
+        if isinstance(obj, dict) and "channel_blobs" in obj:
+            blobs = obj.pop("channel_blobs")
+            obj["channel_values"] = {
+                **obj["channel_values"],
+                **{
+                    key: self._get(kind, digest)
+                    for key, (kind, digest) in blobs.items()
+                },
+            }
+        return obj
+
+
+def is_shared(store: StateStore = STATE_STORE) -> bool:
+    """Whether conversations are shared between worker processes."""
+    return store != "memory"
+
+
+@asynccontextmanager
+async def open_checkpointer(
+    store: StateStore = STATE_STORE,
+    state_dir: Path = STATE_DIR,
+) -> AsyncIterator[BaseCheckpointSaver]:
+    """
+    Open the checkpointer holding the agent's conversations.
+
+    Args:
+        store: 'memory' or 'sqlite'.
+        state_dir: Directory of the SQLite database.
+
+    Yields:
+        The checkpointer, closed on exit.
+    """
+    if store == "memory":
+        yield InMemorySaver()
+    elif store == "sqlite":
+        state_dir.mkdir(parents=True, exist_ok=True)
+        async with aiosqlite.connect(
+            state_dir / "checkpoints.sqlite",
+            timeout=SQLITE_BUSY_TIMEOUT,
+        ) as conn:
+            checkpointer = AsyncSqliteSaver(
+                conn,
+                serde=BlobSerializer(state_dir / "blobs"),
+            )
+            # Creates the tables in WAL mode, readers don't block the writer.
+            await checkpointer.setup()
+            yield checkpointer
+    else:
+        raise ValueError(f"Unsupported state store {store!r}")
@@ -3,11 +3,18 @@
 import datetime
 
 from langchain.agents import create_agent
+from langchain_core.language_models import BaseChatModel
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 
+from geo_assistant.agent.cancellation import ToolTimeLimitMiddleware
+from geo_assistant.agent.history import HistoryCompactionMiddleware
 from geo_assistant.agent.llms import llm
+from geo_assistant.agent.memory import ToolMemoryMiddleware
+from geo_assistant.agent.scheduler import ToolCallSchedulerMiddleware
 from geo_assistant.agent.state import GeoAssistantState
 from geo_assistant.tools import (
+    export_places_within_buffer,
     fetch_naip_img,
     get_place,
     get_places_within_buffer,
@@ -23,31 +30,53 @@ You have the following tools available to you.
 - get_place: Get a place from the Overture Maps database
 - get_search_area: Get a search area buffer in km around the place defined in the agent state
 - get_places_within_buffer: Get places from the Overture Maps database within the search area defined in the agent state
+- export_places_within_buffer: Count all the places of a type within the search area and make them available for download, when the user wants all of them or a file
 - summarize_sat_img: Summarize the contents of a satellite image using an LLM
-- fetch_naip_img: A NAIP imagery fetch tool. Use this to fetch NAIP aerial imagery for a given area of interest returned by the overture location lookup tool and date range (do your best to extract the date range from the user's query if provided, otherwise ask the user to specify a date range)
+- fetch_naip_img: A NAIP imagery fetch tool. Use this to fetch NAIP aerial imagery for a given area of interest returned by the overture location lookup tool and date range (do your best to extract the date range from the user's query if provided, otherwise ask the user to specify a date range). For change detection or cloud/gap-free imagery across several NAIP years, pass a multi-year date range with composite='change', 'latest' or 'median'
 
 Do not use background knowledge, only use the tools above to answer questions.
 
-The current date and time is {now}.
+The current date is {today}.
 """
 
 
-async def create_graph():
-    """Create langchain agent graph with a list of tools."""
-    checkpointer = InMemorySaver()
+async def create_graph(
+    model: BaseChatModel = llm,
+    checkpointer: BaseCheckpointSaver | None = None,
+):
+    """
+    Create langchain agent graph with a list of tools.
+
+    Args:
+        model: Chat model of the agent.
+        checkpointer: Store of the conversations, in memory by default.
+    """
+    if checkpointer is None:
+        checkpointer = InMemorySaver()
     graph = create_agent(
-        model=llm,
+        model=model,
         tools=[
             get_place,
             get_search_area,
             get_places_within_buffer,
+            export_places_within_buffer,
             fetch_naip_img,
             summarize_sat_img,
         ],
         system_prompt=SYSTEM_PROMPT.format(
-            now=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            # The date only, so that the prompt, and cached responses, stay the
+            # same over the day.
+            today=datetime.date.today().isoformat(),
         ),
         state_schema=GeoAssistantState,
+        # The time limits apply once the scheduler has started a tool call,
+        # the memory of sampled calls is traced around the tool only.
+        middleware=[
+            ToolCallSchedulerMiddleware(),
+            ToolTimeLimitMiddleware(),
+            ToolMemoryMiddleware(),
+            HistoryCompactionMiddleware(),
+        ],
         checkpointer=checkpointer,
     )
     return graph
@@ -0,0 +1,269 @@
+"""Token-budgeted compaction of the message history sent to the agent model."""
+
+import logging
+import math
+import os
+import statistics
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import asdict, dataclass
+
+from dotenv import load_dotenv
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+
+from geo_assistant.agent.scheduler import TOOL_STATE_ACCESS, ToolStateAccess
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Approximate number of tokens of history sent to the model on each step.
+HISTORY_TOKEN_BUDGET = int(os.environ.get("AGENT_HISTORY_TOKEN_BUDGET", "8000"))
+# Tool outputs of previous turns larger than this are replaced by a reference.
+TOOL_OUTPUT_TOKEN_LIMIT = int(os.environ.get("AGENT_TOOL_OUTPUT_TOKEN_LIMIT", "256"))
+
+# Characters of a compacted tool output kept as a preview.
+_PREVIEW_CHARS = 200
+# Number of recent model steps the step statistics are computed on.
+_STEP_WINDOW = 1000
+
+
+def _turns(messages: Sequence[AnyMessage]) -> list[list[AnyMessage]]:
+    """Split messages into turns, each starting at a human message."""
+    turns: list[list[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def compact_tool_message(
+    message: ToolMessage,
+    tool_name: str | None,
+    token_limit: int = TOOL_OUTPUT_TOKEN_LIMIT,
+    access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+) -> ToolMessage:
+    """
+    Replace a large tool output by a short reference to where its result lives.
+
+    Args:
+        message: Tool output.
+        tool_name: Name of the tool that produced it.
+        token_limit: Outputs of up to this many tokens are kept as is.
+        access: Mapping of tool name to the state fields it writes.
+
+    Returns:
+        The message, or a copy with compacted content.
+    """
+    tokens = count_tokens_approximately([message])
+    if tokens <= token_limit:
+        return message
+
+    text = message.text
+    reference = f"[Compacted {tokens} token output of {tool_name or 'a tool'}"
+    fields = sorted(access[tool_name].writes) if tool_name in access else []
+    if fields:
+        reference += f", its result is kept in the state field(s) {', '.join(fields)}"
+    reference += f". Preview: {text[:_PREVIEW_CHARS]}...]"
+    return message.model_copy(update={"content": reference})
+
+
+def compact_history(
+    messages: Sequence[AnyMessage],
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+    tool_output_token_limit: int = TOOL_OUTPUT_TOKEN_LIMIT,
+    access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+) -> tuple[list[AnyMessage], int]:
+    """
+    Compact a message history to fit a token budget.
+
+    Large tool outputs of previous turns are replaced by references to the
+    state fields holding their results, then the oldest turns are dropped until
+    the history fits the budget. The latest turn is always kept whole, and
+    whole turns are dropped so that tool calls keep their outputs.
+
+    Args:
+        messages: Message history, oldest first.
+        token_budget: Approximate number of tokens to fit the history in.
+        tool_output_token_limit: Tool outputs of previous turns larger than
+            this are compacted.
+        access: Mapping of tool name to the state fields it writes.
+
+    Returns:
+        The compacted messages and the number of dropped turns.
+    """
+    tool_names = {
+        call["id"]: call["name"]
+        for message in messages
+        if isinstance(message, AIMessage)
+        for call in message.tool_calls
+    }
+    turns = _turns(messages)
+    for turn in turns[:-1]:
+        for i, message in enumerate(turn):
+            if isinstance(message, ToolMessage):
+                turn[i] = compact_tool_message(
+                    message,
+                    tool_names.get(message.tool_call_id),
+                    tool_output_token_limit,
+                    access,
+                )
+
+    tokens = [count_tokens_approximately(turn) for turn in turns]
+    dropped = 0
+    total = sum(tokens)
+    while dropped < len(turns) - 1 and total > token_budget:
+        total -= tokens[dropped]
+        dropped += 1
+    return [message for turn in turns[dropped:] for message in turn], dropped
+
+
+@dataclass(frozen=True)
+class ModelStep:
+    """Latency and token counts of a model call."""
+
+    latency: float
+    history_tokens: int
+    prompt_tokens: int
+    dropped_turns: int
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+
+
+class ModelStepStats:
+    """Statistics over the recent model steps of the process."""
+
+    def __init__(self, window: int = _STEP_WINDOW) -> None:
+        """Initialize empty statistics over the last `window` steps."""
+        self.count = 0
+        self.steps: deque[ModelStep] = deque(maxlen=window)
+
+    def record(self, step: ModelStep) -> None:
+        """Record a model step."""
+        self.count += 1
+        self.steps.append(step)
+
+    def stats(self) -> dict:
+        """Latency in seconds and token counts of the recent steps."""
+        stats: dict = {"count": self.count}
+        if not self.steps:
+            return stats
+        latencies = sorted(step.latency for step in self.steps)
+        p95 = latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)]
+        stats |= {
+            "latency_seconds": {
+                "mean": statistics.fmean(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": p95,
+                "max": latencies[-1],
+            },
+            "mean_history_tokens": statistics.fmean(
+                step.history_tokens for step in self.steps
+            ),
+            "mean_prompt_tokens": statistics.fmean(
+                step.prompt_tokens for step in self.steps
+            ),
+            "last": asdict(self.steps[-1]),
+        }
+        for key in ("input_tokens", "output_tokens"):
+            reported = [getattr(step, key) for step in self.steps]
+            reported = [tokens for tokens in reported if tokens is not None]
+            if reported:
+                stats[f"mean_{key}"] = statistics.fmean(reported)
+        return stats
+
+
+# Model steps of every agent of the process.
+MODEL_STEP_STATS = ModelStepStats()
+
+
+class HistoryCompactionMiddleware(AgentMiddleware):
+    """
+    Keep the history sent to the model within a token budget.
+
+    The conversation state is left untouched, only the messages of each model
+    request are compacted, see `compact_history`. The latency and token counts
+    of every model call are recorded and logged.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        tool_output_token_limit: int = TOOL_OUTPUT_TOKEN_LIMIT,
+        stats: ModelStepStats = MODEL_STEP_STATS,
+    ) -> None:
+        """
+        Initialize the history compaction.
+
+        Args:
+            token_budget: Approximate number of tokens of history per request.
+            tool_output_token_limit: Tool outputs of previous turns larger than
+                this are replaced by references to the state.
+            stats: Statistics the model steps are recorded in.
+        """
+        super().__init__()
+        self.token_budget = token_budget
+        self.tool_output_token_limit = tool_output_token_limit
+        self.stats = stats
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        """Compact the request's history, then time the model call."""
+        history_tokens = count_tokens_approximately(request.messages)
+        messages, dropped = compact_history(
+            request.messages,
+            self.token_budget,
+            self.tool_output_token_limit,
+        )
+        overrides = {"messages": messages}
+        if dropped and request.system_message is not None:
+            note = (
+                f"\n\n{dropped} earlier turn(s) of the conversation were omitted to "
+                "keep it short, their results are still in the agent state."
+            )
+            overrides["system_message"] = SystemMessage(
+                content=request.system_message.text + note,
+            )
+        prompt_tokens = count_tokens_approximately(messages)
+
+        start = time.perf_counter()
+        response = await handler(request.override(**overrides))
+        latency = time.perf_counter() - start
+
+        ai_message = next(
+            (m for m in reversed(response.result) if isinstance(m, AIMessage)),
+            None,
+        )
+        usage = ai_message.usage_metadata if ai_message else None
+        step = ModelStep(
+            latency=latency,
+            history_tokens=history_tokens,
+            prompt_tokens=prompt_tokens,
+            dropped_turns=dropped,
+            input_tokens=usage["input_tokens"] if usage else None,
+            output_tokens=usage["output_tokens"] if usage else None,
+        )
+        self.stats.record(step)
+        logger.info(
+            "Model step: %.2fs, history %d -> %d tokens (approx.), "
+            "%s input / %s output tokens",
+            step.latency,
+            step.history_tokens,
+            step.prompt_tokens,
+            step.input_tokens,
+            step.output_tokens,
+        )
+        return response
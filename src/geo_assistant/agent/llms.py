@@ -5,6 +5,8 @@ import os
 from dotenv import load_dotenv
 from langchain_ollama import ChatOllama
 
+from geo_assistant.agent.cache import create_llm_cache
+
 # Load environment variables from env file
 load_dotenv()
 
@@ -12,7 +14,11 @@ load_dotenv()
 MODEL_NAME = os.environ.get("OLLAMA_AGENT_MODEL", "llama3.2")
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 
+# Opt-in response cache, see LLM_CACHE.
+llm_cache = create_llm_cache(MODEL_NAME)
+
 llm = ChatOllama(
     model=MODEL_NAME,
     base_url=OLLAMA_BASE_URL,
+    cache=llm_cache,
 )
@@ -0,0 +1,289 @@
+"""Memory of the API process, and size of the conversations it keeps."""
+
+import logging
+import math
+import os
+import random
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+import psutil
+from dotenv import load_dotenv
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+
+from geo_assistant.agent.checkpoint import BlobSerializer
+from geo_assistant.agent.state import GeoAssistantState
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the tool calls whose allocations are traced with tracemalloc,
+# 0 disables it. Tracing slows down every allocation while a call is sampled.
+TOOL_MEMORY_SAMPLE_RATE = float(os.environ.get("TOOL_MEMORY_SAMPLE_RATE", "0"))
+# Frames of traceback kept per allocation, more attribute it better but cost
+# more memory.
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "1"))
+
+# Allocation sites kept per sampled tool call.
+_TOP_ALLOCATIONS = 5
+# Number of recent samples per tool the statistics are computed on.
+_SAMPLE_WINDOW = 100
+
+
+def process_memory() -> dict:
+    """Resident and virtual memory of the process in bytes, traced memory if on."""
+    info = psutil.Process().memory_info()
+    memory: dict[str, Any] = {"rss_bytes": info.rss, "vms_bytes": info.vms}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        memory["traced_bytes"] = {"current": current, "peak": peak}
+    return memory
+
+
+def field_sizes(values: dict[str, Any], serde: SerializerProtocol) -> dict[str, int]:
+    """
+    Serialized size in bytes of each GeoAssistantState field of a state.
+
+    Args:
+        values: Channel values of a checkpoint.
+        serde: Serializer of the checkpointer, so that the sizes are the ones
+            stored. Fields stored in blob files are sized as serialized inline.
+
+    Returns:
+        Size of each field set in `values`, largest first.
+    """
+    if isinstance(serde, BlobSerializer):
+        serde = serde.serde
+    sizes = {
+        key: len(serde.dumps_typed(value)[1])
+        for key, value in values.items()
+        if key in GeoAssistantState.__annotations__
+    }
+    return dict(sorted(sizes.items(), key=lambda item: -item[1]))
+
+
+@dataclass
+class ThreadUsage:
+    """Checkpoints of a thread in the checkpointer, and their size."""
+
+    thread_id: str
+    checkpoints: int = 0
+    # Checkpoints, channel values and pending writes. None if the checkpointer
+    # doesn't tell.
+    bytes: int | None = 0
+
+
+def _in_memory_usage(checkpointer: InMemorySaver) -> dict[str, ThreadUsage]:
+    usage = {thread_id: ThreadUsage(thread_id) for thread_id in checkpointer.storage}
+    for thread_id, namespaces in checkpointer.storage.items():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                usage[thread_id].checkpoints += 1
+                usage[thread_id].bytes += len(checkpoint[1]) + len(metadata[1])
+    for (thread_id, *_), (_, blob) in checkpointer.blobs.items():
+        if thread_id in usage:
+            usage[thread_id].bytes += len(blob)
+    for (thread_id, *_), writes in checkpointer.writes.items():
+        if thread_id in usage:
+            usage[thread_id].bytes += sum(
+                len(value[1]) for _, _, value, _ in writes.values()
+            )
+    return usage
+
+
+async def _sqlite_usage(checkpointer: AsyncSqliteSaver) -> dict[str, ThreadUsage]:
+    usage: dict[str, ThreadUsage] = {}
+    # length() of a BLOB is read from the record header, the values are not
+    # loaded.
+    async with checkpointer.conn.execute(
+        """
+        SELECT thread_id, count(*), sum(length(checkpoint) + length(metadata))
+        FROM checkpoints GROUP BY thread_id
+        """,
+    ) as cursor:
+        async for thread_id, checkpoints, size in cursor:
+            usage[thread_id] = ThreadUsage(thread_id, checkpoints, size or 0)
+    async with checkpointer.conn.execute(
+        "SELECT thread_id, sum(length(value)) FROM writes GROUP BY thread_id",
+    ) as cursor:
+        async for thread_id, size in cursor:
+            if thread_id in usage:
+                usage[thread_id].bytes += size or 0
+    return usage
+
+
+async def thread_usage(checkpointer: BaseCheckpointSaver) -> list[ThreadUsage]:
+    """
+    Count the checkpoints of every thread and their size, without loading them.
+
+    Args:
+        checkpointer: The checkpointer of the agent graph.
+
+    Returns:
+        Usage of every thread, largest first.
+    """
+    if isinstance(checkpointer, InMemorySaver):
+        usage = _in_memory_usage(checkpointer)
+    elif isinstance(checkpointer, AsyncSqliteSaver):
+        usage = await _sqlite_usage(checkpointer)
+    else:
+        # Other checkpointers are listed, their size is unknown.
+        usage = defaultdict(lambda: ThreadUsage("", bytes=None))
+        async for checkpoint in checkpointer.alist(None):
+            thread_id = checkpoint.config["configurable"]["thread_id"]
+            usage[thread_id].thread_id = thread_id
+            usage[thread_id].checkpoints += 1
+    return sorted(usage.values(), key=lambda u: (-(u.bytes or 0), -u.checkpoints))
+
+
+async def thread_state_sizes(
+    checkpointer: BaseCheckpointSaver,
+    thread_id: str,
+) -> dict[str, int]:
+    """Serialized size in bytes of each field of a thread's latest state."""
+    checkpoint = await checkpointer.aget_tuple(
+        {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}},
+    )
+    if checkpoint is None:
+        return {}
+    return field_sizes(checkpoint.checkpoint["channel_values"], checkpointer.serde)
+
+
+@dataclass
+class ToolMemorySample:
+    """Allocations during a sampled tool call."""
+
+    tool: str
+    seconds: float
+    # Allocated during the call and still alive at its end.
+    retained_bytes: int
+    # Peak of the allocations during the call.
+    peak_bytes: int
+    # Largest allocation sites still alive at the end of the call.
+    top_allocations: list[dict] = field(default_factory=list)
+
+
+class ToolMemoryStats:
+    """Statistics over the recent sampled tool calls of the process."""
+
+    def __init__(self, window: int = _SAMPLE_WINDOW) -> None:
+        """Initialize empty statistics over the last `window` samples per tool."""
+        self.count = 0
+        self.samples: defaultdict[str, deque[ToolMemorySample]] = defaultdict(
+            lambda: deque(maxlen=window),
+        )
+
+    def record(self, sample: ToolMemorySample) -> None:
+        """Record a sampled tool call."""
+        self.count += 1
+        self.samples[sample.tool].append(sample)
+
+    def stats(self) -> dict:
+        """Retained and peak bytes of the recent samples of each tool."""
+        stats: dict = {"count": self.count, "tools": {}}
+        for tool, samples in self.samples.items():
+            stats["tools"][tool] = {"count": len(samples)}
+            for key in ("retained_bytes", "peak_bytes"):
+                values = sorted(getattr(sample, key) for sample in samples)
+                p95 = values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)]
+                stats["tools"][tool][key] = {
+                    "p50": values[len(values) // 2],
+                    "p95": p95,
+                    "max": values[-1],
+                }
+            stats["tools"][tool]["last"] = asdict(samples[-1])
+        return stats
+
+
+# Sampled tool calls of every agent of the process.
+TOOL_MEMORY_STATS = ToolMemoryStats()
+
+
+class ToolMemoryMiddleware(AgentMiddleware):
+    """
+    Trace the allocations of a sample of the tool calls with tracemalloc.
+
+    Tracing is started for the duration of the sampled calls only, unless it
+    was on already (e.g. PYTHONTRACEMALLOC). Allocations of the other calls
+    running at the same time, including the blocking work of their threads,
+    are counted too.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = TOOL_MEMORY_SAMPLE_RATE,
+        frames: int = TRACEMALLOC_FRAMES,
+        stats: ToolMemoryStats = TOOL_MEMORY_STATS,
+    ) -> None:
+        """
+        Initialize the tool call sampling.
+
+        Args:
+            sample_rate: Fraction of the tool calls traced, 0 disables it.
+            frames: Frames of traceback kept per allocation.
+            stats: Statistics the samples are recorded in.
+        """
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.stats = stats
+        self._sampled_calls = 0
+        self._started_tracing = False
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]],
+    ) -> ToolMessage | Command:
+        """Run a tool call, tracing its allocations if sampled."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return await handler(request)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        if self._sampled_calls == 0:
+            tracemalloc.reset_peak()
+        self._sampled_calls += 1
+        baseline = tracemalloc.get_traced_memory()[0]
+        start_snapshot = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().compare_to(start_snapshot, "lineno")
+            self._sampled_calls -= 1
+            if self._sampled_calls == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+            sample = ToolMemorySample(
+                tool=request.tool_call["name"],
+                seconds=seconds,
+                retained_bytes=current - baseline,
+                peak_bytes=max(0, peak - baseline),
+                top_allocations=[
+                    {"site": str(stat.traceback), "size_diff": stat.size_diff}
+                    for stat in top[:_TOP_ALLOCATIONS]
+                ],
+            )
+            self.stats.record(sample)
+            logger.info(
+                "Tool call %s: %d bytes retained, %d bytes peak",
+                sample.tool,
+                sample.retained_bytes,
+                sample.peak_bytes,
+            )
@@ -0,0 +1,343 @@
+"""Concurrent scheduling of the tool calls emitted in a single agent turn."""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from dataclasses import dataclass, replace
+from typing import Any
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import AIMessage, ToolCall, ToolMessage
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ToolStateAccess:
+    """GeoAssistantState fields a tool reads from and writes to."""
+
+    reads: frozenset[str] = frozenset()
+    writes: frozenset[str] = frozenset()
+
+
+# State fields touched by each tool. `messages` is left out on purpose: every
+# tool appends its own ToolMessage and the `add_messages` reducer merges those.
+TOOL_STATE_ACCESS: dict[str, ToolStateAccess] = {
+    "get_place": ToolStateAccess(writes=frozenset({"place"})),
+    "get_search_area": ToolStateAccess(
+        reads=frozenset({"place"}),
+        writes=frozenset({"search_area"}),
+    ),
+    "get_places_within_buffer": ToolStateAccess(
+        reads=frozenset({"search_area"}),
+        writes=frozenset({"places_within_buffer"}),
+    ),
+    "export_places_within_buffer": ToolStateAccess(
+        reads=frozenset({"search_area"}),
+        writes=frozenset({"places_export"}),
+    ),
+    "fetch_naip_img": ToolStateAccess(
+        reads=frozenset({"search_area"}),
+        writes=frozenset({"naip_img_bytes", "naip_cube"}),
+    ),
+    "summarize_sat_img": ToolStateAccess(
+        reads=frozenset({"naip_img_bytes", "naip_cube"}),
+    ),
+}
+
+
+def _conflicts(
+    earlier: ToolStateAccess | None,
+    later: ToolStateAccess | None,
+) -> bool:
+    """Whether `later` has to wait for `earlier` to finish."""
+    # Tools without a declared access pattern are serialized against everything.
+    if earlier is None or later is None:
+        return True
+    return bool(earlier.writes & (later.reads | later.writes))
+
+
+def tool_call_dependencies(
+    tool_calls: Sequence[ToolCall],
+    access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+) -> list[set[int]]:
+    """
+    Find the earlier tool calls each tool call depends on.
+
+    A tool call depends on an earlier one in the same turn when the earlier
+    call writes a state field it reads (read-after-write) or also writes
+    (write-after-write). The result is transitively closed.
+
+    Args:
+        tool_calls: Tool calls in the order the model emitted them.
+        access: Mapping of tool name to the state fields it touches.
+
+    Returns:
+        For each tool call, the indices of the tool calls it has to wait for.
+    """
+    dependencies: list[set[int]] = []
+    for i, call in enumerate(tool_calls):
+        deps: set[int] = set()
+        for j in range(i):
+            if _conflicts(access.get(tool_calls[j]["name"]), access.get(call["name"])):
+                deps |= {j} | dependencies[j]
+        dependencies.append(deps)
+    return dependencies
+
+
+def plan_tool_call_waves(
+    tool_calls: Sequence[ToolCall],
+    access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+) -> list[list[ToolCall]]:
+    """
+    Group tool calls into waves of mutually independent calls.
+
+    Args:
+        tool_calls: Tool calls in the order the model emitted them.
+        access: Mapping of tool name to the state fields it touches.
+
+    Returns:
+        Waves of tool calls. Calls within a wave can run concurrently, each
+        wave only depends on the waves before it.
+    """
+    wave_index: list[int] = []
+    for deps in tool_call_dependencies(tool_calls, access):
+        wave_index.append(max((wave_index[j] + 1 for j in deps), default=0))
+
+    waves: list[list[ToolCall]] = [[] for _ in range(max(wave_index, default=-1) + 1)]
+    for call, index in zip(tool_calls, wave_index, strict=True):
+        waves[index].append(call)
+    return waves
+
+
+def later_writers(
+    tool_calls: Sequence[ToolCall],
+    i: int,
+    access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+) -> list[int]:
+    """
+    Find the later tool calls that may overwrite state written by call `i`.
+
+    Args:
+        tool_calls: Tool calls in the order the model emitted them.
+        i: Index of the tool call.
+        access: Mapping of tool name to the state fields it touches.
+
+    Returns:
+        The indices of the later tool calls, none for read-only tools.
+    """
+    writer = access.get(tool_calls[i]["name"])
+    if writer is not None and not writer.writes:
+        return []
+    later = []
+    for j in range(i + 1, len(tool_calls)):
+        other = access.get(tool_calls[j]["name"])
+        if writer is None or other is None or writer.writes & other.writes:
+            later.append(j)
+    return later
+
+
+def merge_state_updates(updates: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Merge tool `Command` updates in tool call order.
+
+    Messages are concatenated, every other field is last-writer-wins.
+
+    Args:
+        updates: State updates in the order the tool calls were emitted.
+
+    Returns:
+        The merged state update.
+    """
+    merged: dict[str, Any] = {}
+    for update in updates:
+        for key, value in update.items():
+            if key == "messages":
+                merged["messages"] = [*merged.get("messages", []), *value]
+            else:
+                merged[key] = value
+    return merged
+
+
+def _update_of(result: ToolMessage | Command | BaseException) -> dict[str, Any]:
+    """State update written by a tool call result."""
+    if isinstance(result, Command) and isinstance(result.update, dict):
+        return result.update
+    if isinstance(result, ToolMessage):
+        return {"messages": [result]}
+    return {}
+
+
+class _ToolCallBatch:
+    """Bookkeeping for the pending tool calls of one AI message."""
+
+    def __init__(
+        self,
+        key: str,
+        tool_calls: list[ToolCall],
+        access: dict[str, ToolStateAccess],
+        max_concurrency: int | None = None,
+    ) -> None:
+        self.key = key
+        self.index = {call["id"]: i for i, call in enumerate(tool_calls)}
+        self.tool_calls = tool_calls
+        self.access = access
+        self.dependencies = tool_call_dependencies(tool_calls, access)
+        self.results: list[asyncio.Future] = [
+            asyncio.get_running_loop().create_future() for _ in tool_calls
+        ]
+        self.remaining = len(tool_calls)
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def dependency_updates(self, i: int) -> dict[str, Any]:
+        """Wait for the dependencies of call `i` and merge their updates."""
+        deps = sorted(self.dependencies[i])
+        results = await asyncio.gather(
+            *(self.results[j] for j in deps),
+            return_exceptions=True,
+        )
+        return merge_state_updates(_update_of(result) for result in results)
+
+    def later_writers(self, i: int) -> list[int]:
+        """Later calls that may overwrite fields written by call `i`."""
+        return later_writers(self.tool_calls, i, self.access)
+
+
+class ToolCallSchedulerMiddleware(AgentMiddleware):
+    """
+    Run independent tool calls of a turn concurrently.
+
+    The agent dispatches every tool call of an AI message to the tool node at
+    once. This middleware holds back tool calls that read or write state
+    written by an earlier call of the same message until that call finishes,
+    and runs them against the state including its update. Fields written by
+    several calls keep the value of the last call in emission order, so the
+    merged update does not depend on which call finished first.
+
+    A thread has a single batch of pending tool calls at a time, dropped once
+    every call finished or as soon as one is cancelled or fails, and replaced
+    by the next AI message of the thread.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        access: dict[str, ToolStateAccess] = TOOL_STATE_ACCESS,
+    ) -> None:
+        """
+        Initialize the tool call scheduler.
+
+        Args:
+            max_concurrency: Maximum number of tool calls of a single turn that
+                run at the same time. `None` means no limit.
+            access: Mapping of tool name to the state fields it touches.
+        """
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self.access = access
+        # Pending batch per thread, or per AI message outside of threads.
+        self._batches: dict[str, _ToolCallBatch] = {}
+
+    def _batch_for(self, request: ToolCallRequest) -> tuple[str, _ToolCallBatch]:
+        """Get or create the batch for the last AI message of the request state."""
+        messages = request.state["messages"]
+        ai_index = max(
+            i for i, message in enumerate(messages) if isinstance(message, AIMessage)
+        )
+        ai_message = messages[ai_index]
+        answered = {
+            message.tool_call_id
+            for message in messages[ai_index + 1 :]
+            if isinstance(message, ToolMessage)
+        }
+        pending = [call for call in ai_message.tool_calls if call["id"] not in answered]
+        key = ai_message.id or ",".join(call["id"] for call in pending)
+        configurable = request.runtime.config.get("configurable", {})
+        thread_id = configurable.get("thread_id") or key
+        batch = self._batches.get(thread_id)
+        if batch is None or batch.key != key:
+            # Any other batch of the thread was left by a cancelled run.
+            batch = _ToolCallBatch(key, pending, self.access, self.max_concurrency)
+            self._batches[thread_id] = batch
+        return thread_id, batch
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]],
+    ) -> ToolMessage | Command:
+        """Run a tool call once the calls it depends on have finished."""
+        thread_id, batch = self._batch_for(request)
+        i = batch.index.get(request.tool_call["id"])
+        if i is None:
+            return await handler(request)
+
+        result: ToolMessage | Command | BaseException | None = None
+        try:
+            update = await batch.dependency_updates(i)
+            if update:
+                state = {**request.state, **update}
+                state["messages"] = [
+                    *request.state["messages"],
+                    *update.get("messages", []),
+                ]
+                request = request.override(
+                    state=state,
+                    runtime=replace(request.runtime, state=state),
+                )
+
+            if batch.semaphore is None:
+                result = await handler(request)
+            else:
+                async with batch.semaphore:
+                    result = await handler(request)
+        except BaseException as e:
+            result = e
+            raise
+        finally:
+            batch.results[i].set_result(result)
+            batch.remaining -= 1
+            # The calls of a cancelled or failed run may never all be dispatched.
+            done = batch.remaining == 0 or isinstance(result, BaseException)
+            if done and self._batches.get(thread_id) is batch:
+                del self._batches[thread_id]
+
+        return await self._drop_overwritten_fields(batch, i, result)
+
+    async def _drop_overwritten_fields(
+        self,
+        batch: _ToolCallBatch,
+        i: int,
+        result: ToolMessage | Command,
+    ) -> ToolMessage | Command:
+        """Remove fields from `result` that a later call of the batch overwrites."""
+        if not isinstance(result, Command) or not isinstance(result.update, dict):
+            return result
+        later = batch.later_writers(i)
+        if not later:
+            return result
+
+        later_results = await asyncio.gather(
+            *(batch.results[j] for j in later),
+            return_exceptions=True,
+        )
+        overwritten = {
+            key
+            for later_result in later_results
+            for key in _update_of(later_result)
+            if key != "messages"
+        }
+        if not overwritten & result.update.keys():
+            return result
+
+        logger.debug(
+            "Dropping fields %s of tool call %s, overwritten by a later call.",
+            overwritten & result.update.keys(),
+            batch.tool_calls[i]["id"],
+        )
+        update = {
+            key: value for key, value in result.update.items() if key not in overwritten
+        }
+        return replace(result, update=update)
@@ -13,7 +13,15 @@ class GeoAssistantState(AgentState):
     place: NotRequired[Feature | None] = None
     search_area: NotRequired[Feature | None] = None
     places_within_buffer: NotRequired[FeatureCollection | None] = None
+    places_export: NotRequired[str | None] = Field(
+        default=None,
+        description="API path streaming all the places of a category found in the search area",
+    )
     naip_img_bytes: NotRequired[str | None] = Field(
         default=None,
-        description="Base 64 encoded bytes str of the saved NAIP RGB JPEG image",
+        description="Base 64 encoded bytes str of the saved NAIP RGB image (JPEG by default)",
+    )
+    naip_cube: NotRequired[str | None] = Field(
+        default=None,
+        description="Id of the cached NAIP cube, served as XYZ map tiles by the API",
     )
@@ -1,18 +1,54 @@
 """Chat app API endpoint."""
 
+import asyncio
 import logging
+import os
 from collections.abc import AsyncGenerator
 from contextlib import aclosing, asynccontextmanager
-from typing import Any
+from dataclasses import asdict
+from typing import Annotated, Any
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Path, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import UUID4
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from geojson_pydantic import Feature
+from geojson_pydantic.geometries import Geometry
+from pydantic import UUID4, TypeAdapter, ValidationError
+from starlette.background import BackgroundTask
 
+from geo_assistant.agent.cache import LLM_CACHE_BYPASS
+from geo_assistant.agent.checkpoint import STATE_DIR, is_shared, open_checkpointer
 from geo_assistant.agent.graph import create_graph
+from geo_assistant.agent.history import MODEL_STEP_STATS
+from geo_assistant.agent.llms import llm_cache
+from geo_assistant.agent.memory import (
+    TOOL_MEMORY_STATS,
+    process_memory,
+    thread_state_sizes,
+    thread_usage,
+)
 from geo_assistant.agent.state import GeoAssistantState
-from geo_assistant.api.schemas.chat import ChatRequestBody, ChatResponse
+from geo_assistant.api.compression import compress_stream, negotiate_encoding
+from geo_assistant.api.encoders import (
+    ENCODERS,
+    MEDIA_TYPES,
+    StateEncoder,
+    encode_ndjson,
+    negotiate_format,
+)
+from geo_assistant.api.runs import RunQueue, RunRejectedError, RunTicket
+from geo_assistant.api.schemas.chat import ChatRequestBody
+from geo_assistant.api.warmup import Readiness, configured_components, warm_up
+from geo_assistant.raster.streaming import cube_path, write_deferred_cube
+from geo_assistant.raster.tiles import render_tile
+from geo_assistant.tools.overture import area_digest, stream_places_export
+from geo_assistant.tools.summarize import CHIP_SUMMARY_STATS
+from geo_assistant.vector.categories import load_category_index
+from geo_assistant.vector.export import (
+    EXPORT_FILE_SUFFIXES,
+    EXPORT_MEDIA_TYPES,
+    ExportFormat,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +57,36 @@ logger = logging.getLogger(__name__)
 # need a description in the GeoAssistantState model.
 UI_SET_FIELDS_WHITELIST = ["point", "messages"]
 
+# Tiles addressed by cube id never change, tiles addressed by thread follow
+# the thread's latest cube and are revalidated with their ETag.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Seconds between checks of whether the client of a chat stream has gone.
+DISCONNECT_POLL_INTERVAL = 0.25
+
+_GEOMETRY = TypeAdapter(Geometry)
+
+# The /debug endpoints list thread ids, keep them off unless the API is private.
+DEBUG_ENDPOINTS = os.environ.get("API_DEBUG_ENDPOINTS", "off") == "on"
+
 
 @asynccontextmanager
 async def _lifespan(app: FastAPI):
-    app.state.chatbot = await create_graph()
-    yield
+    async with open_checkpointer() as checkpointer:
+        app.state.chatbot = await create_graph(checkpointer=checkpointer)
+        # With a shared store, runs of a thread are locked across workers too.
+        app.state.run_queue = RunQueue(
+            lock_dir=STATE_DIR / "locks" if is_shared() else None,
+        )
+        # Warm up in the background, /ready reports when it is done.
+        components = configured_components()
+        app.state.readiness = Readiness(list(components))
+        warmup_task = asyncio.create_task(warm_up(app.state.readiness, components))
+        try:
+            yield
+        finally:
+            warmup_task.cancel()
 
 
 app = FastAPI(title="Geo Assistant", lifespan=_lifespan)
@@ -45,8 +106,12 @@ async def stream_chat(
     thread_id: UUID4,
     chatbot: Any,
     request: Request,
+    encode: StateEncoder = encode_ndjson,
+    bypass_llm_cache: bool = False,
 ) -> AsyncGenerator[bytes]:
-    """Agent chat stream."""
+    """Agent chat stream, each state update encoded by `encode`."""
+    # Set in the task running the stream, the graph's tasks inherit it.
+    LLM_CACHE_BYPASS.set(bypass_llm_cache)
     config: dict[str, Any] = {
         "configurable": {
             "thread_id": str(thread_id),
@@ -81,42 +146,320 @@ async def stream_chat(
 
     state_updates.update(vars_to_update)
 
-    stream = chatbot.astream(
-        input=state_updates,
-        config=config,
-        stream_mode="updates",
-    )
+    # The graph runs in a task of its own, so that a disconnect cancels the
+    # running tool calls and model requests instead of waiting for the next
+    # state update. The bounded queue keeps the graph in step with the client.
+    updates: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=1)
+
+    async def run_graph() -> None:
+        stream = chatbot.astream(
+            input=state_updates,
+            config=config,
+            stream_mode="updates",
+        )
+        async with aclosing(stream):
+            async for update in stream:
+                await updates.put(update)
+        await updates.put(None)
 
-    async with aclosing(stream):
-        async for update in stream:
-            if await request.is_disconnected():
-                logger.info("Client disconnected; stopping stream.")
+    graph_run = asyncio.create_task(run_graph())
+    disconnected = asyncio.create_task(_wait_for_disconnect(request))
+    next_update = None
+    try:
+        while True:
+            next_update = asyncio.create_task(updates.get())
+            await asyncio.wait(
+                {next_update, graph_run, disconnected},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected.done():
+                logger.info("Client disconnected; cancelling the run.")
+                break
+            if not next_update.done():
+                # The graph failed before its final sentinel.
+                graph_run.result()
+                break
+            update = next_update.result()
+            if update is None:
                 break
 
             agent = next(iter(update.keys()))
             payload = update[agent]
-            state = GeoAssistantState(**payload)
-            resp = ChatResponse(thread_id=str(thread_id), state=state)
+            # Geometries were compacted by the tools, they are sent as stored.
+            yield encode(str(thread_id), payload)
+    finally:
+        for task in (next_update, disconnected, graph_run):
+            if task is not None:
+                task.cancel()
+        # The thread's next run waits for this one to be released, wait for
+        # the cancelled tool calls to stop first.
+        await asyncio.gather(graph_run, return_exceptions=True)
+
+
+async def _wait_for_disconnect(
+    request: Request,
+    interval: float = DISCONNECT_POLL_INTERVAL,
+) -> None:
+    """Return once the client of `request` has disconnected."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
 
-            line = resp.model_dump_json() + "\n"
-            yield line.encode("utf-8")
+async def _release_after(
+    stream: AsyncGenerator[bytes],
+    ticket: RunTicket,
+) -> AsyncGenerator[bytes]:
+    """Release the run's queue ticket once its stream ends."""
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+    finally:
+        ticket.release()
 
 
 @app.post("/chat")
 async def chat(request: ChatRequestBody, http_request: Request) -> StreamingResponse:
     """HTTP POST endpoint at /chat."""
+    # Wait for the thread's previous run and a free run slot, or fail fast.
+    try:
+        ticket = await http_request.app.state.run_queue.acquire(request.thread_id)
+    except RunRejectedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+
+    stream_format = negotiate_format(http_request.headers.get("accept"))
     generator = stream_chat(
         ui_state_update=request.agent_state_input,
         thread_id=request.thread_id,
         chatbot=http_request.app.state.chatbot,
         request=http_request,
+        encode=ENCODERS[stream_format],
+        bypass_llm_cache=http_request.headers.get("x-llm-cache", "").lower()
+        == "bypass",
     )
+    body = _release_after(generator, ticket)
+    headers = {
+        "Cache-Control": "no-cache",
+        # If you run behind nginx, this prevents buffering of the stream:
+        "X-Accel-Buffering": "no",
+        "X-Queue-Wait": f"{ticket.wait:.3f}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    # Compressed line by line, so that the stream stays incremental.
+    encoding = negotiate_encoding(http_request.headers.get("accept-encoding"))
+    if encoding is not None:
+        body = compress_stream(body, encoding)
+        headers["Content-Encoding"] = encoding
     return StreamingResponse(
-        generator,
-        media_type="application/x-ndjson; charset=utf-8",
-        headers={
-            "Cache-Control": "no-cache",
-            # If you run behind nginx, this prevents buffering of the stream:
-            "X-Accel-Buffering": "no",
+        body,
+        media_type=MEDIA_TYPES[stream_format],
+        headers=headers,
+        # Also release the ticket if the stream never started.
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@app.get("/metrics/runs")
+async def run_metrics(http_request: Request) -> dict:
+    """HTTP GET endpoint at /metrics/runs, run queue depth and wait times."""
+    return http_request.app.state.run_queue.stats()
+
+
+@app.get("/metrics/model")
+async def model_metrics() -> dict:
+    """
+    HTTP GET endpoint at /metrics/model, agent model step latency and tokens.
+
+    Also the latency of the chip summaries of tiled image summarization.
+    """
+    stats = MODEL_STEP_STATS.stats()
+    if llm_cache is not None:
+        stats["llm_cache"] = llm_cache.stats()
+    stats["chip_summaries"] = CHIP_SUMMARY_STATS.stats()
+    return stats
+
+
+@app.get("/metrics/memory")
+async def memory_metrics(http_request: Request) -> dict:
+    """
+    HTTP GET endpoint at /metrics/memory, process memory and checkpoint sizes.
+
+    Also the allocations of the tool calls sampled with tracemalloc, see
+    TOOL_MEMORY_SAMPLE_RATE.
+    """
+    usage = await thread_usage(http_request.app.state.chatbot.checkpointer)
+    return {
+        "process": process_memory(),
+        "threads": {
+            "count": len(usage),
+            "checkpoints": sum(thread.checkpoints for thread in usage),
+            "bytes": sum(thread.bytes or 0 for thread in usage),
         },
+        "tool_calls": TOOL_MEMORY_STATS.stats(),
+    }
+
+
+@app.get("/debug/memory")
+async def debug_memory(
+    http_request: Request,
+    threads: Annotated[int, Query(ge=0, le=1000)] = 10,
+) -> dict:
+    """
+    HTTP GET endpoint at /debug/memory, the largest threads and their fields.
+
+    Lists the `threads` threads with the largest checkpoints, with the
+    serialized size of each field of their latest state. Only served with
+    API_DEBUG_ENDPOINTS=on.
+    """
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    checkpointer = http_request.app.state.chatbot.checkpointer
+    usage = await thread_usage(checkpointer)
+    return {
+        "process": process_memory(),
+        "threads": [
+            {
+                **asdict(thread),
+                "fields": await thread_state_sizes(checkpointer, thread.thread_id),
+            }
+            for thread in usage[:threads]
+        ],
+        "tool_calls": TOOL_MEMORY_STATS.stats(),
+    }
+
+
+@app.get("/ready")
+async def ready(http_request: Request) -> JSONResponse:
+    """
+    HTTP GET endpoint at /ready, whether the start-up warm-up has finished.
+
+    Responds 503 while warming up, then 200 with the status and duration of
+    the warm-up of each component, some of which may have failed.
+    """
+    report = http_request.app.state.readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/tiles/{z}/{x}/{y}")
+async def tiles(
+    z: Annotated[int, Path(ge=0, le=24)],
+    x: Annotated[int, Path(ge=0)],
+    y: Annotated[int, Path(ge=0)],
+    http_request: Request,
+    thread_id: UUID4 | None = None,
+    cube: Annotated[str | None, Query(pattern="^[0-9a-f]{40}$")] = None,
+) -> Response:
+    """
+    HTTP GET endpoint at /tiles/{z}/{x}/{y}, XYZ PNG tiles of a NAIP cube.
+
+    The cube is either given by id, as returned in the `naip_cube` state field,
+    or the latest cube loaded in a thread.
+    """
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(status_code=404, detail="Tile index out of range")
+
+    cache_control = IMMUTABLE_CACHE_CONTROL
+    if cube is None:
+        if thread_id is None:
+            raise HTTPException(status_code=422, detail="Pass a thread_id or a cube")
+        snapshot = await http_request.app.state.chatbot.aget_state(
+            {"configurable": {"thread_id": str(thread_id)}},
+        )
+        cube = snapshot.values.get("naip_cube")
+        cache_control = REVALIDATE_CACHE_CONTROL
+
+    path = cube_path(cube) if cube else None
+    # Cubes loaded in memory are written to the cache on their first request.
+    if path is None or not (
+        path.exists() or await asyncio.to_thread(write_deferred_cube, path)
+    ):
+        raise HTTPException(status_code=404, detail="NAIP cube not found")
+
+    etag = f'"{cube}-{z}-{x}-{y}"'
+    headers = {"Cache-Control": cache_control, "ETag": etag}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    tile = await asyncio.to_thread(render_tile, path, z, x, y)
+    if tile is None:
+        # Outside of the cube, nothing to draw.
+        return Response(status_code=204, headers=headers)
+    return Response(content=tile, media_type="image/png", headers=headers)
+
+
+async def _thread_search_area(
+    chatbot: Any,
+    thread_id: str,
+    digest: str | None,
+) -> Geometry | None:
+    """
+    Search area of a thread, the latest or the one of digest `digest`.
+
+    An earlier search area is looked up in the checkpoints of the thread, most
+    recent first.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    if digest is None:
+        snapshot = await chatbot.aget_state(config)
+        search_area = snapshot.values.get("search_area")
+        return search_area and Feature.model_validate(search_area).geometry
+    async for snapshot in chatbot.aget_state_history(config):
+        search_area = snapshot.values.get("search_area")
+        if search_area is None:
+            continue
+        geometry = Feature.model_validate(search_area).geometry
+        if area_digest(geometry) == digest:
+            return geometry
+    return None
+
+
+@app.get("/export/places")
+async def export_places(
+    category: str,
+    http_request: Request,
+    thread_id: UUID4 | None = None,
+    area: str | None = None,
+    geometry: str | None = None,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = "parquet",
+) -> StreamingResponse:
+    """
+    HTTP GET endpoint at /export/places, every Overture place of a category in an area.
+
+    The area is a search area of a thread, the one of digest `area` as pinned
+    by `export_places_within_buffer` or else the latest, or a GeoJSON geometry.
+    The places are streamed from DuckDB record batch by record batch, as
+    GeoParquet or as an Arrow IPC stream with `format=arrow`, geometries as WKB.
+    """
+    if geometry is not None:
+        try:
+            search_area = _GEOMETRY.validate_json(geometry)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail="Invalid GeoJSON geometry",
+            ) from e
+    elif thread_id is not None:
+        search_area = await _thread_search_area(
+            http_request.app.state.chatbot,
+            str(thread_id),
+            area,
+        )
+        if search_area is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Thread has no such search area",
+            )
+    else:
+        raise HTTPException(status_code=422, detail="Pass a thread_id or a geometry")
+
+    category = load_category_index().resolve(category)
+    filename = f"places-{category}{EXPORT_FILE_SUFFIXES[export_format]}"
+    return StreamingResponse(
+        stream_places_export(category, search_area, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
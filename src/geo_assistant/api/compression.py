@@ -0,0 +1,150 @@
+"""Negotiated streaming compression of chat responses."""
+
+import os
+import zlib
+from collections.abc import AsyncGenerator
+from contextlib import aclosing
+from typing import Literal, get_args
+
+import zstandard
+from dotenv import load_dotenv
+
+load_dotenv()
+
+Encoding = Literal["zstd", "gzip"]
+
+_ENCODINGS: tuple[Encoding, ...] = get_args(Encoding)
+
+
+def parse_encodings(value: str) -> list[Encoding]:
+    """
+    Parse a comma separated list of content encodings.
+
+    Raises:
+        ValueError: If an encoding is not supported by `compress_stream`.
+    """
+    encodings = [encoding.strip() for encoding in value.split(",") if encoding.strip()]
+    for encoding in encodings:
+        if encoding not in _ENCODINGS:
+            raise ValueError(f"Unsupported chat compression {encoding!r}")
+    return encodings  # type: ignore[return-value]
+
+
+# Encodings offered to clients, in order of preference. Empty disables
+# compression, e.g. when a reverse proxy compresses responses already.
+# Rejected at start-up if unsupported, rather than once a response has started.
+CHAT_COMPRESSION = parse_encodings(os.environ.get("CHAT_COMPRESSION", "zstd,gzip"))
+GZIP_LEVEL = int(os.environ.get("CHAT_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("CHAT_ZSTD_LEVEL", "3"))
+
+
+def header_qualities(header: str) -> dict[str, float]:
+    """
+    Parse the values of an Accept or Accept-Encoding header.
+
+    Args:
+        header: Comma separated values with optional `q` parameters.
+
+    Returns:
+        Mapping of lowercase value to quality, 1 by default.
+    """
+    qualities: dict[str, float] = {}
+    for part in header.lower().split(","):
+        value, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, q = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0.0
+        qualities[value.strip()] = quality
+    return qualities
+
+
+def negotiate_encoding(
+    accept_encoding: str | None,
+    offered: list[Encoding] = CHAT_COMPRESSION,
+) -> Encoding | None:
+    """
+    Pick the content encoding of a response from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Accept-Encoding header of the request.
+        offered: Encodings supported by the server, in order of preference.
+
+    Returns:
+        The preferred encoding among those the client accepts with the highest
+        quality, None for identity.
+    """
+    if not accept_encoding:
+        return None
+    qualities = header_qualities(accept_encoding)
+    accepted = {
+        encoding: qualities.get(encoding, qualities.get("*", 0.0))
+        for encoding in offered
+    }
+    best = max(accepted.values(), default=0.0)
+    if best <= 0:
+        return None
+    # The first offered encoding with the best quality, dicts keep their order.
+    return next(encoding for encoding, q in accepted.items() if q == best)
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        # wbits=31 writes the gzip header and trailer.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH,
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK,
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+async def compress_stream(
+    stream: AsyncGenerator[bytes],
+    encoding: Encoding,
+) -> AsyncGenerator[bytes]:
+    """
+    Compress a stream chunk by chunk, flushing after every chunk.
+
+    The compression context is kept for the whole stream, so GeoJSON repeated
+    by later lines compresses to back-references, while every chunk, an NDJSON
+    line, can be decoded by the client as soon as it arrives.
+
+    Args:
+        stream: Chunks to compress.
+        encoding: 'zstd' or 'gzip'.
+
+    Yields:
+        Compressed chunks.
+    """
+    if encoding == "zstd":
+        compressor = _ZstdStream(ZSTD_LEVEL)
+    elif encoding == "gzip":
+        compressor = _GzipStream(GZIP_LEVEL)
+    else:
+        raise ValueError(f"Unsupported encoding {encoding!r}")
+
+    async with aclosing(stream):
+        async for chunk in stream:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
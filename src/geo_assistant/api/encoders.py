@@ -0,0 +1,107 @@
+"""Encoders of the chat stream, NDJSON or length-prefixed MessagePack frames."""
+
+import base64
+import struct
+from collections.abc import Callable
+from typing import Any, Literal
+
+import ormsgpack
+from pydantic import TypeAdapter
+
+from geo_assistant.api.compression import header_qualities
+
+StreamFormat = Literal["ndjson", "msgpack"]
+
+MEDIA_TYPES: dict[StreamFormat, str] = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "msgpack": "application/vnd.msgpack",
+}
+# Accept values selecting MessagePack frames.
+_MSGPACK_MEDIA_TYPES = ("application/vnd.msgpack", "application/msgpack")
+# State fields holding base64 encoded bytes, sent as raw bytes in MessagePack.
+_BYTES_FIELDS = ("naip_img_bytes",)
+# Big-endian unsigned 32 bit length of each MessagePack frame.
+_FRAME_HEADER = struct.Struct(">I")
+
+StateEncoder = Callable[[str, dict], bytes]
+
+# Serializes the models of a state update by their runtime type, validating
+# nothing.
+_UPDATE = TypeAdapter(dict[str, Any])
+
+
+def negotiate_format(accept: str | None) -> StreamFormat:
+    """
+    Pick the stream format from an Accept header.
+
+    Args:
+        accept: Accept header of the request.
+
+    Returns:
+        'msgpack' if the client accepts MessagePack with a higher quality than
+        NDJSON, 'ndjson' otherwise.
+    """
+    if not accept:
+        return "ndjson"
+    qualities = header_qualities(accept)
+    msgpack = max(qualities.get(media, 0.0) for media in _MSGPACK_MEDIA_TYPES)
+    ndjson = qualities.get("application/x-ndjson", 0.0)
+    return "msgpack" if msgpack > ndjson else "ndjson"
+
+
+def encode_ndjson(thread_id: str, state: dict) -> bytes:
+    """
+    Encode a state update as a line of JSON, a `ChatResponse`.
+
+    The graph's output is dumped as is, like in `encode_msgpack`: it is not
+    validated into a `ChatResponse` again.
+    """
+    return _UPDATE.dump_json({"thread_id": thread_id, "state": state}) + b"\n"
+
+
+def _msgpack_default(obj: Any) -> Any:
+    # Named tuples, e.g. the GeoJSON positions.
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"Type is not msgpack serializable: {type(obj).__name__}")
+
+
+def encode_msgpack(thread_id: str, state: dict) -> bytes:
+    """
+    Encode a state update as a length-prefixed MessagePack frame.
+
+    The graph's output is packed as is: pydantic models, messages and GeoJSON,
+    are serialized from their attributes without being validated again, so
+    unset optional members, e.g. GeoJSON `bbox`, are sent as nil. Base64 fields
+    are sent as raw bytes.
+    """
+    state = {
+        key: base64.b64decode(value)
+        if key in _BYTES_FIELDS and isinstance(value, str)
+        else value
+        for key, value in state.items()
+    }
+    frame = ormsgpack.packb(
+        {"thread_id": thread_id, "state": state},
+        default=_msgpack_default,
+        option=ormsgpack.OPT_SERIALIZE_PYDANTIC,
+    )
+    return _FRAME_HEADER.pack(len(frame)) + frame
+
+
+def decode_msgpack_frames(data: bytes) -> list[dict]:
+    """Decode a complete MessagePack chat stream, e.g. in tests and clients."""
+    frames = []
+    offset = 0
+    while offset < len(data):
+        (size,) = _FRAME_HEADER.unpack_from(data, offset)
+        offset += _FRAME_HEADER.size
+        frames.append(ormsgpack.unpackb(data[offset : offset + size]))
+        offset += size
+    return frames
+
+
+ENCODERS: dict[StreamFormat, StateEncoder] = {
+    "ndjson": encode_ndjson,
+    "msgpack": encode_msgpack,
+}
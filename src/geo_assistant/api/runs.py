@@ -0,0 +1,268 @@
+"""Admission control for agent graph runs."""
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import statistics
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Number of graph runs executed at the same time by this process.
+MAX_CONCURRENT_RUNS = int(os.environ.get("CHAT_MAX_CONCURRENT_RUNS", "4"))
+# Number of runs waiting for a slot, beyond it requests are rejected with 503.
+MAX_QUEUED_RUNS = int(os.environ.get("CHAT_MAX_QUEUED_RUNS", "16"))
+# Number of runs of a thread queued behind its active run, beyond it requests
+# are rejected with 429. 0 rejects every duplicate submit.
+MAX_QUEUED_PER_THREAD = int(os.environ.get("CHAT_MAX_QUEUED_PER_THREAD", "1"))
+
+# Run duration assumed for Retry-After until runs have completed.
+_INITIAL_RUN_SECONDS = 10.0
+# Number of recent waits the wait time statistics are computed on.
+_WAIT_WINDOW = 1000
+# Seconds between attempts to take a thread lock held by another worker.
+_FILE_LOCK_POLL_SECONDS = 0.05
+
+
+class RunRejectedError(Exception):
+    """A run was not admitted, the client should retry after `retry_after` seconds."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int):
+        """Initialize the error with the suggested retry delay in seconds."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ThreadBusyError(RunRejectedError):
+    """The thread already has as many runs as allowed."""
+
+    status_code = 429
+
+
+class RunQueueFullError(RunRejectedError):
+    """The global run queue is full."""
+
+    status_code = 503
+
+
+class _ThreadFileLock:
+    """
+    Exclusive lock of a thread across worker processes, an flock'ed file.
+
+    Lock files are left in place, removing a file another worker is about to
+    lock would let two workers hold the lock.
+    """
+
+    def __init__(self, lock_dir: Path, thread_id: str):
+        """Initialize the lock of a thread, without taking it."""
+        name = hashlib.sha1(thread_id.encode()).hexdigest()
+        self._path = lock_dir / f"{name}.lock"
+        self._fd: int | None = None
+
+    async def acquire(self) -> None:
+        """Wait for the lock, polling so that the wait can be cancelled."""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(_FILE_LOCK_POLL_SECONDS)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        """Release the lock."""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class RunTicket:
+    """An admitted run, holding its thread lock and a concurrency slot."""
+
+    def __init__(self, queue: "RunQueue", thread_id: str, wait: float):
+        """Initialize the ticket of a run admitted after `wait` seconds."""
+        self.thread_id = thread_id
+        self.wait = wait
+        self._queue = queue
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        """Release the thread lock and concurrency slot, idempotent."""
+        if self._released:
+            return
+        self._released = True
+        self._queue._release(self.thread_id, time.monotonic() - self._started)
+
+
+class RunQueue:
+    """
+    Bounded queue of graph runs with per-thread locking.
+
+    Runs of the same thread are executed one after the other, runs of
+    different threads share `max_concurrency` slots. Requests that would wait
+    behind more than `max_queued_per_thread` runs of their thread, or behind
+    more than `max_queued` runs overall, are rejected right away with an
+    estimate of when to retry, instead of queueing without bound.
+
+    With a `lock_dir`, runs of a thread are also serialized across the worker
+    processes sharing that directory, when conversations live in a shared
+    store.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENT_RUNS,
+        max_queued: int = MAX_QUEUED_RUNS,
+        max_queued_per_thread: int = MAX_QUEUED_PER_THREAD,
+        lock_dir: Path | None = None,
+    ):
+        """Initialize an empty run queue."""
+        self.lock_dir = lock_dir
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_queued_per_thread = max_queued_per_thread
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected: Counter[str] = Counter()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # Admitted runs, running or queued, and lock of each thread.
+        self._thread_runs: dict[str, int] = {}
+        self._thread_locks: dict[str, asyncio.Lock] = {}
+        self._thread_file_locks: dict[str, _ThreadFileLock] = {}
+        self._waits: deque[float] = deque(maxlen=_WAIT_WINDOW)
+        self._mean_run_seconds = _INITIAL_RUN_SECONDS
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free, at least 1."""
+        runs_ahead = self.queued + 1
+        return max(
+            1,
+            math.ceil(self._mean_run_seconds * runs_ahead / self.max_concurrency),
+        )
+
+    def _reject(self, error: type[RunRejectedError], message: str) -> None:
+        self.rejected[error.__name__] += 1
+        raise error(message, retry_after=self.retry_after())
+
+    async def acquire(self, thread_id: str) -> RunTicket:
+        """
+        Wait for the thread's previous runs and for a free slot.
+
+        Args:
+            thread_id: Conversation thread of the run.
+
+        Returns:
+            The ticket of the admitted run, to be released when the run ends.
+
+        Raises:
+            ThreadBusyError: The thread has too many runs queued already.
+            RunQueueFullError: Too many runs are waiting for a slot.
+        """
+        thread_runs = self._thread_runs.get(thread_id, 0)
+        if thread_runs > self.max_queued_per_thread:
+            self._reject(ThreadBusyError, f"Thread {thread_id} has a run in progress")
+
+        must_wait = thread_runs > 0 or self._slots.locked()
+        if must_wait and self.queued >= self.max_queued:
+            self._reject(RunQueueFullError, "Too many runs in progress")
+
+        lock = self._thread_locks.setdefault(thread_id, asyncio.Lock())
+        self._thread_runs[thread_id] = thread_runs + 1
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await lock.acquire()
+            file_lock = None
+            try:
+                if self.lock_dir is not None:
+                    file_lock = _ThreadFileLock(self.lock_dir, thread_id)
+                    await file_lock.acquire()
+                await self._slots.acquire()
+            except BaseException:
+                if file_lock is not None:
+                    file_lock.release()
+                lock.release()
+                raise
+            if file_lock is not None:
+                self._thread_file_locks[thread_id] = file_lock
+        except BaseException:
+            # Cancelled while waiting, e.g. the client disconnected.
+            self._leave(thread_id)
+            raise
+        finally:
+            self.queued -= 1
+
+        wait = time.monotonic() - start
+        self._waits.append(wait)
+        self.running += 1
+        if must_wait:
+            logger.info(
+                "Run of thread %s waited %.2fs (running=%d, queued=%d)",
+                thread_id,
+                wait,
+                self.running,
+                self.queued,
+            )
+        return RunTicket(self, thread_id, wait)
+
+    def _leave(self, thread_id: str) -> None:
+        """Forget a run of a thread, and the thread once it has no runs left."""
+        self._thread_runs[thread_id] -= 1
+        if self._thread_runs[thread_id] == 0:
+            del self._thread_runs[thread_id]
+            del self._thread_locks[thread_id]
+
+    def _release(self, thread_id: str, run_seconds: float) -> None:
+        self.running -= 1
+        self.completed += 1
+        # Exponential moving average of the run duration for Retry-After.
+        self._mean_run_seconds += 0.2 * (run_seconds - self._mean_run_seconds)
+        self._slots.release()
+        if thread_id in self._thread_file_locks:
+            self._thread_file_locks.pop(thread_id).release()
+        self._thread_locks[thread_id].release()
+        self._leave(thread_id)
+
+    def stats(self) -> dict:
+        """Queue depth, wait times in seconds and rejection counts."""
+        waits = sorted(self._waits)
+        wait_stats = {"count": len(waits)}
+        if waits:
+            wait_stats |= {
+                "mean": statistics.fmean(waits),
+                "p50": waits[len(waits) // 2],
+                "p95": waits[min(len(waits) - 1, math.ceil(len(waits) * 0.95) - 1)],
+                "max": waits[-1],
+            }
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queued": self.max_queued,
+            "max_queued_per_thread": self.max_queued_per_thread,
+            "threads": len(self._thread_runs),
+            "completed": self.completed,
+            "rejected": dict(self.rejected),
+            "mean_run_seconds": self._mean_run_seconds,
+            "wait_seconds": wait_stats,
+        }
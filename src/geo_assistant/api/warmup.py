@@ -0,0 +1,184 @@
+"""Warm-up of the API's dependencies at start-up, and readiness."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+
+import httpx
+from dotenv import load_dotenv
+
+from geo_assistant.agent.llms import MODEL_NAME, OLLAMA_BASE_URL
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.tools.buffer import get_search_area
+from geo_assistant.tools.invoke import invoke_tool
+from geo_assistant.tools.naip import fetch_naip_img, open_catalog
+from geo_assistant.tools.overture import fill_connection_pool, get_place
+from geo_assistant.tools.summarize import IMAGE_MODEL_NAME
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Components warmed up at start-up, empty disables the warm-up.
+WARMUP_COMPONENTS = [
+    component.strip()
+    for component in os.environ.get(
+        "WARMUP_COMPONENTS",
+        "duckdb,stac,ollama,aois",
+    ).split(",")
+    if component.strip()
+]
+# DuckDB connections created ahead of the first queries.
+WARMUP_DB_CONNECTIONS = int(os.environ.get("WARMUP_DB_CONNECTIONS", "2"))
+# How long Ollama keeps the models loaded after the warm-up ping.
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Hot areas of interest whose NAIP imagery is fetched into the cube cache, a
+# JSON list of {"place", "buffer_km", "start_date", "end_date"} objects.
+WARMUP_AOIS: list[dict] = json.loads(os.environ.get("WARMUP_AOIS", "[]"))
+
+Component = Callable[[], Awaitable[None]]
+
+
+class Readiness:
+    """Warm-up progress of the components of a worker."""
+
+    def __init__(self, components: list[str]):
+        """Initialize pending components."""
+        self.started = time.monotonic()
+        self.seconds: float | None = None
+        self.components: dict[str, dict] = {
+            name: {"status": "pending"} for name in components
+        }
+
+    @property
+    def ready(self) -> bool:
+        """Whether the warm-up has finished, successfully or not."""
+        return self.seconds is not None
+
+    def report(self) -> dict:
+        """Readiness, and status and duration of each component's warm-up."""
+        failed = any(c["status"] == "error" for c in self.components.values())
+        return {
+            "ready": self.ready,
+            "status": "warming_up"
+            if not self.ready
+            else ("degraded" if failed else "ok"),
+            "seconds": self.seconds,
+            "components": self.components,
+        }
+
+
+async def warm_up(readiness: Readiness, components: dict[str, Component]) -> None:
+    """
+    Warm up components concurrently, recording their status and duration.
+
+    A component failing is logged and reported, the worker still becomes
+    ready: the first requests then pay for what could not be warmed up.
+
+    Args:
+        readiness: Progress to update.
+        components: Warm-up function of each component.
+    """
+
+    async def run(name: str, component: Component) -> None:
+        start = time.monotonic()
+        readiness.components[name] = {"status": "running"}
+        try:
+            await component()
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)
+            readiness.components[name] = {"status": "error", "error": str(e)}
+        else:
+            readiness.components[name] = {"status": "ok"}
+        readiness.components[name]["seconds"] = time.monotonic() - start
+
+    await asyncio.gather(*(run(name, c) for name, c in components.items()))
+    readiness.seconds = time.monotonic() - readiness.started
+    logger.info("Warm-up finished in %.2fs: %s", readiness.seconds, readiness.report())
+
+
+async def warm_up_duckdb() -> None:
+    """Install and load the DuckDB extensions into pooled connections."""
+    await asyncio.to_thread(fill_connection_pool, WARMUP_DB_CONNECTIONS)
+
+
+async def warm_up_stac() -> None:
+    """Open the STAC API client, fetching its landing page."""
+    await asyncio.to_thread(open_catalog)
+
+
+async def warm_up_ollama() -> None:
+    """Load the agent and image models into Ollama, and keep them loaded."""
+    async with httpx.AsyncClient(base_url=OLLAMA_BASE_URL, timeout=300) as client:
+        # A generate request without prompt only loads the model.
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    "/api/generate",
+                    json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+                )
+                for model in {MODEL_NAME, IMAGE_MODEL_NAME}
+            ),
+        )
+    for response in responses:
+        response.raise_for_status()
+
+
+async def warm_up_aois(aois: list[dict] = WARMUP_AOIS) -> None:
+    """
+    Fetch the NAIP imagery of hot AOIs into the cube cache.
+
+    The tools are run like the agent runs them, so that the place lookup,
+    buffer and STAC search give the same AOI, and the same cached cube, as a
+    user asking for it.
+    """
+    for aoi in aois:
+        state = GeoAssistantState(messages=[], place=None, search_area=None)
+        update = await invoke_tool(
+            get_place,
+            {"place_name": aoi["place"]},
+            "place",
+            context=aoi,
+        )
+        state["place"] = update["place"]
+        update = await invoke_tool(
+            get_search_area,
+            {"buffer_size_km": aoi["buffer_km"], "state": state},
+            "search_area",
+            context=aoi,
+        )
+        state["search_area"] = update["search_area"]
+        update = await invoke_tool(
+            fetch_naip_img,
+            {
+                "start_date": aoi["start_date"],
+                "end_date": aoi["end_date"],
+                "state": state,
+            },
+            "naip_cube",
+            context=aoi,
+        )
+        logger.info("Warmed up AOI %s, cube %s", aoi, update["naip_cube"])
+
+
+COMPONENTS: dict[str, Component] = {
+    "duckdb": warm_up_duckdb,
+    "stac": warm_up_stac,
+    "ollama": warm_up_ollama,
+    "aois": warm_up_aois,
+}
+
+
+def configured_components(
+    names: list[str] = WARMUP_COMPONENTS,
+) -> dict[str, Component]:
+    """Warm-up functions of the components configured by WARMUP_COMPONENTS."""
+    unknown = set(names) - set(COMPONENTS)
+    if unknown:
+        raise ValueError(f"Unknown warm-up components {sorted(unknown)}")
+    if not WARMUP_AOIS:
+        names = [name for name in names if name != "aois"]
+    return {name: COMPONENTS[name] for name in names}
@@ -0,0 +1,515 @@
+"""
+Headless batch geoprocessing of sites, without the agent model.
+
+Runs the agent's tools directly for every site of a CSV file: geocode the
+place, buffer it, find the places of a category within the buffer, fetch a
+NAIP chip and optionally summarize it. Each stage has its own bounded pool of
+workers, sites flow from one stage to the next as soon as they are done, and
+results are streamed to JSONL or GeoParquet. The tools' caches (DuckDB
+connections, S3 cache, STAC client, NAIP cubes) are shared by all sites.
+
+    uv run python -m geo_assistant.batch.pipeline sites.csv --output results.jsonl
+
+The CSV has a `place` column, and optionally `site_id`, `buffer_km`,
+`category`, `start_date` and `end_date` columns overriding the command line
+options per site. An interrupted run resumes where it stopped: sites already
+in the output are skipped.
+"""
+
+import argparse
+import asyncio
+import base64
+import csv
+import json
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import geopandas as gpd
+import pandas as pd
+from langchain_core.tools.base import ToolCall
+from shapely.geometry import shape
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.raster.encode import image_mime_type
+from geo_assistant.tools import (
+    fetch_naip_img,
+    get_place,
+    get_places_within_buffer,
+    get_search_area,
+    summarize_sat_img,
+)
+from geo_assistant.tools.invoke import invoke_tool
+
+logger = logging.getLogger(__name__)
+
+# Workers of each stage: I/O bound stages overlap many sites, the NAIP and
+# summary stages are bounded by the raster I/O and the image model.
+STAGE_WORKERS = {"geocode": 4, "buffer": 4, "places": 4, "naip": 2, "summary": 2}
+# Results per GeoParquet part, lost and recomputed if the run is interrupted.
+PARQUET_BATCH_SIZE = 100
+
+
+@dataclass
+class Site:
+    """A site going through the pipeline, its state and results."""
+
+    site_id: str
+    params: dict
+    state: GeoAssistantState = field(
+        default_factory=lambda: GeoAssistantState(
+            messages=[],
+            place=None,
+            search_area=None,
+        ),
+    )
+    result: dict = field(default_factory=dict)
+    error: str | None = None
+    failed_stage: str | None = None
+    started: float = field(default_factory=time.monotonic)
+
+    def record(self) -> dict:
+        """Output record of the site."""
+        place = self.state.get("place")
+        search_area = self.state.get("search_area")
+        return {
+            "site_id": self.site_id,
+            "query": self.params.get("place"),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "failed_stage": self.failed_stage,
+            "name": place.properties.get("name") if place else None,
+            "place": place.geometry.model_dump() if place else None,
+            "search_area": search_area.geometry.model_dump() if search_area else None,
+            "places_count": self.result.get("places_count"),
+            "places": self.result.get("places"),
+            "naip_cube": self.result.get("naip_cube"),
+            "chip": self.result.get("chip"),
+            "summary": self.result.get("summary"),
+            "seconds": time.monotonic() - self.started,
+        }
+
+
+Stage = Callable[[Site], Awaitable[None]]
+
+
+async def geocode(site: Site) -> None:
+    """Find the Overture place of the site."""
+    update = await invoke_tool(get_place, {"place_name": site.params["place"]}, "place")
+    site.state["place"] = update["place"]
+
+
+async def buffer(site: Site) -> None:
+    """Buffer the place of the site."""
+    update = await invoke_tool(
+        get_search_area,
+        {"buffer_size_km": float(site.params["buffer_km"]), "state": site.state},
+        "search_area",
+    )
+    site.state["search_area"] = update["search_area"]
+
+
+async def places(site: Site) -> None:
+    """Find the places of the site's category within its search area."""
+    if not site.params.get("category"):
+        return
+    update = await invoke_tool(
+        get_places_within_buffer,
+        {
+            "place": site.params["category"],
+            "state": site.state,
+            "tool_call_id": f"batch-{site.site_id}",
+        },
+        "places_within_buffer",
+    )
+    collection = update["places_within_buffer"]
+    site.state["places_within_buffer"] = collection
+    site.result["places_count"] = len(collection.features)
+    site.result["places"] = collection.model_dump(exclude_none=True)
+
+
+async def naip(site: Site, chips_dir: Path) -> None:
+    """Fetch the NAIP chip of the site's search area and save it."""
+    if not (site.params.get("start_date") and site.params.get("end_date")):
+        return
+    update = await invoke_tool(
+        fetch_naip_img,
+        {
+            "start_date": site.params["start_date"],
+            "end_date": site.params["end_date"],
+            "state": site.state,
+        },
+        "naip_img_bytes",
+    )
+    site.state["naip_img_bytes"] = update["naip_img_bytes"]
+    site.result["naip_cube"] = update["naip_cube"]
+    extension = image_mime_type(update["naip_img_bytes"]).removeprefix("image/")
+    chip = chips_dir / f"{site.site_id}.{extension}"
+    chip.parent.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(
+        chip.write_bytes,
+        base64.b64decode(update["naip_img_bytes"]),
+    )
+    site.result["chip"] = str(chip)
+
+
+async def summary(site: Site) -> None:
+    """Summarize the NAIP chip of the site with the image model."""
+    if not site.state.get("naip_img_bytes"):
+        return
+    command = await summarize_sat_img.ainvoke(
+        ToolCall(
+            name=summarize_sat_img.name,
+            type="tool_call",
+            id=f"batch-{site.site_id}",
+            args={"state": site.state},
+        ),
+    )
+    site.result["summary"] = command.update["messages"][0].content
+
+
+def default_stages(chips_dir: Path, summarize: bool) -> dict[str, Stage]:
+    """The pipeline's stages, in order."""
+    stages: dict[str, Stage] = {
+        "geocode": geocode,
+        "buffer": buffer,
+        "places": places,
+        "naip": lambda site: naip(site, chips_dir),
+    }
+    if summarize:
+        stages["summary"] = summary
+    return stages
+
+
+class StageStats:
+    """Throughput and durations of a stage."""
+
+    def __init__(self) -> None:
+        """Initialize empty stats."""
+        self.durations: list[float] = []
+        self.errors = 0
+        self.first_start: float | None = None
+        self.last_end: float | None = None
+
+    def record(self, start: float, end: float, error: bool) -> None:
+        """Record a site processed by the stage."""
+        self.durations.append(end - start)
+        self.errors += error
+        self.first_start = min(start, self.first_start or start)
+        self.last_end = max(end, self.last_end or end)
+
+    def stats(self) -> dict:
+        """Sites processed and failed, throughput and duration statistics."""
+        durations = sorted(self.durations)
+        if not durations:
+            return {"sites": 0, "errors": 0}
+        wall = self.last_end - self.first_start
+        return {
+            "sites": len(durations),
+            "errors": self.errors,
+            "sites_per_second": len(durations) / wall if wall > 0 else None,
+            "seconds": {
+                "mean": sum(durations) / len(durations),
+                "p50": durations[len(durations) // 2],
+                "p95": durations[
+                    min(len(durations) - 1, math.ceil(len(durations) * 0.95) - 1)
+                ],
+                "max": durations[-1],
+            },
+        }
+
+
+class JsonlWriter:
+    """Results appended to a JSON Lines file, one line per site."""
+
+    def __init__(self, path: Path):
+        """Append to `path`."""
+        self.path = path
+
+    def done(self, retry_errors: bool = False) -> set[str]:
+        """Ids of the sites already in the output, but failed ones to retry."""
+        if not self.path.exists():
+            return set()
+        statuses = {}
+        with self.path.open() as f:
+            for line in f:
+                # A run killed mid-write leaves a truncated last line.
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                statuses[record["site_id"]] = record["status"]
+        return {
+            site_id
+            for site_id, status in statuses.items()
+            if status == "ok" or not retry_errors
+        }
+
+    def __enter__(self) -> "JsonlWriter":
+        """Open the file for appending."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        truncated = False
+        if self.path.exists() and self.path.stat().st_size:
+            with self.path.open("rb") as f:
+                f.seek(-1, 2)
+                truncated = f.read(1) != b"\n"
+        self._file = self.path.open("a")
+        # End the truncated last line of an interrupted run.
+        if truncated:
+            self._file.write("\n")
+        return self
+
+    def write(self, record: dict) -> None:
+        """Write and flush the record of a site."""
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class GeoParquetWriter:
+    """
+    Results written to a directory of GeoParquet parts.
+
+    The place is the primary geometry column, the search area a second one,
+    and the places found are GeoJSON strings. Resumed runs add new parts.
+    """
+
+    def __init__(self, path: Path, batch_size: int = PARQUET_BATCH_SIZE):
+        """Write parts of `batch_size` sites to the directory `path`."""
+        self.path = path
+        self.batch_size = batch_size
+        self._records: list[dict] = []
+
+    def done(self, retry_errors: bool = False) -> set[str]:
+        """Ids of the sites already in the output, but failed ones to retry."""
+        parts = sorted(self.path.glob("part-*.parquet"))
+        if not parts:
+            return set()
+        done = pd.concat(
+            [pd.read_parquet(part, columns=["site_id", "status"]) for part in parts],
+        ).drop_duplicates("site_id", keep="last")
+        if retry_errors:
+            done = done[done["status"] == "ok"]
+        return set(done["site_id"])
+
+    def __enter__(self) -> "GeoParquetWriter":
+        """Create the directory."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._part = len(list(self.path.glob("part-*.parquet")))
+        return self
+
+    def write(self, record: dict) -> None:
+        """Buffer the record of a site, writing a part when the batch is full."""
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._records:
+            return
+        df = pd.DataFrame(self._records)
+        df["places"] = [
+            json.dumps(places) if places is not None else None
+            for places in df["places"]
+        ]
+        gdf = gpd.GeoDataFrame(
+            df.drop(columns=["place", "search_area"]),
+            geometry=gpd.GeoSeries(_shapes(df["place"]), crs="EPSG:4326"),
+        )
+        gdf["search_area"] = gpd.GeoSeries(_shapes(df["search_area"]), crs="EPSG:4326")
+        gdf.to_parquet(self.path / f"part-{self._part:05d}.parquet")
+        self._part += 1
+        self._records = []
+
+    def __exit__(self, *exc_info) -> None:
+        """Write the last, partial, batch."""
+        self._flush()
+
+
+def _shapes(geometries: Iterable[dict | None]) -> list:
+    return [shape(g) if g is not None else None for g in geometries]
+
+
+def read_sites(path: Path, defaults: dict) -> list[Site]:
+    """Sites of a CSV file, missing parameters taken from `defaults`."""
+    with path.open(newline="") as f:
+        rows = list(csv.DictReader(f))
+    return [
+        Site(
+            site_id=str(row.get("site_id") or i),
+            params=defaults | {key: value for key, value in row.items() if value},
+        )
+        for i, row in enumerate(rows, start=1)
+    ]
+
+
+async def run_batch(
+    sites: list[Site],
+    writer: JsonlWriter | GeoParquetWriter,
+    stages: dict[str, Stage],
+    workers: dict[str, int] = STAGE_WORKERS,
+    retry_errors: bool = False,
+) -> dict[str, dict]:
+    """
+    Run the stages for every site not yet in the output, streaming results.
+
+    Each stage runs `workers[stage]` sites at a time, and hands every site to
+    the next stage as soon as it is done. A site failing a stage skips the
+    next ones and is written with the error.
+
+    Args:
+        sites: Sites to process.
+        writer: Output of the results.
+        stages: Stage functions, in order.
+        workers: Concurrent sites per stage.
+        retry_errors: Process again the sites that failed in a previous run.
+
+    Returns:
+        Statistics of each stage.
+    """
+    done = writer.done(retry_errors)
+    pending = [site for site in sites if site.site_id not in done]
+    logger.info("%d sites to process, %d already done", len(pending), len(done))
+
+    stats = {name: StageStats() for name in stages}
+    # Bounded queues hold back the earlier stages when the later ones are slower.
+    queues = [asyncio.Queue(maxsize=2 * workers.get(name, 1)) for name in stages] + [
+        asyncio.Queue(maxsize=1),
+    ]
+
+    async def work(name: str, stage: Stage, inbox, outbox) -> None:
+        while (site := await inbox.get()) is not None:
+            if site.error is None:
+                start = time.monotonic()
+                try:
+                    await stage(site)
+                except Exception as e:
+                    logger.warning("Site %s failed %s: %s", site.site_id, name, e)
+                    site.error, site.failed_stage = str(e) or repr(e), name
+                stats[name].record(start, time.monotonic(), site.error is not None)
+            await outbox.put(site)
+
+    async def feed() -> None:
+        for site in pending:
+            await queues[0].put(site)
+            site.started = time.monotonic()
+
+    async def write() -> None:
+        while (site := await queues[-1].get()) is not None:
+            writer.write(site.record())
+
+    with writer:
+        writing = asyncio.create_task(write())
+        stage_workers = [
+            [
+                asyncio.create_task(work(name, stage, queues[i], queues[i + 1]))
+                for _ in range(workers.get(name, 1))
+            ]
+            for i, (name, stage) in enumerate(stages.items())
+        ]
+        await feed()
+        # Stop each stage's workers once it has received every site.
+        for i, tasks in enumerate(stage_workers):
+            for _ in tasks:
+                await queues[i].put(None)
+            await asyncio.gather(*tasks)
+        await queues[-1].put(None)
+        await writing
+    return {name: stage_stats.stats() for name, stage_stats in stats.items()}
+
+
+def _parse_workers(values: list[str]) -> dict[str, int]:
+    workers = dict(STAGE_WORKERS)
+    for value in values:
+        name, _, count = value.partition("=")
+        if name not in STAGE_WORKERS or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid stage workers {value!r}")
+        workers[name] = int(count)
+    return workers
+
+
+def main() -> None:
+    """Run the batch pipeline from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Geocode, buffer, find places and fetch NAIP chips of sites.",
+    )
+    parser.add_argument("sites", type=Path, help="CSV file of sites")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="JSONL file (.jsonl) or directory of GeoParquet parts",
+    )
+    parser.add_argument("--buffer-km", type=float, default=1.0)
+    parser.add_argument("--category", help="category of places to find")
+    parser.add_argument("--start-date", help="start of the NAIP date range")
+    parser.add_argument("--end-date", help="end of the NAIP date range")
+    parser.add_argument(
+        "--summarize",
+        action="store_true",
+        help="summarize the NAIP chips with the image model",
+    )
+    parser.add_argument(
+        "--chips",
+        type=Path,
+        help="directory of the NAIP chips (default: <output>_chips)",
+    )
+    parser.add_argument(
+        "--workers",
+        nargs="*",
+        default=[],
+        metavar="STAGE=N",
+        help=f"concurrent sites per stage (default: {STAGE_WORKERS})",
+    )
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help="process again the sites that failed in a previous run",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    defaults: dict[str, Any] = {
+        "buffer_km": args.buffer_km,
+        "category": args.category,
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+    }
+    writer = (
+        JsonlWriter(args.output)
+        if args.output.suffix == ".jsonl"
+        else GeoParquetWriter(args.output)
+    )
+    chips_dir = args.chips or args.output.with_name(f"{args.output.stem}_chips")
+    stats = asyncio.run(
+        run_batch(
+            read_sites(args.sites, defaults),
+            writer,
+            default_stages(chips_dir, args.summarize),
+            _parse_workers(args.workers),
+            args.retry_errors,
+        ),
+    )
+
+    print(
+        f"{'stage':>8} {'sites':>6} {'errors':>6} {'sites/s':>8} {'p50':>7} {'p95':>7}",
+    )
+    for name, stage in stats.items():
+        if not stage["sites"]:
+            continue
+        rate = stage["sites_per_second"] or 0
+        print(
+            f"{name:>8} {stage['sites']:>6} {stage['errors']:>6} {rate:>8.2f} "
+            f"{stage['seconds']['p50']:>6.2f}s {stage['seconds']['p95']:>6.2f}s",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,13 @@
 
 import base64
 import json
+import math
 import os
 import uuid
 
 import folium
 import httpx
+import shapely
 import streamlit as st
 import streamlit.components.v1 as components
 from dotenv import load_dotenv
@@ -17,6 +19,13 @@ load_dotenv()
 # API configuration
 API_BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8000")
 
+# Colors of the map layers per state field
+LAYER_COLORS = {
+    "place": "blue",
+    "search_area": "red",
+    "places_within_buffer": "green",
+}
+
 st.set_page_config(page_title="Geo Assistant", page_icon="💬")
 
 st.title("Geo Assistant")
@@ -26,6 +35,101 @@ if "thread_id" not in st.session_state:
     st.session_state.thread_id = str(uuid.uuid4())
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "search_area_bounds" not in st.session_state:
+    # Bounds of the last search area, to frame NAIP tiles streamed without it
+    st.session_state.search_area_bounds = None
+
+
+@st.cache_data(max_entries=32)
+def decode_image(img_base64: str) -> bytes:
+    """Decode a base 64 image, cached by content."""
+    return base64.b64decode(img_base64)
+
+
+def _layer_features(layer: dict) -> list[dict]:
+    """Features of a GeoJSON Feature or FeatureCollection."""
+    if layer.get("type") == "FeatureCollection":
+        return layer.get("features", [])
+    return [layer]
+
+
+def layers_bounds(layers: dict[str, dict]) -> list[list[float]] | None:
+    """[[south, west], [north, east]] bounds of GeoJSON layers, None if empty."""
+    if not layers:
+        return None
+    # Parsed and reduced in shapely's C code, FeatureCollections become
+    # GeometryCollections.
+    geometries = shapely.from_geojson([json.dumps(layer) for layer in layers.values()])
+    west, south, east, north = shapely.total_bounds(geometries).tolist()
+    if math.isnan(west):
+        return None
+    return [[south, west], [north, east]]
+
+
+def _style_function(color: str):
+    """Create a style function with the given color."""
+    return lambda x: {
+        "fillColor": color,
+        "color": color,
+        "weight": 2,
+        "fillOpacity": 0.3,
+    }
+
+
+@st.cache_data(max_entries=32)
+def render_map_html(
+    layers_json: str,
+    naip_cube: str | None,
+    fallback_bounds: list[list[float]] | None = None,
+) -> str:
+    """
+    Render GeoJSON layers and NAIP tiles as a folium map.
+
+    Cached by content: `layers_json` is the canonical JSON of the layers, so
+    re-rendering an unchanged map is a lookup. The map is fitted to the layers,
+    or to `fallback_bounds` without any, e.g. the search area of NAIP tiles.
+    """
+    layers = json.loads(layers_json)
+    bounds = layers_bounds(layers) or fallback_bounds
+    if bounds:
+        (south, west), (north, east) = bounds
+        center = [(south + north) / 2, (west + east) / 2]
+    else:
+        center = [0.0, 0.0]
+
+    m = folium.Map(location=center, zoom_start=10)
+
+    if naip_cube:
+        # Served as XYZ tiles by the API, only the viewed tiles are fetched
+        folium.TileLayer(
+            tiles=f"{API_BASE_URL}/tiles/{{z}}/{{x}}/{{y}}?cube={naip_cube}",
+            attr="NAIP imagery, Microsoft Planetary Computer",
+            name="NAIP",
+            overlay=True,
+            max_zoom=22,
+        ).add_to(m)
+
+    # One GeoJSON layer per state field, with different colors
+    for key, layer in layers.items():
+        features = _layer_features(layer)
+        if layer.get("type") == "FeatureCollection" and all(
+            "name" in (feature.get("properties") or {}) for feature in features
+        ):
+            # Show the name of each feature of FeatureCollections
+            tooltip = folium.GeoJsonTooltip(fields=["name"], labels=False)
+        else:
+            tooltip = key
+        folium.GeoJson(
+            layer,
+            style_function=_style_function(LAYER_COLORS.get(key, "purple")),
+            tooltip=tooltip,
+        ).add_to(m)
+
+    # Fit map to bounds if we have coordinates
+    if bounds:
+        m.fit_bounds(bounds)
+
+    return m._repr_html_()
 
 
 def stream_chat(user_message: str):
@@ -42,10 +146,16 @@ def stream_chat(user_message: str):
         },
     }
 
+    # Map layers accumulated over the turn, the map is rendered once at the end
+    geojson_layers = {}
+    naip_cube = None
+
     with httpx.stream(
         "POST",
         f"{API_BASE_URL}/chat",
         json=request_body,
+        # Decoded incrementally by httpx, zstd needs the zstandard package.
+        headers={"Accept-Encoding": "zstd, gzip"},
         timeout=360.0,
     ) as response:
         response.raise_for_status()
@@ -66,19 +176,28 @@ def stream_chat(user_message: str):
                 with st.chat_message(msg_type):
                     st.markdown(content)
 
-            # Check for GeoJSON features and render map if present
-            geojson_features = {}
             for key, value in state.items():
                 if (
                     value
                     and isinstance(value, dict)
                     and value.get("type") in ["Feature", "FeatureCollection"]
                 ):
-                    geojson_features[key] = value
+                    geojson_layers[key] = value
+                    if key == "search_area":
+                        st.session_state.search_area_bounds = layers_bounds(
+                            {key: value},
+                        )
+                elif value and key == "naip_cube":
+                    naip_cube = value
+                elif value and key == "places_export":
+                    with st.chat_message("tool"):
+                        st.markdown(
+                            f"[Download the places as GeoParquet]({API_BASE_URL}{value})",
+                        )
                 elif value and isinstance(value, str) and key == "naip_img_bytes":
-                    # Handle base64-encoded jpeg data
+                    # Handle base64-encoded image data
                     try:
-                        img_bytes = base64.b64decode(value)
+                        img_bytes = decode_image(value)
                         with st.chat_message("tool"):
                             st.image(img_bytes)
                     except Exception:
@@ -89,104 +208,17 @@ def stream_chat(user_message: str):
                     with st.chat_message("tool"):
                         st.code(json.dumps(value, indent=2), language="json")
 
-            # Render map if GeoJSON features are present
-            if geojson_features:
-                # Helper function to extract coordinates from geometry
-                def get_coords_from_geometry(geom):
-                    """Extract all coordinates from a GeoJSON geometry."""
-                    geom_type = geom.get("type", "")
-                    coords = geom.get("coordinates", [])
-
-                    if geom_type == "Point":
-                        return [coords]
-                    elif geom_type == "LineString":
-                        return coords
-                    elif geom_type == "Polygon":
-                        return coords[0] if coords else []
-                    elif geom_type == "MultiPoint":
-                        return coords
-                    elif geom_type == "MultiLineString":
-                        return [c for line in coords for c in line]
-                    elif geom_type == "MultiPolygon":
-                        return [c for poly in coords for c in poly[0]] if coords else []
-                    return []
-
-                # Calculate center from all features
-                all_lons, all_lats = [], []
-                for feature_data in geojson_features.values():
-                    # Handle both Feature and FeatureCollection
-                    if feature_data.get("type") == "FeatureCollection":
-                        features = feature_data.get("features", [])
-                    else:
-                        features = [feature_data]
-
-                    for feature in features:
-                        geom = feature.get("geometry", {})
-                        coords = get_coords_from_geometry(geom)
-                        for coord in coords:
-                            if len(coord) >= 2:
-                                all_lons.append(coord[0])
-                                all_lats.append(coord[1])
-
-                if all_lons and all_lats:
-                    center_lat = sum(all_lats) / len(all_lats)
-                    center_lon = sum(all_lons) / len(all_lons)
-                else:
-                    center_lat, center_lon = 0.0, 0.0
-
-                m = folium.Map(location=[center_lat, center_lon], zoom_start=10)
-
-                # Add features to map with different colors
-                colors = {
-                    "place": "blue",
-                    "search_area": "red",
-                    "places_within_buffer": "green",
-                }
-
-                def make_style_function(color):
-                    """Create a style function with the given color."""
-                    return lambda x: {
-                        "fillColor": color,
-                        "color": color,
-                        "weight": 2,
-                        "fillOpacity": 0.3,
-                    }
-
-                for key, feature_data in geojson_features.items():
-                    color = colors.get(key, "purple")
-
-                    # Handle both Feature and FeatureCollection
-                    if feature_data.get("type") == "FeatureCollection":
-                        # For FeatureCollections, add each feature with a popup showing its name
-                        for feature in feature_data.get("features", []):
-                            name = feature.get("properties", {}).get("name", key)
-                            folium.GeoJson(
-                                feature,
-                                style_function=make_style_function(color),
-                                tooltip=name,
-                            ).add_to(m)
-                    else:
-                        # For single Features
-                        folium.GeoJson(
-                            feature_data,
-                            style_function=make_style_function(color),
-                            tooltip=key,
-                        ).add_to(m)
-
-                # Fit map to bounds if we have coordinates
-                if all_lons and all_lats:
-                    m.fit_bounds(
-                        [
-                            [min(all_lats), min(all_lons)],
-                            [max(all_lats), max(all_lons)],
-                        ],
-                    )
-
-                # Display the map
-                with st.chat_message("tool"):
-                    st.markdown("**Map View**")
-                    map_html = m._repr_html_()
-                    components.html(map_html, height=400)
+    # Render the map once per turn if GeoJSON features or NAIP tiles are present
+    if geojson_layers or naip_cube:
+        map_html = render_map_html(
+            json.dumps(geojson_layers, sort_keys=True),
+            naip_cube,
+            # NAIP imagery covers the search area it was fetched for
+            st.session_state.search_area_bounds,
+        )
+        with st.chat_message("tool"):
+            st.markdown("**Map View**")
+            components.html(map_html, height=400)
 
 
 if prompt := st.chat_input("Type your message..."):
@@ -0,0 +1,250 @@
+"""Contrast stretch and image encoding for raster outputs."""
+
+import base64
+import math
+import os
+from io import BytesIO
+from typing import Literal
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image, UnidentifiedImageError
+
+load_dotenv()
+
+ImageFormat = Literal["jpeg", "webp", "png"]
+
+IMAGE_FORMAT: ImageFormat = os.environ.get("NAIP_IMAGE_FORMAT", "jpeg").lower()  # type: ignore[assignment]
+IMAGE_QUALITY = int(os.environ.get("NAIP_IMAGE_QUALITY", "75"))
+
+# Number of pixels sampled to estimate the contrast stretch limits.
+STRETCH_SAMPLE_PIXELS = 1_000_000
+# Number of raster values converted through the lookup table at once.
+LUT_BLOCK_SIZE = 1 << 20
+# Base 64 characters decoded to read the size of an encoded image, enough for
+# the headers written by `encode_image`.
+_HEADER_CHARS = 4096
+
+_MIME_TYPES: dict[ImageFormat, str] = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def _strided_sample(arr: np.ndarray, max_pixels: int) -> np.ndarray:
+    """Strided view of a (y, x, ...) array with at most ~`max_pixels` pixels."""
+    h, w = arr.shape[:2]
+    step = max(1, math.ceil(math.sqrt(h * w / max_pixels)))
+    return arr[::step, ::step]
+
+
+def histogram_stretch_limits(
+    hist: np.ndarray,
+    low: float = 2.0,
+    high: float = 98.0,
+) -> tuple[float, float]:
+    """
+    Robust min/max for a contrast stretch from a histogram of integer values.
+
+    Args:
+        hist: Counts of each value, `hist[v]` being the number of pixels equal to v.
+        low: Lower percentile.
+        high: Upper percentile.
+
+    Returns:
+        The (vmin, vmax) stretch limits.
+    """
+    cdf = np.cumsum(hist)
+    total = cdf[-1]
+    if total == 0:
+        return 0.0, 0.0
+    vmin = float(np.searchsorted(cdf, total * low / 100))
+    vmax = float(np.searchsorted(cdf, total * high / 100))
+    if vmax <= vmin:
+        nonzero = np.flatnonzero(hist)
+        vmin, vmax = float(nonzero[0]), float(nonzero[-1])
+    return vmin, vmax
+
+
+def stretch_limits(
+    arr: np.ndarray,
+    low: float = 2.0,
+    high: float = 98.0,
+    max_pixels: int = STRETCH_SAMPLE_PIXELS,
+) -> tuple[float, float]:
+    """
+    Robust min/max for a contrast stretch, avoiding hot pixels blowing it out.
+
+    Integer rasters of up to 16 bits are summarized with a histogram, other
+    rasters with percentiles. Both run on a strided sample of the pixels
+    instead of a full float copy of the array.
+
+    Args:
+        arr: Raster of shape (y, x) or (y, x, band).
+        low: Lower percentile.
+        high: Upper percentile.
+        max_pixels: Maximum number of pixels to sample.
+
+    Returns:
+        The (vmin, vmax) stretch limits.
+    """
+    sample = _strided_sample(arr, max_pixels)
+
+    if sample.dtype.kind == "u" and sample.dtype.itemsize <= 2:
+        hist = np.bincount(sample.ravel(), minlength=1 << (8 * sample.dtype.itemsize))
+        return histogram_stretch_limits(hist, low, high)
+
+    vmin, vmax = np.nanpercentile(sample, [low, high])
+    if vmax <= vmin:
+        vmin, vmax = np.nanmin(sample), np.nanmax(sample)
+    return float(vmin), float(vmax)
+
+
+def stretch_to_uint8(arr: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    """
+    Linearly stretch `arr` between `vmin` and `vmax` into uint8.
+
+    Integer rasters of up to 16 bits go through a lookup table, uint8 rasters
+    are converted in place. Float32 rasters are scaled in place.
+
+    Args:
+        arr: Raster of shape (y, x) or (y, x, band).
+        vmin: Value mapped to 0.
+        vmax: Value mapped to 255.
+
+    Returns:
+        The stretched uint8 raster. Shares memory with `arr` when possible.
+    """
+    scale = 255 / (vmax - vmin + 1e-6)
+
+    if arr.dtype.kind == "u" and arr.dtype.itemsize <= 2:
+        values = np.arange(1 << (8 * arr.dtype.itemsize), dtype="float32")
+        lut = np.clip((values - vmin) * scale, 0, 255).astype("uint8")
+        inplace = arr.dtype == np.uint8 and arr.flags.writeable
+        out = arr if inplace else np.empty(arr.shape, dtype="uint8")
+        # np.take casts the indices to intp, apply the table in row blocks to
+        # keep that temporary small.
+        rows = max(1, LUT_BLOCK_SIZE // max(1, arr[:1].size))
+        for start in range(0, arr.shape[0], rows):
+            block = slice(start, start + rows)
+            np.take(lut, arr[block], out=out[block], mode="clip")
+        return out
+
+    if arr.dtype != np.float32 or not arr.flags.writeable:
+        arr = arr.astype("float32")
+    np.subtract(arr, vmin, out=arr)
+    np.multiply(arr, scale, out=arr)
+    np.clip(arr, 0, 255, out=arr)
+    np.nan_to_num(arr, copy=False, nan=0.0)
+    return arr.astype("uint8")
+
+
+def encode_image(
+    arr: np.ndarray,
+    format: ImageFormat = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> bytes:
+    """
+    Encode a uint8 raster of shape (y, x) or (y, x, 3) as an image.
+
+    PNG and WebP also accept (y, x, 4) RGBA rasters.
+
+    Args:
+        arr: uint8 raster.
+        format: Output format, one of 'jpeg', 'webp' or 'png'.
+        quality: Quality of lossy formats (1-100). Ignored for PNG.
+
+    Returns:
+        The encoded image bytes.
+    """
+    if format not in _MIME_TYPES:
+        raise ValueError(f"Unsupported image format {format!r}")
+
+    buf = BytesIO()
+    if format == "png":
+        Image.fromarray(arr).save(buf, format="png")
+    else:
+        Image.fromarray(arr).save(buf, format=format, quality=quality)
+    return buf.getvalue()
+
+
+def image_mime_type(img_base64: str) -> str:
+    """Sniff the MIME type of a base 64 encoded image, defaulting to JPEG."""
+    header = base64.b64decode(img_base64[:16])
+    if header.startswith(b"\x89PNG"):
+        return _MIME_TYPES["png"]
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return _MIME_TYPES["webp"]
+    return _MIME_TYPES["jpeg"]
+
+
+def image_size(img_base64: str) -> tuple[int, int] | None:
+    """
+    Width and height of a base 64 encoded image, from its headers only.
+
+    Returns None if the size is not in the first bytes of the image, which is
+    always the case for WebP images, read whole by Pillow.
+    """
+    header = base64.b64decode(img_base64[: _HEADER_CHARS - _HEADER_CHARS % 4])
+    try:
+        with Image.open(BytesIO(header)) as img:
+            return img.size
+    except (OSError, UnidentifiedImageError):
+        return None
+
+
+def resize_to_fit(arr: np.ndarray, max_size: int) -> np.ndarray:
+    """
+    Resize a uint8 raster to at most `max_size` pixels on its longest side.
+
+    Args:
+        arr: uint8 raster of shape (y, x) or (y, x, band).
+        max_size: Maximum width and height.
+
+    Returns:
+        The resized raster, `arr` itself if it fits already.
+    """
+    height, width = arr.shape[:2]
+    scale = max_size / max(width, height)
+    if scale >= 1:
+        return arr
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # reducing_gap first shrinks by an integer factor with a box filter, which
+    # is much faster than a bilinear pass over the whole raster.
+    img = Image.fromarray(arr).resize(
+        size,
+        Image.Resampling.BILINEAR,
+        reducing_gap=2.0,
+    )
+    return np.asarray(img)
+
+
+def fit_image(
+    data: bytes,
+    max_size: int,
+    format: ImageFormat = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> bytes:
+    """
+    Shrink an encoded image to at most `max_size` pixels on its longest side.
+
+    JPEG images are decoded at a reduced DCT scale when possible, so large
+    images are never decoded at full resolution.
+
+    Args:
+        data: Encoded image bytes.
+        max_size: Maximum width and height.
+        format: Output format of resized images.
+        quality: Quality of lossy formats (1-100).
+
+    Returns:
+        The re-encoded image, `data` itself if it fits already.
+    """
+    with Image.open(BytesIO(data)) as img:
+        if max(img.size) <= max_size:
+            return data
+        if img.format == "JPEG":
+            img.draft("RGB", (max_size, max_size))
+        arr = np.asarray(img.convert("RGB"))
+    return encode_image(resize_to_fit(arr, max_size), format=format, quality=quality)
@@ -0,0 +1,122 @@
+"""Process-wide runtime of the raster reads: shared thread pool and GDAL options."""
+
+import concurrent.futures
+import functools
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from odc.stac import configure_rio
+
+load_dotenv()
+
+# Threads reading COG chunks, shared by every load of the process. GDAL keeps
+# its HTTP connections per thread, so long-lived threads reuse them.
+RASTER_IO_WORKERS = int(os.environ.get("RASTER_IO_WORKERS", "8"))
+
+# GDAL configuration of every stac_load, each overridden by the environment
+# variable of the same name. odc-stac adds its retry defaults
+# (GDAL_HTTP_MAX_RETRY, GDAL_HTTP_RETRY_DELAY).
+_GDAL_DEFAULTS = {
+    # Block cache in MB.
+    "GDAL_CACHEMAX": "256",
+    # Open COGs without listing their directory, fetch the header in one request.
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_INGESTED_BYTES_AT_OPEN": "32768",
+    # Several requests over one HTTP/2 connection where the server supports it,
+    # HTTP/2 is only negotiated over TLS.
+    "GDAL_HTTP_VERSION": "2TLS",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_TCP_KEEPALIVE": "YES",
+    # Read adjacent tiles with one range request.
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    # Per file cache of the header and metadata reads, in bytes.
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": "25000000",
+    # Process-wide cache of the downloaded byte ranges, in bytes.
+    "CPL_VSIL_CURL_CACHE_SIZE": "200000000",
+}
+GDAL_OPTIONS = {
+    key: os.environ.get(key, value) for key, value in _GDAL_DEFAULTS.items()
+}
+# rasterio sets the block cache size in bytes.
+GDAL_OPTIONS["GDAL_CACHEMAX"] = int(GDAL_OPTIONS["GDAL_CACHEMAX"]) * 2**20
+
+
+@functools.cache
+def configure_raster_io() -> None:
+    """
+    Apply GDAL_OPTIONS to the raster reads of odc-stac, once per process.
+
+    The options are captured by every stac_load, eager or dask-chunked.
+    """
+    configure_rio(cloud_defaults=True, **GDAL_OPTIONS)
+
+
+@functools.cache
+def raster_executor() -> ThreadPoolExecutor:
+    """The thread pool shared by the raster reads of the process."""
+    return ThreadPoolExecutor(
+        max_workers=RASTER_IO_WORKERS,
+        thread_name_prefix="raster-io",
+    )
+
+
+class LoadExecutor(Executor):
+    """
+    Executor of a single load, running its reads on the shared thread pool.
+
+    Shutting it down waits for or cancels the reads of this load only, the
+    shared pool keeps running.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor) -> None:
+        """Initialize a load running on `pool`."""
+        self._pool = pool
+        self._futures: set[Future] = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit[T](
+        self,
+        fn: Callable[..., T],
+        /,
+        *args: object,
+        **kwargs: object,
+    ) -> Future[T]:
+        """Submit a read of this load to the shared pool."""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = self._pool.submit(fn, *args, **kwargs)
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """
+        Stop accepting reads of this load.
+
+        Args:
+            wait: Wait for the submitted reads to complete.
+            cancel_futures: Cancel the submitted reads that have not started.
+        """
+        with self._lock:
+            self._shutdown = True
+            futures = list(self._futures)
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+        if wait:
+            concurrent.futures.wait(futures)
+
+
+def load_executor() -> LoadExecutor:
+    """An executor for one load on the shared raster thread pool."""
+    return LoadExecutor(raster_executor())
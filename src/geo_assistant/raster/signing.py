@@ -0,0 +1,152 @@
+"""
+Signing of Planetary Computer assets with cached SAS tokens.
+
+The blob storage of the Planetary Computer is read with a SAS token appended
+to the asset URLs. Tokens are requested per collection from the SAS token
+service, kept until shortly before they expire and refreshed in the background
+once they get close to it, so that items are signed locally without a round
+trip to the token service per load.
+"""
+
+import functools
+import logging
+import os
+import threading
+from urllib.parse import urlparse
+
+import httpx
+from dotenv import load_dotenv
+from planetary_computer.sas import BLOB_STORAGE_DOMAIN, SASToken
+from pystac import Item
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# SAS token service, tokens are requested from `{PC_SAS_URL}/{collection}`.
+# Point it to a local stand-in to run without the Planetary Computer.
+SAS_URL = os.environ.get(
+    "PC_SAS_URL",
+    "https://planetarycomputer.microsoft.com/api/sas/v1/token",
+)
+# Optional subscription key, for higher rate limits of the token service.
+SUBSCRIPTION_KEY = os.environ.get("PC_SDK_SUBSCRIPTION_KEY")
+# Tokens with less time left are refreshed in the background, the cached one
+# is used in the meantime.
+SAS_REFRESH_SECONDS = float(os.environ.get("PC_SAS_REFRESH_SECONDS", "600"))
+
+# Tokens with less time left are not used, a new one is requested first.
+_MIN_TTL = 60
+
+
+class TokenCache:
+    """SAS tokens per collection, refreshed before they expire."""
+
+    def __init__(
+        self,
+        sas_url: str = SAS_URL,
+        subscription_key: str | None = SUBSCRIPTION_KEY,
+        refresh_seconds: float = SAS_REFRESH_SECONDS,
+    ) -> None:
+        """
+        Initialize an empty cache.
+
+        Args:
+            sas_url: SAS token service.
+            subscription_key: Planetary Computer subscription key, if any.
+            refresh_seconds: Time left on a token below which it is refreshed
+                in the background.
+        """
+        self.sas_url = sas_url.rstrip("/")
+        self.refresh_seconds = refresh_seconds
+        headers = (
+            {"Ocp-Apim-Subscription-Key": subscription_key} if subscription_key else {}
+        )
+        self.client = httpx.Client(
+            timeout=30,
+            headers=headers,
+            transport=httpx.HTTPTransport(retries=3),
+        )
+        self._tokens: dict[str, SASToken] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        # Serializes the blocking requests, so that concurrent loads of a
+        # collection without a token wait for a single one.
+        self._fetch_lock = threading.Lock()
+
+    def _fetch(self, collection: str) -> SASToken:
+        response = self.client.get(f"{self.sas_url}/{collection}")
+        response.raise_for_status()
+        token = SASToken(**response.json())
+        with self._lock:
+            self._tokens[collection] = token
+        return token
+
+    def _refresh(self, collection: str) -> None:
+        try:
+            self._fetch(collection)
+        except httpx.HTTPError:
+            # The cached token is still valid, the next use tries again.
+            logger.warning(
+                "Could not refresh the SAS token of %s",
+                collection,
+                exc_info=True,
+            )
+        finally:
+            with self._lock:
+                self._refreshing.discard(collection)
+
+    def token(self, collection: str) -> SASToken:
+        """
+        A valid SAS token of a collection.
+
+        The cached token is returned unless it is missing or about to expire. If
+        it gets close to expiry, a new one is requested in the background.
+        """
+        with self._lock:
+            token = self._tokens.get(collection)
+        if token is None or token.ttl() < _MIN_TTL:
+            with self._fetch_lock:
+                with self._lock:
+                    token = self._tokens.get(collection)
+                if token is None or token.ttl() < _MIN_TTL:
+                    token = self._fetch(collection)
+            return token
+
+        with self._lock:
+            refresh = (
+                token.ttl() < self.refresh_seconds
+                and collection not in self._refreshing
+            )
+            if refresh:
+                self._refreshing.add(collection)
+        if refresh:
+            threading.Thread(
+                target=self._refresh,
+                args=(collection,),
+                name=f"sas-refresh-{collection}",
+                daemon=True,
+            ).start()
+        return token
+
+    def sign_items(self, items: list[Item], collection: str) -> list[Item]:
+        """
+        Sign the blob storage assets of items of a collection, in place.
+
+        Assets outside of the blob storage, or signed already, are left as is.
+        """
+        if not items:
+            return items
+        token = self.token(collection)
+        for item in items:
+            for asset in item.assets.values():
+                url = urlparse(asset.href)
+                if url.netloc.endswith(BLOB_STORAGE_DOMAIN) and not url.query:
+                    asset.href = token.sign(asset.href).href
+        return items
+
+
+@functools.cache
+def token_cache() -> TokenCache:
+    """The SAS token cache of the process."""
+    return TokenCache()
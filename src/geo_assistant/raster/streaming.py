@@ -0,0 +1,346 @@
+"""Chunked, memory-bounded processing of dask-backed raster cubes."""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import CancelledError
+from pathlib import Path
+
+import dask
+import numpy as np
+import rasterio
+import xarray as xr
+from dotenv import load_dotenv
+from odc.geo.geobox import GeoBox
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from geo_assistant.raster.encode import histogram_stretch_limits
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Size in pixels of the square dask chunks the cube is loaded and written in.
+CHUNK_SIZE = int(os.environ.get("NAIP_CHUNK_SIZE", "2048"))
+# Number of chunks loaded at the same time. Peak memory is roughly
+# PARALLEL_CHUNKS * CHUNK_SIZE**2 * bands bytes for uint8 cubes.
+PARALLEL_CHUNKS = int(os.environ.get("NAIP_PARALLEL_CHUNKS", "4"))
+CACHE_DIR = Path(os.environ.get("NAIP_CACHE_DIR", "data/naip"))
+# Size of the cached cubes beyond which the least recently used are removed.
+CACHE_MAX_MB = float(os.environ.get("NAIP_CACHE_MAX_MB", "4096"))
+
+# GeoTIFF tags holding the contrast stretch limits of a cached cube.
+STRETCH_MIN_TAG = "STRETCH_MIN"
+STRETCH_MAX_TAG = "STRETCH_MAX"
+
+_BLOCK_SIZE = 512
+_OVERVIEW_FACTORS = [2, 4, 8, 16, 32, 64]
+
+# Number of in-memory cubes kept until their first tile request, see
+# `defer_cube`.
+DEFERRED_CUBES_MAX = 32
+_DEFERRED_CUBES: OrderedDict[Path, tuple[xr.DataArray, GeoBox]] = OrderedDict()
+_DEFERRED_LOCK = threading.Lock()
+# Called with the path of every evicted cube, see `on_evict`.
+_EVICTION_CALLBACKS: list[Callable[[Path], None]] = []
+
+
+def cube_path(cube_id: str) -> Path:
+    """Path of the cached GeoTIFF of a cube id."""
+    return CACHE_DIR / f"{cube_id}.tif"
+
+
+def cube_cache_path(item_ids: list[str], geobox: GeoBox) -> Path:
+    """Path of the cached GeoTIFF for items loaded on a geobox."""
+    key = "|".join([*item_ids, str(geobox.crs), repr(geobox.affine), str(geobox.shape)])
+    return cube_path(hashlib.sha1(key.encode()).hexdigest())
+
+
+def on_evict(callback: Callable[[Path], None]) -> None:
+    """Call `callback` with the path of each cube evicted, e.g. to drop its tiles."""
+    _EVICTION_CALLBACKS.append(callback)
+
+
+def evict_cubes(
+    cache_dir: Path,
+    max_bytes: int | None = None,
+    keep: Path | None = None,
+) -> list[Path]:
+    """
+    Remove the least recently used cubes of a cache beyond a total size.
+
+    Cubes are ordered by their last access or modification time, whichever is
+    later, reused cubes being touched by their readers.
+
+    Args:
+        cache_dir: Directory of the cached GeoTIFFs.
+        max_bytes: Total size of the cubes to keep, NAIP_CACHE_MAX_MB by default.
+        keep: Cube never removed, e.g. the one just written.
+
+    Returns:
+        The removed cubes.
+    """
+    if max_bytes is None:
+        max_bytes = int(CACHE_MAX_MB * 2**20)
+    cubes = []
+    for path in cache_dir.glob("*.tif"):
+        if path.name.endswith(".tmp.tif"):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # Removed by another worker in the meantime.
+            continue
+        cubes.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+    total = sum(size for _, size, _ in cubes)
+    evicted = []
+    for _, size, path in sorted(cubes):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        for callback in _EVICTION_CALLBACKS:
+            callback(path)
+        evicted.append(path)
+        total -= size
+    if evicted:
+        logger.info("Evicted %d cached NAIP cubes", len(evicted))
+    return evicted
+
+
+def _chunk_offsets(chunks: tuple[int, ...]) -> list[int]:
+    return np.concatenate([[0], np.cumsum(chunks)[:-1]]).astype(int).tolist()
+
+
+def write_cube(
+    cube: xr.DataArray,
+    geobox: GeoBox,
+    path: Path,
+    parallel_chunks: int = PARALLEL_CHUNKS,
+    cancel: threading.Event | None = None,
+) -> tuple[float, float]:
+    """
+    Write a dask-backed uint8 (band, y, x) cube to a tiled GeoTIFF chunk by chunk.
+
+    Only `parallel_chunks` chunks are held in memory at once. The histogram
+    for the contrast stretch is accumulated in the same pass, so the source
+    is read only once, and the stretch limits are stored in the GeoTIFF tags.
+    Zeros are nodata, outside of the area of interest, and left out of both the
+    stretch and the overviews. Once written, the least recently used cubes of
+    the directory of `path` are evicted beyond NAIP_CACHE_MAX_MB.
+
+    Args:
+        cube: Dask-backed uint8 array with dims (band, y, x).
+        geobox: Geobox of the cube.
+        path: Output GeoTIFF path.
+        parallel_chunks: Number of chunks computed concurrently.
+        cancel: Event stopping the write before the next batch of chunks, the
+            partially written GeoTIFF is removed.
+
+    Returns:
+        The (vmin, vmax) contrast stretch limits of the cube.
+
+    Raises:
+        CancelledError: If `cancel` was set before the cube was written.
+    """
+    data = cube.data.rechunk({0: -1})
+    _, y_chunks, x_chunks = data.chunks
+    y_offsets, x_offsets = _chunk_offsets(y_chunks), _chunk_offsets(x_chunks)
+    blocks = [(i, j) for i in range(len(y_chunks)) for j in range(len(x_chunks))]
+
+    hist = np.zeros(256, dtype="int64")
+    profile = {
+        "driver": "GTiff",
+        "width": geobox.shape.x,
+        "height": geobox.shape.y,
+        "count": data.shape[0],
+        "dtype": "uint8",
+        "nodata": 0,
+        "crs": geobox.crs.to_wkt(),
+        "transform": geobox.affine,
+        "tiled": True,
+        "blockxsize": _BLOCK_SIZE,
+        "blockysize": _BLOCK_SIZE,
+        "compress": "deflate",
+        "photometric": "rgb" if data.shape[0] == 3 else "minisblack",
+        "BIGTIFF": "IF_SAFER",
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a unique temporary file so that concurrent loads of the same
+    # cube never see a partially written GeoTIFF.
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp.tif")
+    try:
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            for start in range(0, len(blocks), parallel_chunks):
+                if cancel is not None and cancel.is_set():
+                    raise CancelledError(f"Write of {path.name} cancelled")
+                batch = blocks[start : start + parallel_chunks]
+                arrays = dask.compute(*(data.blocks[0, i, j] for i, j in batch))
+                for (i, j), arr in zip(batch, arrays, strict=True):
+                    window = Window(
+                        x_offsets[j],
+                        y_offsets[i],
+                        arr.shape[2],
+                        arr.shape[1],
+                    )
+                    dst.write(arr, window=window)
+                    hist += np.bincount(arr.ravel(), minlength=256)
+
+            # Nodata pixels would pull the lower limit to 0.
+            hist[0] = 0
+            vmin, vmax = histogram_stretch_limits(hist)
+            dst.update_tags(**{STRETCH_MIN_TAG: vmin, STRETCH_MAX_TAG: vmax})
+
+            # Overviews keep previews and zoomed-out reads cheap.
+            factors = [f for f in _OVERVIEW_FACTORS if max(dst.width, dst.height) // f]
+            dst.build_overviews(factors, Resampling.average)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    evict_cubes(path.parent, keep=path)
+    return vmin, vmax
+
+
+def defer_cube(cube: xr.DataArray, geobox: GeoBox, path: Path) -> None:
+    """
+    Keep an in-memory uint8 (band, y, x) cube, to be written to `path` on use.
+
+    Small cubes loaded in memory are only worth writing, with their overviews,
+    once their tiles are requested, see `write_deferred_cube`. The
+    DEFERRED_CUBES_MAX most recently deferred cubes of the process are kept.
+    """
+    with _DEFERRED_LOCK:
+        _DEFERRED_CUBES[path] = (cube, geobox)
+        _DEFERRED_CUBES.move_to_end(path)
+        while len(_DEFERRED_CUBES) > DEFERRED_CUBES_MAX:
+            _DEFERRED_CUBES.popitem(last=False)
+
+
+def write_deferred_cube(path: Path) -> bool:
+    """
+    Write a cube kept by `defer_cube` to the cache, unless it is there already.
+
+    Args:
+        path: Cached cube GeoTIFF path.
+
+    Returns:
+        Whether the cube is in the cache, False if it is neither cached nor
+        deferred in this process.
+    """
+    # Concurrent tile requests of a new cube wait for a single write.
+    with _DEFERRED_LOCK:
+        if path.exists():
+            return True
+        if path not in _DEFERRED_CUBES:
+            return False
+        cube, geobox = _DEFERRED_CUBES[path]
+        write_cube(cube.chunk(), geobox, path)
+        del _DEFERRED_CUBES[path]
+    return True
+
+
+def read_stretch_limits(path: Path) -> tuple[float, float]:
+    """Read the contrast stretch limits stored in a cached GeoTIFF."""
+    with rasterio.open(path) as src:
+        tags = src.tags()
+    return float(tags[STRETCH_MIN_TAG]), float(tags[STRETCH_MAX_TAG])
+
+
+def read_preview(path: Path, max_size: int) -> np.ndarray:
+    """
+    Read a GeoTIFF decimated to at most `max_size` pixels on its longest side.
+
+    Args:
+        path: GeoTIFF path.
+        max_size: Maximum width and height of the preview.
+
+    Returns:
+        Array of shape (y, x, band) in the dtype of the GeoTIFF.
+    """
+    with rasterio.open(path) as src:
+        scale = min(1.0, max_size / max(src.width, src.height))
+        out_shape = (
+            src.count,
+            max(1, round(src.height * scale)),
+            max(1, round(src.width * scale)),
+        )
+        arr = src.read(out_shape=out_shape, resampling=Resampling.average)
+    return np.ascontiguousarray(np.moveaxis(arr, 0, -1))
+
+
+def chip_grid(width: int, height: int, chip_size: int, max_chips: int) -> float:
+    """
+    Scale at which an image is cut into at most `max_chips` square chips.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels.
+        chip_size: Width and height of the chips in pixels.
+        max_chips: Maximum number of chips.
+
+    Returns:
+        The scale of the chips relative to the image, 1 at full resolution.
+    """
+    scale = min(1.0, math.sqrt(max_chips * chip_size**2 / (width * height)))
+    while (
+        math.ceil(width * scale / chip_size) * math.ceil(height * scale / chip_size)
+        > max_chips
+    ):
+        scale *= 0.9
+    return scale
+
+
+def read_chips(
+    path: Path,
+    chip_size: int,
+    max_chips: int,
+) -> list[tuple[int, int, np.ndarray]]:
+    """
+    Read a GeoTIFF as a grid of chips of at most `chip_size` pixels.
+
+    Chips are read at full resolution, unless the image needs more than
+    `max_chips` of them, in which case they are decimated from the overviews.
+
+    Args:
+        path: GeoTIFF path.
+        chip_size: Maximum width and height of the chips.
+        max_chips: Maximum number of chips.
+
+    Returns:
+        Row, column and array of shape (y, x, band) in the dtype of the GeoTIFF
+        of each chip, row by row from the top left.
+    """
+    chips = []
+    with rasterio.open(path) as src:
+        scale = chip_grid(src.width, src.height, chip_size, max_chips)
+        # Size of a chip in source pixels.
+        step = chip_size / scale
+        rows = math.ceil(src.height / step)
+        cols = math.ceil(src.width / step)
+        for row in range(rows):
+            for col in range(cols):
+                window = Window(
+                    col * step,
+                    row * step,
+                    min(step, src.width - col * step),
+                    min(step, src.height - row * step),
+                )
+                out_shape = (
+                    src.count,
+                    max(1, round(window.height * scale)),
+                    max(1, round(window.width * scale)),
+                )
+                arr = src.read(
+                    window=window,
+                    out_shape=out_shape,
+                    resampling=Resampling.average,
+                )
+                chips.append((row, col, np.ascontiguousarray(np.moveaxis(arr, 0, -1))))
+    return chips
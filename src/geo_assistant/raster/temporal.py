@@ -0,0 +1,99 @@
+"""Per-pixel temporal reductions of dask-backed raster cubes."""
+
+from functools import reduce
+from typing import Literal
+
+import xarray as xr
+
+Composite = Literal["first", "latest", "median", "change"]
+
+
+def _valid(ds: xr.Dataset) -> xr.DataArray:
+    """Pixels with data in any band, NAIP uses 0 as nodata."""
+    return (ds.to_dataarray("band") != 0).any("band")
+
+
+def first_acquisition(ds: xr.Dataset) -> xr.Dataset:
+    """First time slice of the cube."""
+    return ds.isel(time=0)
+
+
+def latest_valid(ds: xr.Dataset) -> xr.Dataset:
+    """
+    Most recent valid value of each pixel.
+
+    Args:
+        ds: Cube with a time dimension sorted in ascending order.
+
+    Returns:
+        Cube without time dimension.
+    """
+    slices = [ds.isel(time=t) for t in range(ds.sizes["time"])]
+    return reduce(lambda older, newer: newer.where(_valid(newer), older), slices)
+
+
+def earliest_valid(ds: xr.Dataset) -> xr.Dataset:
+    """Earliest valid value of each pixel, see `latest_valid`."""
+    return latest_valid(ds.isel(time=slice(None, None, -1)))
+
+
+def median(ds: xr.Dataset) -> xr.Dataset:
+    """
+    Median of the valid values of each pixel.
+
+    Args:
+        ds: Cube with a time dimension.
+
+    Returns:
+        Cube without time dimension, in the dtype of `ds`.
+    """
+    dtype = ds[next(iter(ds.data_vars))].dtype
+    values = ds.astype("float32").where(_valid(ds))
+    if values.chunks:
+        values = values.chunk({"time": -1})
+    return values.median("time", skipna=True).fillna(0).round().astype(dtype)
+
+
+def change(ds: xr.Dataset) -> xr.Dataset:
+    """
+    Absolute difference between the latest and earliest valid value of each pixel.
+
+    Pixels with a single valid acquisition have no change.
+
+    Args:
+        ds: Cube with a time dimension sorted in ascending order.
+
+    Returns:
+        Cube without time dimension, in the dtype of `ds`.
+    """
+    dtype = ds[next(iter(ds.data_vars))].dtype
+    earliest, latest = earliest_valid(ds), latest_valid(ds)
+    diff = abs(latest.astype("int32") - earliest.astype("int32"))
+    return diff.where(_valid(earliest) & _valid(latest), 0).astype(dtype)
+
+
+_COMPOSITES = {
+    "first": first_acquisition,
+    "latest": latest_valid,
+    "median": median,
+    "change": change,
+}
+
+
+def temporal_composite(ds: xr.Dataset, composite: Composite) -> xr.Dataset:
+    """
+    Reduce the time dimension of a cube with a per-pixel composite.
+
+    With a dask-backed cube the reduction stays lazy and runs chunk by chunk
+    across the dask workers when computed.
+
+    Args:
+        ds: Cube with a time dimension sorted in ascending order.
+        composite: One of 'first', 'latest', 'median' or 'change'.
+
+    Returns:
+        Cube without time dimension.
+    """
+    if composite not in _COMPOSITES:
+        raise ValueError(f"Unsupported temporal composite {composite!r}")
+    return _COMPOSITES[composite](ds)
@@ -0,0 +1,133 @@
+"""XYZ web map tiles rendered on demand from cached raster cubes."""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from dotenv import load_dotenv
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, transform_bounds
+
+from geo_assistant.raster.encode import encode_image, stretch_to_uint8
+from geo_assistant.raster.streaming import STRETCH_MAX_TAG, STRETCH_MIN_TAG, on_evict
+
+load_dotenv()
+
+TILE_SIZE = 256
+# Number of rendered tiles kept in memory.
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", "1024"))
+
+WEB_MERCATOR = CRS.from_epsg(3857)
+# Half the width of the Web Mercator world, in meters.
+_ORIGIN = 20037508.342789244
+
+# Rendered tiles by cube path and tile index, least recently used first.
+_TILES: OrderedDict[tuple[Path, int, int, int], bytes | None] = OrderedDict()
+_TILES_LOCK = threading.Lock()
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Web Mercator (left, bottom, right, top) bounds of an XYZ tile."""
+    size = 2 * _ORIGIN / 2**z
+    left = -_ORIGIN + x * size
+    top = _ORIGIN - y * size
+    return left, top - size, left + size, top
+
+
+def _overview_level(src: rasterio.DatasetReader, resolution: float) -> int | None:
+    """Coarsest overview level finer than `resolution`, None for full resolution."""
+    level = None
+    for i, factor in enumerate(src.overviews(1)):
+        if src.res[0] * factor > resolution:
+            break
+        level = i
+    return level
+
+
+def render_tile(path: Path, z: int, x: int, y: int) -> bytes | None:
+    """
+    Render an XYZ tile of a cached cube as an RGBA PNG.
+
+    The tile is read from the closest overview and stretched with the contrast
+    stretch limits stored in the GeoTIFF, so every tile matches the preview.
+    Pixels without data are transparent. Cached cubes are immutable, rendered
+    tiles are cached in memory by path and tile index, the TILE_CACHE_SIZE
+    most recently used, until their cube is evicted.
+
+    Args:
+        path: Cached cube GeoTIFF written by `write_cube`.
+        z: Zoom level.
+        x: Tile column.
+        y: Tile row.
+
+    Returns:
+        The PNG bytes, or None when the tile does not intersect the cube.
+    """
+    key = (path, z, x, y)
+    with _TILES_LOCK:
+        if key in _TILES:
+            _TILES.move_to_end(key)
+            return _TILES[key]
+    tile = _render_tile(path, z, x, y)
+    with _TILES_LOCK:
+        _TILES[key] = tile
+        while len(_TILES) > TILE_CACHE_SIZE:
+            _TILES.popitem(last=False)
+    return tile
+
+
+def forget_cube(path: Path) -> None:
+    """Drop the rendered tiles of a cube, e.g. once evicted from the cache."""
+    with _TILES_LOCK:
+        for key in [key for key in _TILES if key[0] == path]:
+            del _TILES[key]
+
+
+on_evict(forget_cube)
+
+
+def _render_tile(path: Path, z: int, x: int, y: int) -> bytes | None:
+    left, bottom, right, top = tile_bounds(z, x, y)
+    with rasterio.open(path) as src:
+        src_left, src_bottom, src_right, src_top = transform_bounds(
+            src.crs,
+            WEB_MERCATOR,
+            *src.bounds,
+        )
+        if (
+            src_left >= right
+            or src_right <= left
+            or src_bottom >= top
+            or src_top <= bottom
+        ):
+            return None
+
+        tags = src.tags()
+        vmin, vmax = float(tags[STRETCH_MIN_TAG]), float(tags[STRETCH_MAX_TAG])
+        # Web Mercator meters shrink with the latitude, compare ground resolutions.
+        lat = math.degrees(math.atan(math.sinh((top + bottom) / 2 / 6378137)))
+        resolution = (right - left) / TILE_SIZE * math.cos(math.radians(lat))
+        level = _overview_level(src, resolution)
+
+    open_options = {} if level is None else {"overview_level": level}
+    with rasterio.open(path, **open_options) as src:
+        tile = np.zeros((src.count, TILE_SIZE, TILE_SIZE), dtype="uint8")
+        reproject(
+            source=rasterio.band(src, list(range(1, src.count + 1))),
+            destination=tile,
+            dst_transform=from_bounds(left, bottom, right, top, TILE_SIZE, TILE_SIZE),
+            dst_crs=WEB_MERCATOR,
+            src_nodata=0,
+            dst_nodata=0,
+            resampling=Resampling.bilinear,
+        )
+
+    alpha = np.where(tile.any(axis=0), 255, 0).astype("uint8")
+    rgb = stretch_to_uint8(np.ascontiguousarray(np.moveaxis(tile, 0, -1)), vmin, vmax)
+    return encode_image(np.dstack([rgb, alpha]), format="png")
@@ -2,10 +2,15 @@
 
 from geo_assistant.tools.buffer import get_search_area
 from geo_assistant.tools.naip import fetch_naip_img
-from geo_assistant.tools.overture import get_place, get_places_within_buffer
+from geo_assistant.tools.overture import (
+    export_places_within_buffer,
+    get_place,
+    get_places_within_buffer,
+)
 from geo_assistant.tools.summarize import summarize_sat_img
 
 __all__ = [
+    "export_places_within_buffer",
     "fetch_naip_img",
     "get_place",
     "get_places_within_buffer",
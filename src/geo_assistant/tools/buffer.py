@@ -11,6 +11,7 @@ from langgraph.prebuilt import InjectedState
 from langgraph.types import Command
 
 from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.vector.compact import GEOMETRY_TOLERANCE_M, compact_feature
 
 
 @tool
@@ -63,6 +64,9 @@ async def get_search_area(
         geometry=gdf.iloc[0].geometry.__geo_interface__,
         properties=place_feature.properties.copy(),
     )
+    # The buffer is sent to DuckDB and the STAC API, checkpointed and streamed,
+    # keep it to a few vertices that still contain the exact buffer.
+    buffer_feature = compact_feature(buffer_feature, tolerance_m=GEOMETRY_TOLERANCE_M)
 
     return Command(
         update={
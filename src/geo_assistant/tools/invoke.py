@@ -0,0 +1,49 @@
+"""Running the tools outside of the agent graph, e.g. for warm-ups and batches."""
+
+from typing import Any
+
+from langchain_core.tools import BaseTool
+from langchain_core.tools.base import ToolCall
+
+from geo_assistant.agent.cancellation import with_time_limit
+
+
+async def invoke_tool(
+    tool: BaseTool,
+    args: dict,
+    expected: str,
+    context: Any = None,
+) -> dict:
+    """
+    Run a tool as the agent would, outside of a graph.
+
+    Args:
+        tool: The tool.
+        args: Its arguments, including the injected state if it takes one.
+        expected: State field the tool is expected to set.
+        context: What the tool is run for, e.g. an AOI, named in the error.
+
+    Returns:
+        The state update of the tool.
+
+    Raises:
+        ValueError: If the tool did not set `expected`, with the tool's message.
+        ToolTimeoutError: If the tool did not finish within its time limit.
+    """
+    command = await with_time_limit(
+        tool.name,
+        tool.ainvoke(
+            ToolCall(
+                name=tool.name,
+                type="tool_call",
+                id=f"invoke-{tool.name}",
+                args=args,
+            ),
+        ),
+    )
+    if command.update.get(expected) is None:
+        message = command.update["messages"][0].content
+        if context is not None:
+            message = f"{tool.name} found nothing for {context}: {message}"
+        raise ValueError(message)
+    return command.update
@@ -1,28 +1,193 @@
 """Tool to query Planetary Computer STAC API for NAIP imagery."""
 
+import asyncio
 import base64
-from concurrent.futures import ThreadPoolExecutor
-from io import BytesIO
+import functools
+import os
+import threading
+from pathlib import Path
 from typing import Annotated
 
 import dotenv
-import matplotlib.pyplot as plt
 import numpy as np
 import xarray as xr
+from geojson_pydantic.geometries import Geometry
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langchain_core.tools.base import InjectedToolCallId
 from langgraph.prebuilt import InjectedState
 from langgraph.types import Command
 from odc.stac import stac_load
+from pystac import Item
 from pystac.extensions.raster import RasterBand
 from pystac_client import Client
 
+from geo_assistant.agent.cancellation import to_thread_cancellable
 from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.raster.encode import encode_image, stretch_limits, stretch_to_uint8
+from geo_assistant.raster.runtime import (
+    LoadExecutor,
+    configure_raster_io,
+    load_executor,
+)
+from geo_assistant.raster.signing import token_cache
+from geo_assistant.raster.streaming import (
+    CHUNK_SIZE,
+    cube_cache_path,
+    defer_cube,
+    read_preview,
+    read_stretch_limits,
+    write_cube,
+)
+from geo_assistant.raster.temporal import Composite, temporal_composite
 
 dotenv.load_dotenv()
 
 DATA_URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+RGB_BANDS = ["red", "green", "blue"]
+
+# 'memory' loads the whole cube eagerly and caps the image size, 'streaming'
+# keeps it dask-chunked and writes it to the cube cache chunk by chunk.
+PROCESSING_MODE = os.environ.get("NAIP_PROCESSING_MODE", "memory")
+# Maximum image width/height, the output size limit in 'memory' mode and the
+# preview size in 'streaming' mode.
+MAX_IMAGE_SIZE = int(os.environ.get("NAIP_MAX_IMAGE_SIZE", "512"))
+
+
+@functools.cache
+def open_catalog() -> Client:
+    """The Planetary Computer STAC API client, its landing page is fetched once."""
+    return Client.open(DATA_URL)
+
+
+def _search_naip_items(
+    geometry: Geometry,
+    start_date: str,
+    end_date: str,
+) -> list[Item]:
+    """Search the Planetary Computer STAC API for NAIP items over an AOI."""
+    catalog = open_catalog()
+
+    search = catalog.search(
+        collections=["naip"],
+        intersects=geometry,
+        datetime=f"{start_date}/{end_date}",
+    )
+
+    items = list(search.items())
+
+    # This is a hack to add raster extension info to the items, since
+    # the Planetary Computer STAC API adds the band information using the
+    # eo:bands extension, but odc.stac expects the raster:bands extension.
+    for item in items:
+        item.assets["image"].ext.add("raster")
+        item.assets["image"].ext.raster.bands = [
+            RasterBand.create() for _ in ("red", "green", "blue", "nir")
+        ]
+
+    # The assets are read with the cached SAS token of the collection.
+    return token_cache().sign_items(items, "naip")
+
+
+def _load_naip_cube(
+    items: list[Item],
+    geometry: Geometry,
+    chunked: bool = False,
+    executor: LoadExecutor | None = None,
+) -> xr.Dataset:
+    """
+    Load the RGB bands of NAIP items into an xarray data cube.
+
+    Items acquired on the same day, e.g. adjacent NAIP tiles, are mosaicked
+    into a single time slice, sorted in ascending order.
+
+    Args:
+        items: NAIP STAC items.
+        geometry: Area of interest.
+        chunked: Return a lazy, dask-chunked uint8 cube instead of loading it.
+        executor: Executor reading the chunks of an eager load on the shared
+            raster thread pool, shut down once loaded. Shutting it down earlier
+            cancels the pending reads.
+    """
+    configure_raster_io()
+    load_kwargs = {}
+    if chunked:
+        load_kwargs = {
+            "chunks": {"time": 1, "x": CHUNK_SIZE, "y": CHUNK_SIZE},
+            "dtype": "uint8",  # NAIP is 8 bit, avoid the float32 default
+            "nodata": 0,
+        }
+
+    # NAIP in MPC: 4-band multi-band asset (R,G,B,NIR) in one asset named "image".
+    # odc.stac exposes these as measurements 'red','green','blue','nir' for this collection
+    with executor or load_executor() as executor:
+        ds: xr.Dataset = stac_load(
+            items,
+            bands=RGB_BANDS,  # use only RGB
+            geopolygon=geometry,
+            resolution=1.0,  # NAIP native ~1 m
+            groupby="solar_day",
+            pool=executor,
+            crs=items[0].properties["proj:code"],
+            **load_kwargs,
+        )
+    return ds
+
+
+def _encode_rgb(ds: xr.Dataset) -> str:
+    """Encode an RGB image without time dimension as a base 64 image string."""
+    # Stack into (y, x, 3) array, keeping the native dtype. Lazy composites are
+    # computed here.
+    rgb = np.dstack([ds[band].values for band in RGB_BANDS])
+
+    # Convert to uint8 with a simple contrast stretch.
+    vmin, vmax = stretch_limits(rgb)
+    rgb_uint8 = stretch_to_uint8(rgb, vmin, vmax)
+
+    return base64.b64encode(encode_image(rgb_uint8)).decode("utf-8")
+
+
+def _cache_cube(
+    ds: xr.Dataset,
+    cache_key: list[str],
+    cancel: threading.Event | None = None,
+) -> Path:
+    """
+    Write an RGB image without time dimension to the cube cache chunk by chunk,
+    unless it is cached already. Cached cubes are served as map tiles. Setting
+    `cancel` stops the write between chunks.
+    """
+    geobox = ds.odc.geobox
+    path = cube_cache_path(cache_key, geobox)
+    if path.exists():
+        # Marks the cube as recently used for the cache eviction.
+        path.touch()
+    else:
+        write_cube(ds[RGB_BANDS].to_dataarray("band"), geobox, path, cancel=cancel)
+    return path
+
+
+def _defer_cube(ds: xr.Dataset, cache_key: list[str]) -> Path:
+    """
+    Keep an in-memory RGB image without time dimension, to be written to the
+    cube cache when its tiles are first requested, unless it is cached already.
+    """
+    geobox = ds.odc.geobox
+    path = cube_cache_path(cache_key, geobox)
+    if path.exists():
+        path.touch()
+    else:
+        # Float32 with NaN nodata when loaded eagerly.
+        cube = ds[RGB_BANDS].to_dataarray("band").fillna(0).astype("uint8")
+        defer_cube(cube, geobox, path)
+    return path
+
+
+def _encode_rgb_streaming(path: Path) -> str:
+    """Encode a preview of a cached cube as a base 64 image string."""
+    vmin, vmax = read_stretch_limits(path)
+    preview = stretch_to_uint8(read_preview(path, MAX_IMAGE_SIZE), vmin, vmax)
+    return base64.b64encode(encode_image(preview)).decode("utf-8")
 
 
 @tool("fetch_naip_img")
@@ -30,17 +195,24 @@ async def fetch_naip_img(
     start_date: str,
     end_date: str,
     state: Annotated[GeoAssistantState, InjectedState],
+    composite: Composite = "first",
     tool_call_id: Annotated[str | None, InjectedToolCallId] = None,
 ) -> Command:
     """
     Query Microsoft Planetary Computer for NAIP imagery intersecting an AOI and
     date range, load all matching items into an xarray data cube using odc-stac,
-    and save a simple RGB composite as a JPEG.
+    and save a simple RGB composite as an image (JPEG by default).
 
     Args:
         start_date: Start date (YYYY-MM-DD).
         end_date: End date (YYYY-MM-DD).
         state: Pass in search_area as state into this agent.
+        composite: How to combine the NAIP acquisitions of the date range.
+            'first' uses the first acquisition, 'latest' the most recent valid
+            pixel, 'median' the per-pixel median and 'change' the absolute
+            difference between the earliest and the latest acquisition, bright
+            pixels showing change. Use a date range spanning several years for
+            'median' and 'change'.
         tool_call_id: Optional ID for tracking the tool call
     """
     if not state["search_area"]:
@@ -53,28 +225,19 @@ async def fetch_naip_img(
                     ),
                 ],
                 "naip_img_bytes": None,
+                "naip_cube": None,
             },
         )
-    # --- 1. STAC search on Element84's EarthSearch API ---
-    catalog = Client.open(DATA_URL)
-
-    search = catalog.search(
-        collections=["naip"],
-        intersects=state["search_area"].geometry,
-        datetime=f"{start_date}/{end_date}",
+    # --- 1. STAC search on the Planetary Computer STAC API ---
+    # Network and raster I/O block, run them in worker threads so that other
+    # tool calls of the same turn can make progress.
+    items = await asyncio.to_thread(
+        _search_naip_items,
+        state["search_area"].geometry,
+        start_date,
+        end_date,
     )
 
-    items = list(search.items())
-
-    # This is a hack to add raster extension info to the items, since
-    # the Planetary Computer STAC API adds the band information using the
-    # eo:bands extension, but odc.stac expects the raster:bands extension.
-    for item in items:
-        item.assets["image"].ext.add("raster")
-        item.assets["image"].ext.raster.bands = [
-            RasterBand.create() for _ in ("red", "green", "blue", "nir")
-        ]
-
     if len(items) == 0:
         return Command(
             update={
@@ -85,22 +248,31 @@ async def fetch_naip_img(
                     ),
                 ],
                 "naip_img_bytes": None,
+                "naip_cube": None,
             },
         )
 
     # --- 2. Load as xarray cube with odc.stac ---
-    # NAIP in MPC: 4-band multi-band asset (R,G,B,NIR) in one asset named "image".
-    # odc.stac exposes these as measurements 'red','green','blue','nir' for this collection
-    # Limit to first item for now
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        ds: xr.Dataset = stac_load(
-            items[:1],
-            bands=["red", "green", "blue"],  # use only RGB
-            geopolygon=state["search_area"].geometry,
-            resolution=1.0,  # NAIP native ~1 m
-            executor=executor,
-            crs=items[0].properties["proj:code"],
-        )
+    # Temporal composites load every acquisition lazily and reduce them chunk
+    # by chunk with dask, the 'first' composite only needs the first item.
+    streaming = PROCESSING_MODE == "streaming"
+    temporal = composite != "first"
+    if not temporal:
+        items = items[:1]
+    # Cancelling the tool call cancels the reads that have not started yet.
+    executor = load_executor()
+    ds = await to_thread_cancellable(
+        _load_naip_cube,
+        items,
+        state["search_area"].geometry,
+        streaming or temporal,
+        executor,
+        interrupt=functools.partial(
+            executor.shutdown,
+            wait=False,
+            cancel_futures=True,
+        ),
+    )
 
     if ds.dims.get("time", 0) == 0:
         return Command(
@@ -112,63 +284,75 @@ async def fetch_naip_img(
                     ),
                 ],
                 "naip_img_bytes": None,
+                "naip_cube": None,
             },
         )
 
-    # Enforce max output size based on dataset sizes (y, x)
-    sizes = dict(ds.sizes)
-    h = int(sizes.get("y", 0))
-    w = int(sizes.get("x", 0))
-    if h > 512 or w > 512:
+    if composite == "change" and ds.sizes["time"] < 2:
         return Command(
             update={
                 "messages": [
                     ToolMessage(
-                        content=f"NAIP RGB image {w}x{h} exceeds 512x512 limit. Skipping image output.",
+                        content="Only one NAIP acquisition found for the specified area and date range, a change image needs at least two. Try a longer date range.",
                         tool_call_id=tool_call_id,
                     ),
                 ],
                 "naip_img_bytes": None,
+                "naip_cube": None,
             },
         )
 
-    # --- 3. Build an RGB composite from the cube ---
-    # For the JPEG, we'll just use the first time slice (you can swap in “latest”
-    # or a temporal reduction if you prefer).
-    red = ds["red"].isel(time=0)
-    green = ds["green"].isel(time=0)
-    blue = ds["blue"].isel(time=0)
-
-    # Stack into (y, x, 3) array
-    rgb = xr.concat([red, green, blue], dim="band")  # (band, y, x)
-    rgb = rgb.transpose("y", "x", "band")  # (y, x, band)
-
-    # Convert to uint8 for JPEG with a simple contrast stretch.
-    arr = rgb.values.astype("float32")
-    # Robust min/max to avoid a few hot pixels blowing out the stretch
-    vmin = np.nanpercentile(arr, 2)
-    vmax = np.nanpercentile(arr, 98)
-    if vmax <= vmin:
-        vmin, vmax = np.nanmin(arr), np.nanmax(arr)
-
-    arr = np.clip((arr - vmin) / (vmax - vmin + 1e-6), 0, 1)
-    arr_uint8 = (arr * 255).astype("uint8")
-
-    # --- 4. Save image ---
+    sizes = dict(ds.sizes)
+    h = int(sizes.get("y", 0))
+    w = int(sizes.get("x", 0))
+    dates = ", ".join(ds.time.dt.strftime("%Y-%m-%d").values.tolist())
 
-    buf = BytesIO()
-    plt.imsave(buf, arr_uint8, format="jpeg")
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode("utf-8")
+    # --- 3. Build an RGB composite from the cube and encode it ---
+    rgb = temporal_composite(ds, composite)
+    cache_key = [*(item.id for item in items), composite]
+    cancel = threading.Event()
+    if streaming:
+        path = await to_thread_cancellable(
+            _cache_cube,
+            rgb,
+            cache_key,
+            cancel,
+            interrupt=cancel.set,
+        )
+        img_base64 = await asyncio.to_thread(_encode_rgb_streaming, path)
+        content = (
+            f"NAIP RGB image of {w}x{h} pixels fetched and encoded as image bytes "
+            f"(preview of at most {MAX_IMAGE_SIZE}x{MAX_IMAGE_SIZE} pixels)."
+        )
+    else:
+        # Enforce max output size based on dataset sizes (y, x)
+        if h > MAX_IMAGE_SIZE or w > MAX_IMAGE_SIZE:
+            return Command(
+                update={
+                    "messages": [
+                        ToolMessage(
+                            content=f"NAIP RGB image {w}x{h} exceeds {MAX_IMAGE_SIZE}x{MAX_IMAGE_SIZE} limit. Skipping image output.",
+                            tool_call_id=tool_call_id,
+                        ),
+                    ],
+                    "naip_img_bytes": None,
+                    "naip_cube": None,
+                },
+            )
+        # Compute lazy composites once for both the image and the cube cache.
+        rgb = await asyncio.to_thread(rgb.compute)
+        img_base64 = await asyncio.to_thread(_encode_rgb, rgb)
+        path = await asyncio.to_thread(_defer_cube, rgb, cache_key)
+        content = "NAIP RGB image fetched and encoded as image bytes."
+    if temporal:
+        content += f" '{composite}' composite of the NAIP acquisitions of {dates}."
 
     return Command(
         update={
             "messages": [
-                ToolMessage(
-                    content="NAIP RGB image fetched and encoded as JPEG bytes.",
-                    tool_call_id=tool_call_id,
-                ),
+                ToolMessage(content=content, tool_call_id=tool_call_id),
             ],
             "naip_img_bytes": img_base64,
+            "naip_cube": path.stem,
         },
     )
@@ -1,71 +1,171 @@
 """Tool to find closest matching Overture place based on user input."""
 
+import asyncio
+import hashlib
 import json
 import os
-from typing import Annotated
+import queue
+import threading
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import contextmanager
+from typing import Annotated, Any
+from urllib.parse import urlencode
 
 import duckdb
 import geopandas as gpd
 import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
 from geojson_pydantic import Feature, FeatureCollection
+from geojson_pydantic.geometries import Geometry
 from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langchain_core.tools.base import InjectedToolCallId
 from langgraph.prebuilt import InjectedState
 from langgraph.types import Command
 from shapely.geometry import shape
 
+from geo_assistant.agent.cancellation import to_thread_cancellable
 from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.vector.categories import category_filter, load_category_index
+from geo_assistant.vector.compact import (
+    compact_feature,
+    compact_feature_collection,
+    geometry_bounds,
+)
+from geo_assistant.vector.export import EXPORT_BATCH_ROWS, ExportFormat, write_batches
+from geo_assistant.vector.extensions import connect, required_extensions
+from geo_assistant.vector.s3cache import (
+    cached_s3_filesystem,
+    cached_url,
+    s3_cache_enabled,
+)
 
 # Load environment variables
 load_dotenv()
 
+OVERTURE_S3_PATH = (
+    "s3://overturemaps-us-west-2/release/2025-11-19.0/theme=places/type=place/*"
+)
 
-def create_database_connection():
+
+def create_database_connection(
+    source: str | None = None,
+) -> duckdb.DuckDBPyConnection:
     """
     Create and configure a DuckDB connection with necessary extensions.
 
+    Extensions are loaded from the provisioned extension directory, installed
+    into it on first use unless DUCKDB_EXTENSION_INSTALL is off. S3 is read
+    through the local S3 cache, or with httpfs when the cache is disabled.
+
     Args:
-        database_path: Path to the DuckDB database file
+        source: Overture source, 'local' or 's3', OVERTURE_SOURCE by default.
 
     Returns:
         Configured DuckDB connection
 
     """
-    connection = duckdb.connect()
-    connection.execute("INSTALL spatial;")
-    connection.execute("INSTALL httpfs;")
-    connection.load_extension("spatial")
-    connection.load_extension("httpfs")
+    source = source or os.getenv("OVERTURE_SOURCE", "local")
+    connection = connect(required_extensions(source))
+    if source == "s3" and s3_cache_enabled():
+        connection.register_filesystem(cached_s3_filesystem())
+    elif source == "s3":
+        connection.execute("SET s3_region='us-west-2';")
     return connection
 
 
-@tool
-async def get_place(
-    place_name: str,
-    tool_call_id: Annotated[str, InjectedToolCallId] = "",
-) -> Command:
+# Idle connections of each source, with their extensions loaded, reused by the
+# queries.
+_CONNECTION_POOLS: defaultdict[str, queue.SimpleQueue[duckdb.DuckDBPyConnection]] = (
+    defaultdict(queue.SimpleQueue)
+)
+
+
+@contextmanager
+def pooled_connection(
+    source: str | None = None,
+) -> Iterator[duckdb.DuckDBPyConnection]:
     """
-    Get place location from Overture Maps based on user input place name.
+    Borrow a DuckDB connection from the pool, creating one if none is idle.
 
     Args:
-        place_name: An address or location given as a human-readable string.
-        tool_call_id: Optional ID for tracking the tool call.
+        source: Overture source, 'local' or 's3', OVERTURE_SOURCE by default.
 
+    Yields:
+        A connection used by one query at a time, returned to the pool on exit.
     """
-    db_connection = create_database_connection()
-    source = os.getenv("OVERTURE_SOURCE", "local")
+    source = source or os.getenv("OVERTURE_SOURCE", "local")
+    pool = _CONNECTION_POOLS[source]
+    try:
+        connection = pool.get_nowait()
+    except queue.Empty:
+        connection = create_database_connection(source)
+    try:
+        yield connection
+    finally:
+        pool.put(connection)
+
+
+def fill_connection_pool(size: int, source: str | None = None) -> None:
+    """Create connections until `size` are idle in the pool, e.g. at start-up."""
+    source = source or os.getenv("OVERTURE_SOURCE", "local")
+    pool = _CONNECTION_POOLS[source]
+    while pool.qsize() < size:
+        pool.put(create_database_connection(source))
+
+
+def _data_path(source: str) -> str:
+    """Overture places Parquet files of `source`, S3 read through its cache."""
     if source == "s3":
-        data_path = os.getenv("OVERTURE_S3_PATH")
-        db_connection.execute("SET s3_region='us-west-2';")
-    else:
-        data_path = os.getenv("OVERTURE_LOCAL_PATH")
+        return cached_url(os.getenv("OVERTURE_S3_PATH", OVERTURE_S3_PATH))
+    return os.getenv("OVERTURE_LOCAL_PATH", "data/overture/places/*")
 
-    location_results = db_connection.execute(
-        f"""
-      LOAD spatial;
 
+async def _run_query[T](
+    query: Callable[..., T],
+    *args: Any,
+) -> T:
+    """
+    Run `query(connection, data_path, *args)` in a worker thread.
+
+    The query runs on a pooled connection of OVERTURE_SOURCE, and is
+    interrupted if the tool call is cancelled, e.g. when the client disconnects
+    or the tool's time limit is reached.
+    """
+    source = os.getenv("OVERTURE_SOURCE", "local")
+    lock = threading.Lock()
+    borrowed: list[duckdb.DuckDBPyConnection] = []
+
+    def run() -> T:
+        with pooled_connection(source) as connection:
+            with lock:
+                borrowed.append(connection)
+            try:
+                return query(connection, _data_path(source), *args)
+            finally:
+                # Returned to the pool, the connection runs other queries.
+                with lock:
+                    borrowed.clear()
+
+    def interrupt() -> None:
+        with lock:
+            for connection in borrowed:
+                connection.interrupt()
+
+    return await to_thread_cancellable(run, interrupt=interrupt)
+
+
+def _query_place(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    place_name: str,
+) -> list[tuple]:
+    """Find the Overture place whose primary name best matches `place_name`."""
+    return db_connection.execute(
+        f"""
       SELECT
           id,
           jaro_winkler_similarity(LOWER(names.primary), LOWER('{place_name}')) AS similarity_score,
@@ -84,18 +184,36 @@ async def get_place(
   """,
     ).fetchall()
 
-    db_connection.close()
+
+@tool
+async def get_place(
+    place_name: str,
+    tool_call_id: Annotated[str, InjectedToolCallId] = "",
+) -> Command:
+    """
+    Get place location from Overture Maps based on user input place name.
+
+    Args:
+        place_name: An address or location given as a human-readable string.
+        tool_call_id: Optional ID for tracking the tool call.
+
+    """
+    # DuckDB blocks, run it in a worker thread so that other tool calls of the
+    # same turn can make progress.
+    location_results = await _run_query(_query_place, place_name)
 
     geometry = json.loads(location_results[0][-1])
 
-    feature = Feature(
-        type="Feature",
-        geometry=geometry,
-        properties={
-            "overture_id": location_results[0][0],
-            "name": location_results[0][2],
-            "socials": location_results[0][4],
-        },
+    feature = compact_feature(
+        Feature(
+            type="Feature",
+            geometry=geometry,
+            properties={
+                "overture_id": location_results[0][0],
+                "name": location_results[0][2],
+                "socials": location_results[0][4],
+            },
+        ),
     )
 
     return Command(
@@ -111,32 +229,6 @@ async def get_place(
     )
 
 
-def normalize_place_type(place: str) -> str:
-    """Normalize place type input to Overture categories."""
-    place_lower = place.lower().strip()
-
-    # Mapping of variations to canonical Overture types
-    mappings = {
-        # Restaurants
-        "restaurant": "restaurant",
-        "restaurants": "restaurant",
-        # Cafes/Coffee shops
-        "cafe": "cafe",
-        "cafes": "cafe",
-        "coffee": "cafe",
-        "coffee shop": "cafe",
-        "coffee shops": "cafe",
-        "coffeeshop": "cafe",
-        # Bars
-        "bar": "bar",
-        "bars": "bar",
-        "pub": "bar",
-        "pubs": "bar",
-    }
-
-    return mappings.get(place_lower, place_lower)
-
-
 def _format_places_within_buffer_message(gdf: gpd.GeoDataFrame) -> str:
     """Format GeoDataFrame of places into a readable message."""
     count = len(gdf)
@@ -165,39 +257,37 @@ def _format_places_within_buffer_message(gdf: gpd.GeoDataFrame) -> str:
     return f"Found {count} places:\n{formatted_places}"
 
 
-@tool
-async def get_places_within_buffer(
+def _places_within_filter(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
     place: str,
-    state: Annotated[GeoAssistantState, InjectedState],
-    tool_call_id: Annotated[str, InjectedToolCallId],
-) -> Command:
+    geometry: Geometry,
+) -> str:
+    """SQL predicate of the Overture places of category `place` intersecting `geometry`."""
+    minx, miny, maxx, maxy = geometry_bounds(geometry)
+    category = category_filter(db_connection, data_path, place)
+
+    # The category and bbox columns are compared first, DuckDB prunes the
+    # Parquet row groups on their statistics (most of them on the category
+    # with extracts clustered by category) and only runs the exact predicate
+    # on the candidates.
+    return f"""
+        {category}
+        AND bbox.xmin <= {maxx} AND bbox.xmax >= {minx}
+        AND bbox.ymin <= {maxy} AND bbox.ymax >= {miny}
+        AND ST_Intersects(geometry, ST_GeomFromGeoJSON('{json.dumps(geometry.model_dump())}'))
     """
-    Get places from Overture Maps within user specified area and user specified Overture
-    place type.
-
-    Args:
-        place: Overture place type. Accepts: restaurant(s), cafe(s), coffee shop(s),
-               bar(s), pub(s) - case insensitive.
-        state: Pass in 'search_area' as state into this agent.
-        tool_call_id: Optional ID for tracking the tool call.
-    """
-    # Normalize the place type
-    place = normalize_place_type(place)
-
-    # get bounds of buffered place
-    search_area = state["search_area"]
 
-    db_connection = create_database_connection()
-    source = os.getenv("OVERTURE_SOURCE", "local")
-    if source == "s3":
-        data_path = os.getenv("OVERTURE_S3_PATH")
-        db_connection.execute("SET s3_region='us-west-2';")
-    else:
-        data_path = os.getenv("OVERTURE_LOCAL_PATH")
 
-    places_df = db_connection.execute(
+def _query_places_within_buffer(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    place: str,
+    geometry: Geometry,
+) -> pd.DataFrame:
+    """Find Overture places of category `place` intersecting `geometry`."""
+    return db_connection.execute(
         f"""
-        LOAD spatial;
         SELECT
             id,
             names.primary AS name,
@@ -210,13 +300,164 @@ async def get_places_within_buffer(
             filename=true,
             hive_partitioning=1
         )
-        WHERE ST_Intersects(geometry, ST_GeomFromGeoJSON('{json.dumps(search_area.geometry.model_dump())}'))
-        AND categories.primary = '{place}'
+        WHERE {_places_within_filter(db_connection, data_path, place, geometry)}
         LIMIT 10;
         """,
     ).fetchdf()
 
-    db_connection.close()
+
+def _count_places_within_buffer(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    place: str,
+    geometry: Geometry,
+) -> int:
+    """Count the Overture places of category `place` intersecting `geometry`."""
+    return db_connection.execute(
+        f"""
+        SELECT count(*)
+        FROM read_parquet('{data_path}', hive_partitioning=1)
+        WHERE {_places_within_filter(db_connection, data_path, place, geometry)}
+        """,
+    ).fetchone()[0]
+
+
+def places_export_query(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    place: str,
+    geometry: Geometry,
+) -> str:
+    """Query of every Overture place of category `place` intersecting `geometry`, WKB geometries."""
+    return f"""
+        SELECT
+            id,
+            names.primary AS name,
+            categories.primary AS category,
+            confidence,
+            websites,
+            socials,
+            ST_AsWKB(geometry) AS geometry
+        FROM read_parquet('{data_path}', hive_partitioning=1)
+        WHERE {_places_within_filter(db_connection, data_path, place, geometry)}
+    """
+
+
+def _export_places(
+    db_connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    place: str,
+    geometry: Geometry,
+    export_format: ExportFormat,
+) -> Iterator[bytes]:
+    reader = db_connection.execute(
+        places_export_query(db_connection, data_path, place, geometry),
+    ).fetch_record_batch(EXPORT_BATCH_ROWS)
+    yield from write_batches(reader, export_format)
+
+
+def area_digest(geometry: Geometry) -> str:
+    """Short digest of a geometry, identifying the search area of an export."""
+    return hashlib.sha1(geometry.model_dump_json().encode()).hexdigest()[:16]
+
+
+async def stream_places_export(
+    place: str,
+    geometry: Geometry,
+    export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    """
+    Stream every Overture place of a category intersecting a geometry.
+
+    The rows are read from DuckDB in Arrow record batches and encoded batch by
+    batch, on a cursor of a pooled connection of OVERTURE_SOURCE. The pooled
+    connection is returned at once, so that slow downloads do not hold it.
+    Closing the stream early interrupts the query.
+
+    Args:
+        place: Overture category.
+        geometry: Area the places intersect.
+        export_format: 'arrow' for an Arrow IPC stream, 'parquet' for
+            GeoParquet.
+
+    Yields:
+        The encoded export, chunk by chunk.
+    """
+    source = os.getenv("OVERTURE_SOURCE", "local")
+    # A cursor shares the database, extensions and settings of its connection
+    # but runs its own queries.
+    with pooled_connection(source) as connection:
+        cursor = connection.cursor()
+    chunks = _export_places(cursor, _data_path(source), place, geometry, export_format)
+    # Held while a batch is read. A read may outlast the grace period of its
+    # cancellation, the export is only closed once it has returned.
+    reading = threading.Lock()
+
+    def read() -> bytes | None:
+        with reading:
+            return next(chunks, None)
+
+    def close() -> None:
+        with reading:
+            chunks.close()
+            cursor.close()
+
+    try:
+        while True:
+            chunk = await to_thread_cancellable(read, interrupt=cursor.interrupt)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        if reading.locked():
+            cursor.interrupt()
+        await asyncio.to_thread(close)
+
+
+def _no_search_area(tool_call_id: str) -> Command:
+    """Answer of the tools that need a search area, before one is set."""
+    return Command(
+        update={
+            "messages": [
+                ToolMessage(
+                    content="No search area available yet, set one first.",
+                    tool_call_id=tool_call_id,
+                ),
+            ],
+        },
+    )
+
+
+@tool
+async def get_places_within_buffer(
+    place: str,
+    state: Annotated[GeoAssistantState, InjectedState],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
+    """
+    Get places from Overture Maps within user specified area and user specified Overture
+    place type.
+
+    Args:
+        place: Overture place category, or a common name for it, e.g.
+               restaurant(s), coffee shop(s), pub(s), italian restaurant(s) -
+               case insensitive.
+        state: Pass in 'search_area' as state into this agent.
+        tool_call_id: Optional ID for tracking the tool call.
+    """
+    # get bounds of buffered place
+    search_area = state.get("search_area")
+    if search_area is None:
+        return _no_search_area(tool_call_id)
+
+    # Resolve the place type to an Overture category
+    place = load_category_index().resolve(place)
+
+    places_df = await _run_query(
+        _query_places_within_buffer,
+        place,
+        search_area.geometry,
+    )
 
     # Convert geometry column from GeoJSON strings to shapely geometries
     places_df["geometry"] = places_df["geometry"].apply(lambda x: shape(json.loads(x)))
@@ -225,8 +466,10 @@ async def get_places_within_buffer(
     gdf = gpd.GeoDataFrame(places_df, geometry="geometry", crs="EPSG:4326")
 
     # Convert to GeoJSON FeatureCollection and ensure no numpy arrays
-    feature_collection = FeatureCollection.model_validate(
-        json.loads(json.dumps(gdf.__geo_interface__, default=str)),
+    feature_collection = compact_feature_collection(
+        FeatureCollection.model_validate(
+            json.loads(json.dumps(gdf.__geo_interface__, default=str)),
+        ),
     )
 
     return Command(
@@ -240,3 +483,51 @@ async def get_places_within_buffer(
             ],
         },
     )
+
+
+@tool
+async def export_places_within_buffer(
+    place: str,
+    state: Annotated[GeoAssistantState, InjectedState],
+    config: RunnableConfig,
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
+    """
+    Count all the Overture places of a type within the search area, and make
+    them available for download as GeoParquet or Arrow. Use this when the user
+    wants all the places, or a file of them, rather than a few examples.
+
+    Args:
+        place: Overture place category, or a common name for it, e.g.
+               restaurant(s), coffee shop(s), pub(s) - case insensitive.
+        state: Pass in 'search_area' as state into this agent.
+        config: Run configuration, the export is addressed by its thread.
+        tool_call_id: Optional ID for tracking the tool call.
+    """
+    if state.get("search_area") is None:
+        return _no_search_area(tool_call_id)
+    place = load_category_index().resolve(place)
+    geometry = state["search_area"].geometry
+    count = await _run_query(_count_places_within_buffer, place, geometry)
+
+    # The places stay in DuckDB, the agent only gets the count and the handle
+    # the API streams them from. The handle pins the counted search area, the
+    # thread's may have moved by the time it is downloaded.
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if thread_id is not None:
+        query = {"thread_id": str(thread_id), "area": area_digest(geometry)}
+    else:
+        query = {"geometry": geometry.model_dump_json(exclude_none=True)}
+    query["category"] = place
+    handle = f"/export/places?{urlencode(query)}"
+    return Command(
+        update={
+            "places_export": handle,
+            "messages": [
+                ToolMessage(
+                    content=f"Found {count} places of category {place} in the search area, available for download at {handle}.",
+                    tool_call_id=tool_call_id,
+                ),
+            ],
+        },
+    )
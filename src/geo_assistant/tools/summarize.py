@@ -1,10 +1,20 @@
 """Tools for summarizing satellite images using LLM-based analysis."""
 
+import asyncio
+import base64
+import hashlib
+import math
 import os
+import statistics
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
 from typing import Annotated
 
 import dotenv
 import dspy
+import numpy as np
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langchain_core.tools.base import InjectedToolCallId
@@ -12,9 +22,54 @@ from langgraph.prebuilt import InjectedState
 from langgraph.types import Command
 
 from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.raster.encode import (
+    encode_image,
+    fit_image,
+    image_mime_type,
+    image_size,
+    resize_to_fit,
+    stretch_to_uint8,
+)
+from geo_assistant.raster.streaming import cube_path, read_chips, read_stretch_limits
 
 dotenv.load_dotenv()
 
+IMAGE_MODEL_NAME = os.environ.get("OLLAMA_IMAGE_MODEL", "ministral-3:14b-cloud")
+
+# Longest image side in pixels each vision model works on, by model name
+# prefix. Models downsample larger images themselves, so they are shrunk before
+# the upload instead.
+IMAGE_MODEL_INPUT_SIZES = {
+    "gemma3": 896,
+    "llama3.2-vision": 1120,
+    "llava": 672,
+    "minicpm-v": 1344,
+    "ministral-3": 1024,
+    "mistral-small3": 1540,
+    "moondream": 378,
+    "qwen2.5vl": 1024,
+}
+DEFAULT_IMAGE_INPUT_SIZE = 1024
+# Longest image side sent to the vision model, 0 for the size of the model.
+SUMMARY_IMAGE_SIZE = int(os.environ.get("SUMMARY_IMAGE_SIZE", "0"))
+# JPEG quality of the images re-encoded for the vision model.
+SUMMARY_IMAGE_QUALITY = int(os.environ.get("SUMMARY_IMAGE_QUALITY", "75"))
+
+# 'single' summarizes the fetched image in one model call, 'tiled' cuts the
+# cached cube into chips, summarizes them concurrently and merges the chip
+# descriptions in a last call.
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "single")
+# Width and height in pixels of the chips sent to the model in 'tiled' mode.
+SUMMARY_CHIP_SIZE = int(os.environ.get("SUMMARY_CHIP_SIZE", "512"))
+# Maximum number of chips per image, larger images are decimated to fit.
+SUMMARY_MAX_CHIPS = int(os.environ.get("SUMMARY_MAX_CHIPS", "16"))
+# Number of chips summarized at the same time.
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "4"))
+# Number of chip descriptions kept in memory, keyed by model and chip.
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "1024"))
+
+_CHIP_WINDOW = 1000
+
 
 class SatImgSummary(dspy.Signature):
     """Describe things you see in the satellite image."""
@@ -23,15 +78,26 @@ class SatImgSummary(dspy.Signature):
     answer: str = dspy.OutputField(desc="Description of the image")
 
 
+class SatImgChipsSummary(dspy.Signature):
+    """Describe a satellite image from the descriptions of its tiles."""
+
+    chip_descriptions: list[str] = dspy.InputField(
+        desc="Descriptions of the tiles of the image, row by row from the top left",
+    )
+    answer: str = dspy.OutputField(desc="Description of the whole image")
+
+
 class SatImgSummaryAgent(dspy.Module):
     """Agent for generating summaries of satellite images using an LLM."""
 
     def __init__(
         self,
-        model: str = os.environ.get("OLLAMA_IMAGE_MODEL", "ministral-3:14b-cloud"),
+        model: str = IMAGE_MODEL_NAME,
         api_base: str = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
         temperature: float = 0.5,
         max_tokens: int = 4_096,
+        image_size: int = SUMMARY_IMAGE_SIZE,
+        image_quality: int = SUMMARY_IMAGE_QUALITY,
     ) -> None:
         """
         Initialize the satellite image summary agent.
@@ -41,6 +107,9 @@ class SatImgSummaryAgent(dspy.Module):
             api_base: Base URL for the Ollama API
             temperature: Sampling temperature (0-1)
             max_tokens: Maximum tokens to generate
+            image_size: Longest image side sent to the model, 0 for the input
+                size of the model
+            image_quality: JPEG quality of the images resized for the model
         """
         super().__init__()
         self.ollama_model = dspy.LM(
@@ -52,24 +121,216 @@ class SatImgSummaryAgent(dspy.Module):
         )
         dspy.configure(lm=self.ollama_model)
         self.summarizer = dspy.Predict(SatImgSummary)
+        self.aggregator = dspy.Predict(SatImgChipsSummary)
+        self.image_size = image_size or model_input_size(model)
+        self.image_quality = image_quality
 
-    def forward(self, img_url: str) -> dspy.Prediction:
+    def prepare_image(self, img: str | np.ndarray) -> str:
+        """Image URL of `img` at the input size of the model, see `image_url`."""
+        return image_url(img, self.image_size, self.image_quality)
+
+    def forward(self, img_url: str | np.ndarray) -> dspy.Prediction:
         """
         Generate a summary for the given image URL.
 
         Args:
-            img_url: URL of the image to summarize
+            img_url: URL of the image to summarize, or uint8 raster
 
         Returns:
             dspy.Prediction containing the image summary
         """
-        return self.summarizer(img=dspy.Image(img_url))
+        return self.summarizer(img=dspy.Image(self.prepare_image(img_url)))
+
+    async def aforward(self, img_url: str | np.ndarray) -> dspy.Prediction:
+        """
+        Generate a summary for the given image URL without blocking the event loop.
+
+        Args:
+            img_url: URL of the image to summarize, or uint8 raster
+
+        Returns:
+            dspy.Prediction containing the image summary
+        """
+        img_url = await asyncio.to_thread(self.prepare_image, img_url)
+        return await self.summarizer.acall(img=dspy.Image(img_url))
+
+    async def aaggregate(self, chip_descriptions: list[str]) -> dspy.Prediction:
+        """
+        Merge the descriptions of the chips of an image into one summary.
+
+        Args:
+            chip_descriptions: Descriptions of the chips, row by row from the
+                top left.
+
+        Returns:
+            dspy.Prediction containing the image summary
+        """
+        return await self.aggregator.acall(chip_descriptions=chip_descriptions)
+
+
+def model_input_size(model: str) -> int:
+    """Longest image side the vision `model` works on, by its name prefix."""
+    name = model.removeprefix("ollama/")
+    prefixes = [prefix for prefix in IMAGE_MODEL_INPUT_SIZES if name.startswith(prefix)]
+    if not prefixes:
+        return DEFAULT_IMAGE_INPUT_SIZE
+    return IMAGE_MODEL_INPUT_SIZES[max(prefixes, key=len)]
+
+
+def image_url(img: str | np.ndarray, max_size: int, quality: int) -> str:
+    """
+    Image URL for the vision model, at most `max_size` pixels on its longest side.
+
+    Raw uint8 rasters are resized and encoded once. Base 64 data URLs that fit
+    are returned as is, their size is read from the image headers without
+    decoding the rest. Other URLs are left to the model.
+
+    Args:
+        img: uint8 raster of shape (y, x, band), or image URL.
+        max_size: Maximum width and height.
+        quality: JPEG quality of resized images (1-100).
+
+    Returns:
+        The image URL.
+    """
+    if isinstance(img, np.ndarray):
+        data = encode_image(resize_to_fit(img, max_size), "jpeg", quality)
+    else:
+        prefix, sep, img_base64 = img.partition(";base64,")
+        if not (prefix.startswith("data:") and sep):
+            return img
+        size = image_size(img_base64)
+        if size is not None and max(size) <= max_size:
+            return img
+        data = fit_image(base64.b64decode(img_base64), max_size, "jpeg", quality)
+    img_base64 = base64.b64encode(data).decode("utf-8")
+    return f"data:{image_mime_type(img_base64)};base64,{img_base64}"
 
 
 # Singleton instance to avoid repeated initialization
 _SUMMARIZER_AGENT = SatImgSummaryAgent()
 
 
+@dataclass
+class ChipSummary:
+    """Description of a chip of an image and the latency of its model call."""
+
+    row: int
+    col: int
+    answer: str
+    latency: float
+    cached: bool
+
+
+class ChipSummaryStats:
+    """Statistics over the recent chip summaries of the process."""
+
+    def __init__(self, window: int = _CHIP_WINDOW) -> None:
+        """Initialize empty statistics over the last `window` chips."""
+        self.count = 0
+        self.cache_hits = 0
+        self.latencies: deque[float] = deque(maxlen=window)
+
+    def record(self, chip: ChipSummary) -> None:
+        """Record a chip summary, the latency of model calls only."""
+        self.count += 1
+        if chip.cached:
+            self.cache_hits += 1
+        else:
+            self.latencies.append(chip.latency)
+
+    def stats(self) -> dict:
+        """Chip count, cache hits and model call latency in seconds."""
+        stats: dict = {"count": self.count, "cache_hits": self.cache_hits}
+        if not self.latencies:
+            return stats
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)]
+        stats["latency_seconds"] = {
+            "mean": statistics.fmean(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": p95,
+            "max": latencies[-1],
+        }
+        return stats
+
+
+# Chip summaries of every tiled summarization of the process.
+CHIP_SUMMARY_STATS = ChipSummaryStats()
+
+# Chip descriptions by hash of the model and chip image, least recently used
+# first.
+_CHIP_CACHE: OrderedDict[str, str] = OrderedDict()
+
+
+def _encode_chips(
+    path: Path,
+    max_size: int,
+    quality: int,
+) -> list[tuple[int, int, str]]:
+    """Read a cached cube as chips, encoded for the model as image data URLs."""
+    vmin, vmax = read_stretch_limits(path)
+    return [
+        (row, col, image_url(stretch_to_uint8(arr, vmin, vmax), max_size, quality))
+        for row, col, arr in read_chips(path, SUMMARY_CHIP_SIZE, SUMMARY_MAX_CHIPS)
+    ]
+
+
+async def summarize_chips(
+    chips: list[tuple[int, int, str]],
+    agent: SatImgSummaryAgent | None = None,
+    concurrency: int = SUMMARY_CONCURRENCY,
+    stats: ChipSummaryStats = CHIP_SUMMARY_STATS,
+) -> tuple[str, list[ChipSummary]]:
+    """
+    Summarize the chips of an image concurrently and merge their descriptions.
+
+    Chips summarized before with the same model are taken from an in-memory
+    cache. An image of a single chip is not merged.
+
+    Args:
+        chips: Row, column and image data URL of each chip.
+        agent: Summary agent, the module one by default.
+        concurrency: Maximum number of chips summarized at the same time.
+        stats: Statistics recording each chip summary.
+
+    Returns:
+        The summary of the image and the summary of each chip, in the order of
+        `chips`.
+    """
+    agent = agent or _SUMMARIZER_AGENT
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(row: int, col: int, img_url: str) -> ChipSummary:
+        key = hashlib.sha256(
+            f"{agent.ollama_model.model}|{img_url}".encode(),
+        ).hexdigest()
+        if key in _CHIP_CACHE:
+            _CHIP_CACHE.move_to_end(key)
+            chip = ChipSummary(row, col, _CHIP_CACHE[key], 0.0, cached=True)
+        else:
+            async with semaphore:
+                start = time.perf_counter()
+                prediction = await agent.acall(img_url)
+                latency = time.perf_counter() - start
+            _CHIP_CACHE[key] = prediction.answer
+            while len(_CHIP_CACHE) > SUMMARY_CACHE_SIZE:
+                _CHIP_CACHE.popitem(last=False)
+            chip = ChipSummary(row, col, prediction.answer, latency, cached=False)
+        stats.record(chip)
+        return chip
+
+    summaries = await asyncio.gather(*(summarize(*chip) for chip in chips))
+    if len(summaries) == 1:
+        return summaries[0].answer, summaries
+    descriptions = [
+        f"Tile row {chip.row + 1}, column {chip.col + 1}: {chip.answer}"
+        for chip in summaries
+    ]
+    prediction = await agent.aaggregate(descriptions)
+    return prediction.answer, summaries
+
+
 @tool
 async def summarize_sat_img(
     state: Annotated[GeoAssistantState, InjectedState],
@@ -79,7 +340,8 @@ async def summarize_sat_img(
     Summarize the contents of a satellite image using an LLM.
 
     Args:
-        state: Pass in 'naip_img_bytes' as state into this agent.
+        state: Pass in 'naip_img_bytes' as state into this agent. In 'tiled'
+            mode, the cached cube of 'naip_cube' is summarized chip by chip.
         tool_call_id: Optional ID for tracking the tool call.
 
     Returns:
@@ -99,13 +361,30 @@ async def summarize_sat_img(
                 ],
             },
         )
-    img_url = f"data:image/jpeg;base64,{state['naip_img_bytes']}"
-    summary = _SUMMARIZER_AGENT(img_url)
-    message_content = summary.answer
+    cube = state.get("naip_cube")
+    if SUMMARY_MODE == "tiled" and cube and cube_path(cube).exists():
+        chips = await asyncio.to_thread(
+            _encode_chips,
+            cube_path(cube),
+            _SUMMARIZER_AGENT.image_size,
+            _SUMMARIZER_AGENT.image_quality,
+        )
+        message_content, summaries = await summarize_chips(chips)
+        artifact = {"chips": [asdict(chip) for chip in summaries]}
+    else:
+        img_base64 = state["naip_img_bytes"]
+        img_url = f"data:{image_mime_type(img_base64)};base64,{img_base64}"
+        summary = await _SUMMARIZER_AGENT.acall(img_url)
+        message_content = summary.answer
+        artifact = None
     return Command(
         update={
             "messages": [
-                ToolMessage(content=message_content, tool_call_id=tool_call_id),
+                ToolMessage(
+                    content=message_content,
+                    artifact=artifact,
+                    tool_call_id=tool_call_id,
+                ),
             ],
         },
     )
@@ -0,0 +1,294 @@
+"""
+Overture place category taxonomy, and category-clustered place extracts.
+
+Run at ingest time, after downloading the Overture places:
+
+    uv run python -m geo_assistant.vector.categories --cluster data/overture/clustered/places.parquet
+
+This writes the table of the dataset's categories used to resolve the place
+types asked for by users, and a copy of the places sorted by category, so that
+category-filtered queries skip the row groups of every other category.
+"""
+
+import argparse
+import difflib
+import functools
+import os
+import re
+from pathlib import Path
+
+import duckdb
+from dotenv import load_dotenv
+
+from geo_assistant.vector.extensions import connect
+
+load_dotenv()
+
+OVERTURE_CATEGORIES_PATH = Path(
+    os.environ.get("OVERTURE_CATEGORIES_PATH", "data/overture/categories.parquet"),
+)
+# Places per row group of clustered extracts: smaller groups prune more finely
+# at the cost of more metadata.
+CLUSTER_ROW_GROUP_SIZE = 100_000
+
+# Top-level copy of `categories.primary` in clustered extracts: DuckDB prunes
+# row groups on the statistics of top-level columns, not of struct fields.
+CATEGORY_COLUMN = "primary_category"
+# Categories resolved before the category table is built.
+DEFAULT_CATEGORIES = ("restaurant", "cafe", "bar")
+# Common names of categories, whatever the dataset.
+SYNONYMS = {
+    "coffee": "cafe",
+    "coffee_shop": "cafe",
+    "coffeeshop": "cafe",
+    "pub": "bar",
+}
+
+
+def normalize_term(term: str) -> str:
+    """Lowercase a term and join its words with underscores, as categories are."""
+    return re.sub(r"[^a-z0-9]+", "_", term.lower()).strip("_")
+
+
+def _singulars(term: str) -> list[str]:
+    """Candidate singular forms of a term, e.g. 'bakeries' -> 'bakery'."""
+    candidates = []
+    if term.endswith("ies"):
+        candidates.append(term[:-3] + "y")
+    if term.endswith("es"):
+        candidates.append(term[:-2])
+    if term.endswith("s"):
+        candidates.append(term[:-1])
+    return candidates
+
+
+class CategoryIndex:
+    """In-memory index resolving user terms to Overture primary categories."""
+
+    def __init__(self, counts: dict[str, int]):
+        """
+        Index categories.
+
+        Args:
+            counts: Number of places of each primary category.
+        """
+        self.counts = counts
+        self.categories = sorted(counts, key=lambda c: (-counts[c], c))
+
+    def resolve(self, term: str, cutoff: float = 0.8) -> str:
+        """
+        Resolve a place type to the primary category it most likely means.
+
+        Synonyms come first, then exact matches of the term or of its singular,
+        then the closest category name, e.g. 'italian restaurants' resolves to
+        'italian_restaurant' and 'bakerys' to 'bakery'. Unknown terms are
+        returned normalized.
+
+        Args:
+            term: Place type, as asked for by the user.
+            cutoff: Minimum similarity, between 0 and 1, of a fuzzy match.
+
+        Returns:
+            The primary category.
+        """
+        key = normalize_term(term)
+        for candidate in [key, *_singulars(key)]:
+            if candidate in SYNONYMS:
+                return SYNONYMS[candidate]
+            if candidate in self.counts:
+                return candidate
+        # Most frequent categories first among equally close matches.
+        matches = difflib.get_close_matches(key, self.categories, n=1, cutoff=cutoff)
+        return matches[0] if matches else key
+
+
+@functools.cache
+def load_category_index(path: Path = OVERTURE_CATEGORIES_PATH) -> CategoryIndex:
+    """The category index of the ingested dataset, default categories if not built."""
+    if not path.exists():
+        return CategoryIndex(dict.fromkeys(DEFAULT_CATEGORIES, 0))
+    rows = duckdb.execute(
+        "SELECT category, primary_count FROM read_parquet(?) WHERE primary_count > 0",
+        [str(path)],
+    ).fetchall()
+    return CategoryIndex(dict(rows))
+
+
+# Whether the extract at a path is clustered, read from its schema once.
+_clustered_extracts: dict[str, bool] = {}
+
+
+def category_filter(
+    connection: duckdb.DuckDBPyConnection,
+    data_path: str,
+    category: str,
+) -> str:
+    """
+    SQL predicate selecting the places of a primary category.
+
+    On clustered extracts, the predicate is on their top-level category column
+    so that DuckDB skips the row groups of other categories.
+
+    Args:
+        connection: Connection that reads the extract.
+        data_path: Overture places Parquet files, a path or glob.
+        category: Primary category.
+
+    Returns:
+        The predicate.
+    """
+    if data_path not in _clustered_extracts:
+        columns = connection.execute(
+            f"DESCRIBE SELECT * FROM read_parquet('{data_path}')",
+        ).fetchall()
+        _clustered_extracts[data_path] = any(
+            column[0] == CATEGORY_COLUMN for column in columns
+        )
+    column = CATEGORY_COLUMN if _clustered_extracts[data_path] else "categories.primary"
+    return f"{column} = '{category}'"
+
+
+def _connect_to(data_path: str) -> duckdb.DuckDBPyConnection:
+    """Connection reading `data_path`, from S3 with httpfs."""
+    if not data_path.startswith("s3://"):
+        return connect([])
+    connection = connect(["httpfs"])
+    connection.execute("SET s3_region='us-west-2';")
+    return connection
+
+
+def build_category_table(data_path: str, output: Path) -> int:
+    """
+    Write the distinct primary and alternate categories of places, with counts.
+
+    Args:
+        data_path: Overture places Parquet files, a path or glob.
+        output: Parquet file of the category table.
+
+    Returns:
+        Number of categories.
+    """
+    output.parent.mkdir(parents=True, exist_ok=True)
+    connection = _connect_to(data_path)
+    try:
+        connection.execute(
+            f"""
+            COPY (
+                WITH places AS (
+                    SELECT categories.primary AS p, categories.alternate AS a
+                    FROM read_parquet('{data_path}', hive_partitioning=false)
+                ),
+                categories AS (
+                    SELECT p AS category, 1 AS is_primary FROM places
+                    UNION ALL
+                    SELECT unnest(a) AS category, 0 AS is_primary FROM places
+                )
+                SELECT
+                    category,
+                    sum(is_primary) AS primary_count,
+                    count(*) - sum(is_primary) AS alternate_count
+                FROM categories
+                WHERE category IS NOT NULL
+                GROUP BY category
+                ORDER BY primary_count DESC, category
+            ) TO '{output}' (FORMAT parquet);
+            """,
+        )
+        (count,) = connection.execute(
+            f"SELECT count(*) FROM read_parquet('{output}')",
+        ).fetchone()
+    finally:
+        connection.close()
+    load_category_index.cache_clear()
+    return count
+
+
+def cluster_places(
+    data_path: str,
+    output: Path,
+    row_group_size: int = CLUSTER_ROW_GROUP_SIZE,
+) -> None:
+    """
+    Write a copy of the places sorted by primary category, then location.
+
+    Each row group then holds few categories, and DuckDB skips the row groups
+    whose statistics of the added `primary_category` column exclude the
+    queried one. Geometries are copied as is, with the GeoParquet metadata of
+    the source.
+
+    Args:
+        data_path: Overture places Parquet files, a path or glob.
+        output: Parquet file of the clustered places.
+        row_group_size: Places per row group.
+    """
+    output.parent.mkdir(parents=True, exist_ok=True)
+    connection = _connect_to(data_path)
+    try:
+        geo = connection.execute(
+            f"""
+            SELECT decode(value) FROM parquet_kv_metadata('{data_path}')
+            WHERE decode(key) = 'geo'
+            LIMIT 1
+            """,
+        ).fetchone()
+        kv_metadata = (
+            ", KV_METADATA {{geo: '{}'}}".format(geo[0].replace("'", "''"))
+            if geo
+            else ""
+        )
+        connection.execute(
+            f"""
+            COPY (
+                SELECT *, categories.primary AS {CATEGORY_COLUMN}
+                FROM read_parquet('{data_path}', hive_partitioning=false)
+                ORDER BY {CATEGORY_COLUMN}, bbox.ymin, bbox.xmin
+            ) TO '{output}' (
+                FORMAT parquet,
+                COMPRESSION zstd,
+                ROW_GROUP_SIZE {row_group_size}{kv_metadata}
+            );
+            """,
+        )
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    """Build the category table, and optionally a clustered extract."""
+    parser = argparse.ArgumentParser(
+        description="Ingest the Overture place categories.",
+    )
+    parser.add_argument(
+        "--input",
+        default=os.environ.get("OVERTURE_LOCAL_PATH", "data/overture/places/*"),
+        help="Overture places Parquet files (default: OVERTURE_LOCAL_PATH)",
+    )
+    parser.add_argument(
+        "--categories",
+        type=Path,
+        default=OVERTURE_CATEGORIES_PATH,
+        help=f"category table to write (default: {OVERTURE_CATEGORIES_PATH})",
+    )
+    parser.add_argument(
+        "--cluster",
+        type=Path,
+        help="also write the places sorted by category to this Parquet file",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=CLUSTER_ROW_GROUP_SIZE,
+        help=f"places per row group of the clustered file "
+        f"(default: {CLUSTER_ROW_GROUP_SIZE})",
+    )
+    args = parser.parse_args()
+
+    count = build_category_table(args.input, args.categories)
+    print(f"{count} categories written to {args.categories}")
+    if args.cluster:
+        cluster_places(args.input, args.cluster, args.row_group_size)
+        print(f"Places clustered by category written to {args.cluster}")
+
+
+if __name__ == "__main__":
+    main()
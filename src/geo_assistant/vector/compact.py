@@ -0,0 +1,156 @@
+"""
+Compaction of the GeoJSON geometries kept in the agent state.
+
+The tools compact the geometries they return, once, and the chat stream sends
+them as stored.
+"""
+
+import os
+
+import shapely
+from dotenv import load_dotenv
+from geojson_pydantic import Feature, FeatureCollection
+from geojson_pydantic.geometries import Geometry
+from pydantic import TypeAdapter
+
+load_dotenv()
+
+# Decimal digits kept in the coordinates of the geometries of the agent state,
+# 6 digits is about 0.1 m.
+GEOMETRY_PRECISION = int(os.environ.get("GEOMETRY_PRECISION", "6"))
+# Maximum distance in metres, about, by which search areas are simplified.
+GEOMETRY_TOLERANCE_M = float(os.environ.get("GEOMETRY_TOLERANCE_M", "25"))
+
+# Metres per degree of latitude, the tolerance in degrees is an upper bound of
+# the tolerance in metres in both directions.
+_METRES_PER_DEGREE = 111_320.0
+
+Bounds = tuple[float, float, float, float]
+
+_GEOMETRY = TypeAdapter(Geometry)
+
+
+def quantize(geom: shapely.Geometry, precision: int) -> shapely.Geometry:
+    """Snap the coordinates of a geometry to a grid of `precision` decimal digits."""
+    return shapely.set_precision(geom, 10.0**-precision)
+
+
+def simplify_containing(
+    geom: shapely.Geometry,
+    tolerance_m: float = GEOMETRY_TOLERANCE_M,
+    precision: int = GEOMETRY_PRECISION,
+) -> shapely.Geometry:
+    """
+    Simplify and quantize a polygon so that it still contains the original.
+
+    The polygon is simplified, then the simplified polygon is grown by the
+    distance of the farthest original vertex left outside, plus the quantization
+    step. For a buffered point, that turns the simplified inscribed polygon into
+    the circumscribed one. A search area compacted this way can only gain
+    places within about the tolerance of its edge, never lose any.
+
+    Args:
+        geom: Polygon or multipolygon in EPSG:4326.
+        tolerance_m: Simplification tolerance in metres.
+        precision: Decimal digits of the coordinates.
+
+    Returns:
+        The compacted polygon. If simplifying does not remove vertices, the
+        original grown by the quantization step, so that it still contains it.
+    """
+    if geom.geom_type not in ("Polygon", "MultiPolygon"):
+        return quantize(geom, precision)
+
+    step = 10.0**-precision
+    compacted = quantize(geom.buffer(step, join_style="mitre"), precision)
+    if tolerance_m > 0:
+        simplified = geom.simplify(
+            tolerance_m / _METRES_PER_DEGREE,
+            preserve_topology=True,
+        )
+        outside = shapely.distance(
+            shapely.points(shapely.get_coordinates(geom)),
+            simplified,
+        ).max()
+        simplified = quantize(
+            simplified.buffer(outside + step, join_style="mitre"),
+            precision,
+        )
+        if shapely.get_num_coordinates(simplified) < shapely.get_num_coordinates(
+            compacted,
+        ):
+            compacted = simplified
+    # Guard against degenerate inputs, the original is always safe.
+    return compacted if compacted.contains(geom) else geom
+
+
+def compact_geometry(
+    geometry: Geometry | dict,
+    precision: int = GEOMETRY_PRECISION,
+    tolerance_m: float | None = None,
+) -> dict:
+    """
+    Compact a GeoJSON geometry.
+
+    Args:
+        geometry: GeoJSON geometry.
+        precision: Decimal digits of the coordinates.
+        tolerance_m: Simplification tolerance in metres of polygons, which keep
+            containing the original, see `simplify_containing`. None only
+            quantizes the coordinates.
+
+    Returns:
+        The compacted GeoJSON geometry.
+    """
+    geom = shapely.geometry.shape(geometry)
+    if tolerance_m is None:
+        compacted = quantize(geom, precision)
+    else:
+        compacted = simplify_containing(geom, tolerance_m, precision)
+    mapping = shapely.geometry.mapping(compacted)
+    if "coordinates" in mapping:
+        # Drop the floating point noise of the grid, e.g. 0.30000000000000004.
+        mapping["coordinates"] = _round(mapping["coordinates"], precision)
+    return mapping
+
+
+def _round(coordinates, precision: int):
+    """Round nested GeoJSON coordinates."""
+    if isinstance(coordinates, float | int):
+        return round(coordinates, precision)
+    return [_round(c, precision) for c in coordinates]
+
+
+def compact_feature(
+    feature: Feature | None,
+    precision: int = GEOMETRY_PRECISION,
+    tolerance_m: float | None = None,
+) -> Feature | None:
+    """Compact the geometry of a feature, see `compact_geometry`."""
+    if feature is None or feature.geometry is None:
+        return feature
+    geometry = compact_geometry(feature.geometry, precision, tolerance_m)
+    return feature.model_copy(
+        update={"geometry": _GEOMETRY.validate_python(geometry)},
+    )
+
+
+def compact_feature_collection(
+    collection: FeatureCollection | None,
+    precision: int = GEOMETRY_PRECISION,
+) -> FeatureCollection | None:
+    """Quantize the geometries of a feature collection."""
+    if collection is None:
+        return collection
+    return collection.model_copy(
+        update={
+            "features": [
+                compact_feature(feature, precision) for feature in collection.features
+            ],
+        },
+    )
+
+
+def geometry_bounds(geometry: Geometry | dict) -> Bounds:
+    """Bounds (minx, miny, maxx, maxy) of a GeoJSON geometry, for bbox prefilters."""
+    return tuple(shapely.geometry.shape(geometry).bounds)
@@ -0,0 +1,103 @@
+"""
+Streaming export of query results as Arrow IPC or GeoParquet.
+
+Record batches are read from a DuckDB result one at a time and written to an
+in-memory sink, whose bytes are handed out after every batch, so that exports
+of any size stream with the memory of a batch.
+"""
+
+import json
+import os
+from collections.abc import Iterator
+from typing import Literal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows per Arrow record batch, and per GeoParquet row group, of the exports.
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "65536"))
+
+ExportFormat = Literal["arrow", "parquet"]
+
+EXPORT_MEDIA_TYPES: dict[ExportFormat, str] = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FILE_SUFFIXES: dict[ExportFormat, str] = {
+    "arrow": ".arrows",
+    "parquet": ".parquet",
+}
+
+
+def geo_metadata(geometry_column: str = "geometry") -> dict:
+    """GeoParquet metadata of a WKB geometry column in longitude/latitude."""
+    return {
+        "version": "1.1.0",
+        "primary_column": geometry_column,
+        # Without a 'crs', the geometries are OGC:CRS84.
+        "columns": {geometry_column: {"encoding": "WKB", "geometry_types": []}},
+    }
+
+
+class _ChunkSink:
+    """Write-only file collecting the written bytes until drained."""
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def write_batches(
+    reader: pa.RecordBatchReader,
+    export_format: ExportFormat,
+    geometry_column: str = "geometry",
+) -> Iterator[bytes]:
+    """
+    Encode record batches as an Arrow IPC stream or a GeoParquet file.
+
+    Args:
+        reader: Record batches with a WKB `geometry_column`.
+        export_format: 'arrow' for an Arrow IPC stream, 'parquet' for
+            GeoParquet, with a row group per batch.
+        geometry_column: Column of the WKB geometries, described in the
+            GeoParquet metadata.
+
+    Yields:
+        The encoded bytes, as they are written after each batch.
+    """
+    schema = reader.schema.with_metadata(
+        {b"geo": json.dumps(geo_metadata(geometry_column)).encode()},
+    )
+    sink = _ChunkSink()
+    if export_format == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    elif export_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported export format {export_format!r}")
+
+    with writer:
+        for batch in reader:
+            writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+            if data := sink.drain():
+                yield data
+    if data := sink.drain():
+        yield data
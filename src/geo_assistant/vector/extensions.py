@@ -0,0 +1,184 @@
+"""
+DuckDB extensions provisioned into a local directory, for offline connections.
+
+Provision the extensions once per deployment, e.g. on a machine with network
+access before copying the directory to an air-gapped one:
+
+    uv run python -m geo_assistant.vector.extensions
+
+Connections then load the extensions from that directory. An extension missing
+from it is installed into it on first use, unless DUCKDB_EXTENSION_INSTALL is
+off, as it should be in air-gapped deployments.
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+
+import duckdb
+from dotenv import load_dotenv
+
+from geo_assistant.vector.s3cache import s3_cache_enabled
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DUCKDB_EXTENSION_DIR = Path(
+    os.environ.get("DUCKDB_EXTENSION_DIR", "data/duckdb_extensions"),
+)
+# Extensions used by the Overture queries, httpfs only reads from S3.
+DUCKDB_EXTENSIONS = ("spatial", "httpfs")
+# Install extensions missing from DUCKDB_EXTENSION_DIR on first use ('on'), or
+# fail without downloading anything ('off').
+DUCKDB_EXTENSION_INSTALL = os.environ.get("DUCKDB_EXTENSION_INSTALL", "on")
+
+
+def required_extensions(source: str) -> list[str]:
+    """
+    Extensions needed to query Overture places from `source`, local or s3.
+
+    httpfs is only needed to read from S3 without the S3 cache.
+    """
+    if source == "s3" and not s3_cache_enabled():
+        return ["spatial", "httpfs"]
+    return ["spatial"]
+
+
+def connect(
+    extensions: list[str],
+    extension_dir: Path = DUCKDB_EXTENSION_DIR,
+    install: bool | None = None,
+) -> duckdb.DuckDBPyConnection:
+    """
+    Open an in-memory DuckDB connection with provisioned extensions loaded.
+
+    Automatic installation and loading of extensions is disabled, so that a
+    query never triggers a download. An extension missing from `extension_dir`
+    is installed into it once, when the connection is opened.
+
+    Args:
+        extensions: Names of the extensions to load.
+        extension_dir: Directory the extensions were provisioned into.
+        install: Install the extensions missing from `extension_dir`, by
+            default unless DUCKDB_EXTENSION_INSTALL is off.
+
+    Returns:
+        The connection.
+
+    Raises:
+        RuntimeError: If an extension is not provisioned in `extension_dir` and
+            cannot be installed.
+    """
+    if install is None:
+        install = DUCKDB_EXTENSION_INSTALL != "off"
+    connection = duckdb.connect(
+        config={
+            "extension_directory": str(extension_dir),
+            "autoinstall_known_extensions": False,
+            "autoload_known_extensions": False,
+        },
+    )
+    for extension in extensions:
+        try:
+            try:
+                connection.load_extension(extension)
+            except duckdb.IOException:
+                if not install:
+                    raise
+                logger.warning(
+                    "DuckDB extension %r is not provisioned in %s, installing it",
+                    extension,
+                    extension_dir,
+                )
+                connection.install_extension(extension)
+                connection.load_extension(extension)
+        except duckdb.IOException as e:
+            connection.close()
+            installed = " and could not be installed" if install else ""
+            raise RuntimeError(
+                f"DuckDB extension {extension!r} is not provisioned in "
+                f"{extension_dir}{installed}, run "
+                "`python -m geo_assistant.vector.extensions`",
+            ) from e
+    return connection
+
+
+def provision(
+    extensions: list[str],
+    extension_dir: Path = DUCKDB_EXTENSION_DIR,
+    repository: str | None = None,
+    force: bool = False,
+) -> list[Path]:
+    """
+    Install DuckDB extensions into a local directory.
+
+    Args:
+        extensions: Names of the extensions to install.
+        extension_dir: Directory to install the extensions into.
+        repository: Repository to install from instead of DuckDB's, a URL or a
+            local directory mirroring it.
+        force: Reinstall extensions already in `extension_dir`.
+
+    Returns:
+        Paths of the installed extension files.
+    """
+    extension_dir.mkdir(parents=True, exist_ok=True)
+    connection = duckdb.connect(
+        config={"extension_directory": str(extension_dir)},
+    )
+    try:
+        for extension in extensions:
+            source = f" FROM '{repository}'" if repository else ""
+            connection.execute(
+                f"{'FORCE ' if force else ''}INSTALL {extension}{source};",
+            )
+        return [
+            Path(path)
+            for (path,) in connection.execute(
+                """
+                SELECT install_path FROM duckdb_extensions()
+                WHERE installed AND list_contains($extensions, extension_name)
+                """,
+                {"extensions": extensions},
+            ).fetchall()
+        ]
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    """Provision the DuckDB extensions from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Install DuckDB extensions for offline use.",
+    )
+    parser.add_argument(
+        "extensions",
+        nargs="*",
+        default=list(DUCKDB_EXTENSIONS),
+        help=f"extensions to install (default: {' '.join(DUCKDB_EXTENSIONS)})",
+    )
+    parser.add_argument(
+        "--dir",
+        type=Path,
+        default=DUCKDB_EXTENSION_DIR,
+        help=f"extension directory (default: {DUCKDB_EXTENSION_DIR})",
+    )
+    parser.add_argument(
+        "--repository",
+        help="repository URL or local mirror to install from",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="reinstall extensions already provisioned",
+    )
+    args = parser.parse_args()
+
+    for path in provision(args.extensions, args.dir, args.repository, args.force):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Persistent local cache of the Overture files read from S3.
+
+DuckDB reads `s3cache://` URLs through a filesystem that serves the bucket
+listings and fixed-size blocks of the files, and so their Parquet footers and
+row groups, from a SQLite database. Only what is missing is requested from S3,
+anonymously over HTTP. The database is bounded in size, evicting the least
+recently used blocks, survives restarts and can be shared by the worker
+processes of a host.
+
+Entries are keyed by object path, which includes the Overture release, and
+ETag, so that a rewritten object is never served from stale blocks.
+"""
+
+import datetime
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from fsspec.spec import AbstractBufferedFile, AbstractFileSystem
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 'disk' caches the Overture files read from S3, 'off' reads them with httpfs.
+S3_CACHE = os.environ.get("S3_CACHE", "off")
+S3_CACHE_DIR = Path(os.environ.get("S3_CACHE_DIR", "data/s3_cache"))
+# Size of the cached blocks beyond which the least recently used are evicted.
+S3_CACHE_MAX_MB = float(os.environ.get("S3_CACHE_MAX_MB", "2048"))
+# S3 API endpoint, addressed path-style, e.g. a local S3-compatible server.
+S3_ENDPOINT = os.environ.get("S3_ENDPOINT", "https://s3.us-west-2.amazonaws.com")
+# Reads are aligned on blocks of this size, small enough for footers and
+# column chunks to be fetched without much overhead.
+BLOCK_SIZE = 1 << 20
+
+_S3_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+def s3_cache_enabled() -> bool:
+    """Whether S3 is read through the cache, set by S3_CACHE."""
+    if S3_CACHE not in ("disk", "off"):
+        raise ValueError(f"Unsupported S3 cache {S3_CACHE!r}")
+    return S3_CACHE == "disk"
+
+
+def cached_url(url: str) -> str:
+    """The URL read through the cache of an `s3://` URL, unchanged if disabled."""
+    if not s3_cache_enabled() or not url.startswith("s3://"):
+        return url
+    return f"{CachedS3FileSystem.protocol}://{url.removeprefix('s3://')}"
+
+
+class S3Cache:
+    """
+    Bucket listings and file blocks in a SQLite database, bounded in size.
+
+    Listings are small and kept, blocks are evicted least recently used first
+    beyond `max_bytes`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        """
+        Open or create the cache.
+
+        Args:
+            path: SQLite database file.
+            max_bytes: Size of the cached blocks beyond which the least recently
+                used ones are evicted.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.counts: Counter[str] = Counter()
+        # DuckDB reads files from several threads.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            """,
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blocks (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """,
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS blocks_accessed ON blocks (accessed)",
+        )
+
+    def get_listing(self, key: str) -> list[dict] | None:
+        """Cached entries of a listing, None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM listings WHERE key = ?",
+                (key,),
+            ).fetchone()
+        self.counts["listing_hits" if row else "listing_misses"] += 1
+        return json.loads(row[0]) if row else None
+
+    def put_listing(self, key: str, entries: list[dict]) -> None:
+        """Store the entries of a listing."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?)",
+                (key, json.dumps(entries)),
+            )
+
+    def get_blocks(self, keys: list[str]) -> dict[str, bytes]:
+        """Cached blocks among `keys`, marked as recently used."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, data FROM blocks WHERE key IN ({','.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE blocks SET accessed = ? WHERE key = ?",
+                [(time.time(), key) for key, _ in rows],
+            )
+        self.counts["block_hits"] += len(rows)
+        self.counts["block_misses"] += len(keys) - len(rows)
+        return dict(rows)
+
+    def put_blocks(self, blocks: dict[str, bytes]) -> None:
+        """Store blocks, then evict beyond the size limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)",
+                [(key, data, len(data), now) for key, data in blocks.items()],
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blocks",
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM blocks ORDER BY accessed",
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM blocks WHERE key = ?", evicted)
+        self.counts["evictions"] += len(evicted)
+        logger.info("Evicted %d cached S3 blocks", len(evicted))
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counts, and the size of the cached blocks."""
+        with self._lock:
+            blocks, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blocks",
+            ).fetchone()
+        return {
+            "listing_hits": self.counts["listing_hits"],
+            "listing_misses": self.counts["listing_misses"],
+            "block_hits": self.counts["block_hits"],
+            "block_misses": self.counts["block_misses"],
+            "evictions": self.counts["evictions"],
+            "blocks": blocks,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedS3FileSystem(AbstractFileSystem):
+    """Read-only fsspec filesystem of a public S3 bucket, through an `S3Cache`."""
+
+    protocol = "s3cache"
+    # The cache is shared, instances are not to be reused across caches.
+    cachable = False
+
+    def __init__(self, cache: S3Cache, endpoint: str = S3_ENDPOINT, **kwargs):
+        """
+        Read from `endpoint` through `cache`.
+
+        Args:
+            cache: Listings and blocks cache.
+            endpoint: S3 API endpoint.
+            **kwargs: Passed to `AbstractFileSystem`.
+        """
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.endpoint = endpoint.rstrip("/")
+        self.client = httpx.Client(timeout=60, follow_redirects=True)
+
+    def _list_objects(self, bucket: str, prefix: str) -> list[dict]:
+        """Objects and common prefixes of a bucket 'directory', cached."""
+        key = f"{bucket}/{prefix}"
+        entries = self.cache.get_listing(key)
+        if entries is not None:
+            return entries
+
+        entries = []
+        params = {"list-type": "2", "prefix": prefix, "delimiter": "/"}
+        while True:
+            response = self.client.get(f"{self.endpoint}/{bucket}", params=params)
+            response.raise_for_status()
+            root = ET.fromstring(response.content)
+            for content in root.iter(f"{_S3_NS}Contents"):
+                entries.append(
+                    {
+                        "name": f"{bucket}/{content.findtext(f'{_S3_NS}Key')}",
+                        "size": int(content.findtext(f"{_S3_NS}Size")),
+                        "type": "file",
+                        "ETag": content.findtext(f"{_S3_NS}ETag", "").strip('"'),
+                        "LastModified": content.findtext(f"{_S3_NS}LastModified"),
+                    },
+                )
+            for common in root.iter(f"{_S3_NS}CommonPrefixes"):
+                name = common.findtext(f"{_S3_NS}Prefix").rstrip("/")
+                entries.append(
+                    {"name": f"{bucket}/{name}", "size": 0, "type": "directory"},
+                )
+            token = root.findtext(f"{_S3_NS}NextContinuationToken")
+            if not token:
+                break
+            params["continuation-token"] = token
+        self.cache.put_listing(key, entries)
+        return entries
+
+    def ls(self, path: str, detail: bool = True, **kwargs):
+        """Entries of a bucket 'directory', or the entry of a file."""
+        path = self._strip_protocol(path).rstrip("/")
+        bucket, _, prefix = path.partition("/")
+        entries = self._list_objects(bucket, f"{prefix}/" if prefix else "")
+        if not entries and prefix:
+            # Not a directory, list the parent to find the file.
+            parent, _, _ = prefix.rpartition("/")
+            entries = [
+                entry
+                for entry in self._list_objects(bucket, f"{parent}/" if parent else "")
+                if entry["name"] == path
+            ]
+            if not entries:
+                raise FileNotFoundError(path)
+        return entries if detail else [entry["name"] for entry in entries]
+
+    def modified(self, path: str) -> datetime.datetime:
+        """Last modification time of a file, from the cached listing."""
+        return datetime.datetime.fromisoformat(self.info(path)["LastModified"])
+
+    def read_range(
+        self,
+        path: str,
+        etag: str,
+        size: int,
+        start: int,
+        end: int,
+    ) -> bytes:
+        """
+        Bytes `start` to `end` of a file, from cached blocks where possible.
+
+        Missing blocks are fetched with one range request per contiguous run.
+        """
+        end = min(end, size)
+        if start >= end:
+            return b""
+        first, last = start // BLOCK_SIZE, (end - 1) // BLOCK_SIZE
+        keys = {i: f"{path}@{etag}:{i}" for i in range(first, last + 1)}
+        blocks = self.cache.get_blocks(list(keys.values()))
+
+        missing = [i for i in keys if keys[i] not in blocks]
+        fetched = {}
+        while missing:
+            run_start = run_end = missing.pop(0)
+            while missing and missing[0] == run_end + 1:
+                run_end = missing.pop(0)
+            bucket, _, key = path.partition("/")
+            response = self.client.get(
+                f"{self.endpoint}/{bucket}/{key}",
+                headers={
+                    "Range": f"bytes={run_start * BLOCK_SIZE}-"
+                    f"{min((run_end + 1) * BLOCK_SIZE, size) - 1}",
+                },
+            )
+            response.raise_for_status()
+            # A server ignoring the range sends the whole file.
+            skip = run_start * BLOCK_SIZE if response.status_code == 200 else 0
+            for i in range(run_start, run_end + 1):
+                offset = skip + (i - run_start) * BLOCK_SIZE
+                fetched[keys[i]] = response.content[offset : offset + BLOCK_SIZE]
+        if fetched:
+            self.cache.put_blocks(fetched)
+            blocks |= fetched
+
+        data = b"".join(blocks[keys[i]] for i in range(first, last + 1))
+        offset = first * BLOCK_SIZE
+        return data[start - offset : end - offset]
+
+    def _open(self, path: str, mode: str = "rb", **kwargs):
+        if mode != "rb":
+            raise NotImplementedError("The S3 cache is read-only")
+        return CachedS3File(self, self._strip_protocol(path), mode, **kwargs)
+
+
+class CachedS3File(AbstractBufferedFile):
+    """File read through `CachedS3FileSystem.read_range`."""
+
+    def __init__(self, fs: CachedS3FileSystem, path: str, mode: str, **kwargs):
+        """Open a file, its size and ETag come from the cached listing."""
+        self.etag = fs.info(path).get("ETag", "")
+        kwargs.pop("cache_type", None)
+        # Blocks are cached by the filesystem, reads go straight to it.
+        super().__init__(fs, path, mode, cache_type="none", **kwargs)
+
+    def _fetch_range(self, start: int, end: int) -> bytes:
+        return self.fs.read_range(self.path, self.etag, self.size, start, end)
+
+
+@functools.cache
+def cached_s3_filesystem() -> CachedS3FileSystem:
+    """The filesystem reading through the cache set up by S3_CACHE_*."""
+    return CachedS3FileSystem(
+        S3Cache(
+            S3_CACHE_DIR / "s3.sqlite",
+            max_bytes=int(S3_CACHE_MAX_MB * 2**20),
+        ),
+    )
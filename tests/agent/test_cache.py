@@ -0,0 +1,136 @@
+"""Tests for the agent model's response cache."""
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration
+
+from geo_assistant.agent.cache import LLM_CACHE_BYPASS, DiskLLMCache, normalize_prompt
+from geo_assistant.agent.state import GeoAssistantState
+
+
+class CountingChatModel(FakeMessagesListChatModel):
+    """Fake chat model that counts the calls reaching it."""
+
+    calls: int = 0
+
+    def bind_tools(self, tools, **kwargs):
+        """Ignore the tools, the responses are scripted."""
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def _conversation(call_id: str, message_id: str) -> list:
+    return [
+        HumanMessage("Find Lisbon", id=message_id),
+        AIMessage(
+            "",
+            id=f"ai-{message_id}",
+            tool_calls=[
+                {"name": "get_place", "args": {}, "id": call_id, "type": "tool_call"},
+            ],
+            response_metadata={"created_at": message_id},
+        ),
+        ToolMessage("Found Lisbon", tool_call_id=call_id, id=f"tool-{message_id}"),
+    ]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Empty response cache."""
+    return DiskLLMCache(tmp_path / "responses.sqlite", model="test", max_bytes=2**20)
+
+
+def test_normalize_prompt():
+    """Conversations differing only by ids and metadata share a key."""
+    first = dumps(_conversation("call-1", "a"))
+    second = dumps(_conversation("call-2", "b"))
+    assert normalize_prompt(first) == normalize_prompt(second)
+    other = dumps([HumanMessage("Find Porto"), *_conversation("call-1", "a")[1:]])
+    assert normalize_prompt(first) != normalize_prompt(other)
+
+
+def test_cache_key(cache, tmp_path):
+    """Keys depend on the model and the invocation parameters, e.g. tools."""
+    prompt = dumps(_conversation("call-1", "a"))
+    other_model = DiskLLMCache(tmp_path / "other.sqlite", model="other", max_bytes=1)
+    assert cache.key(prompt, "tools=[a]") == cache.key(prompt, "tools=[a]")
+    assert cache.key(prompt, "tools=[a]") != cache.key(prompt, "tools=[b]")
+    assert cache.key(prompt, "tools=[a]") != other_model.key(prompt, "tools=[a]")
+
+
+async def test_cached_agent(cache):
+    """Repeated questions are answered from the cache, with fresh ids."""
+    response = AIMessage(
+        "",
+        tool_calls=[{"name": "get_place", "args": {}, "id": "1", "type": "tool_call"}],
+    )
+    model = CountingChatModel(responses=[response], cache=cache)
+    agent = create_agent(model=model, tools=[], state_schema=GeoAssistantState)
+    question = {"messages": [HumanMessage("Find Lisbon")]}
+
+    first = await model.ainvoke(question["messages"])
+    second = await model.ainvoke(question["messages"])
+    assert model.calls == 1
+    assert cache.stats() | {"bytes": 0} == {
+        "hits": 1,
+        "misses": 1,
+        "bypasses": 0,
+        "evictions": 0,
+        "entries": 1,
+        "bytes": 0,
+        "max_bytes": 2**20,
+    }
+    assert second.tool_calls[0]["name"] == "get_place"
+    assert second.tool_calls[0]["id"] != first.tool_calls[0]["id"]
+    assert second.id != first.id
+
+    LLM_CACHE_BYPASS.set(True)
+    try:
+        await model.ainvoke(question["messages"])
+    finally:
+        LLM_CACHE_BYPASS.set(False)
+    assert model.calls == 2
+    assert cache.stats()["bypasses"] == 1
+
+    # Through the agent, the graph's message ids don't change the key.
+    model.responses = [AIMessage("Lisbon is in Portugal.")]
+    model.i = 0
+    for _ in range(2):
+        result = await agent.ainvoke({"messages": [HumanMessage("Where is Lisbon?")]})
+        assert result["messages"][-1].content == "Lisbon is in Portugal."
+    assert model.calls == 3
+
+
+def test_eviction(tmp_path):
+    """Least recently used responses are evicted beyond the size limit."""
+
+    def generations(text: str) -> list:
+        return [ChatGeneration(message=AIMessage(text))]
+
+    # Room for 3 responses.
+    max_bytes = 3 * len(dumps(generations("answer " * 20)))
+    cache = DiskLLMCache(
+        tmp_path / "responses.sqlite",
+        model="test",
+        max_bytes=max_bytes,
+    )
+
+    prompts = [dumps([HumanMessage(f"question {i}")]) for i in range(4)]
+    for prompt in prompts[:3]:
+        cache.update(prompt, "", generations("answer " * 20))
+    # Touch the oldest, the second is now the least recently used.
+    assert cache.lookup(prompts[0], "") is not None
+    cache.update(prompts[3], "", generations("answer " * 20))
+
+    stats = cache.stats()
+    assert stats["bytes"] <= max_bytes
+    assert stats["evictions"] == 1
+    assert cache.lookup(prompts[0], "") is not None
+    assert cache.lookup(prompts[1], "") is None
+    assert cache.lookup(prompts[3], "") is not None
@@ -0,0 +1,157 @@
+"""Tests for tool call time limits and the cancellation of blocking work."""
+
+import asyncio
+import threading
+import time
+from typing import Annotated
+
+import pytest
+from conftest import ScriptedChatModel
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.types import Command
+
+from geo_assistant.agent import cancellation
+from geo_assistant.agent.cancellation import (
+    ToolTimeLimitMiddleware,
+    ToolTimeoutError,
+    to_thread_cancellable,
+    tool_timeout,
+    with_time_limit,
+)
+from geo_assistant.agent.scheduler import ToolCallSchedulerMiddleware
+from geo_assistant.agent.state import GeoAssistantState
+
+
+def test_tool_timeout(monkeypatch):
+    """Tools use the default time limit unless overridden, 0 disables it."""
+    monkeypatch.setattr(cancellation, "TOOL_TIMEOUT", 30.0)
+    monkeypatch.setattr(
+        cancellation,
+        "TOOL_TIMEOUTS",
+        {"fetch_naip_img": 600, "get_place": 0},
+    )
+    assert tool_timeout("get_search_area") == 30
+    assert tool_timeout("fetch_naip_img") == 600
+    assert tool_timeout("get_place") is None
+
+
+async def test_cancelled_thread_is_interrupted(blocking_work):
+    """Cancelling the caller interrupts the thread and waits for it to stop."""
+    work = blocking_work
+    task = asyncio.create_task(
+        to_thread_cancellable(work, interrupt=work.interrupted.set),
+    )
+    await asyncio.to_thread(work.started.wait)
+
+    start = time.perf_counter()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert work.stopped.is_set()
+    assert time.perf_counter() - start < 1
+
+
+async def test_interrupt_is_repeated_until_the_work_stops(blocking_work):
+    """An interrupt sent before the work starts is sent again."""
+    calls = []
+    started = threading.Event()
+
+    def interrupt():
+        calls.append(started.is_set())
+        if started.is_set():
+            work.interrupted.set()
+
+    def late_start() -> str:
+        time.sleep(0.2)
+        started.set()
+        return work()
+
+    work = blocking_work
+    task = asyncio.create_task(to_thread_cancellable(late_start, interrupt=interrupt))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert work.stopped.is_set()
+    assert calls[0] is False
+    assert calls[-1] is True
+
+
+async def test_with_time_limit(monkeypatch, blocking_work):
+    """Calls beyond their time limit are cancelled, the thread interrupted."""
+    monkeypatch.setattr(cancellation, "TOOL_TIMEOUTS", {"slow": 0.1})
+    work = blocking_work
+    with pytest.raises(ToolTimeoutError, match=r"slow was cancelled after 0\.1 s"):
+        await with_time_limit(
+            "slow",
+            to_thread_cancellable(work, interrupt=work.interrupted.set),
+        )
+    assert work.stopped.is_set()
+    assert await with_time_limit("fast", asyncio.sleep(0, result=1)) == 1
+
+
+async def test_timed_out_tool_call_answers_with_an_error(monkeypatch, blocking_work):
+    """The agent gets an error message for a timed out call, others complete."""
+    monkeypatch.setattr(cancellation, "TOOL_TIMEOUTS", {"fetch_naip_img": 0.1})
+    work = blocking_work
+
+    @tool
+    async def fetch_naip_img(
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """NAIP."""
+        await to_thread_cancellable(work, interrupt=work.interrupted.set)
+        return Command(
+            update={
+                "naip_img_bytes": "abc",
+                "messages": [ToolMessage(content="naip", tool_call_id=tool_call_id)],
+            },
+        )
+
+    @tool
+    async def get_places_within_buffer(
+        place: str,
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Places."""
+        return Command(
+            update={
+                "messages": [ToolMessage(content="places", tool_call_id=tool_call_id)],
+            },
+        )
+
+    agent = create_agent(
+        model=ScriptedChatModel(
+            responses=[
+                AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": "fetch_naip_img", "args": {}, "id": "1"},
+                        {
+                            "name": "get_places_within_buffer",
+                            "args": {"place": "cafe"},
+                            "id": "2",
+                        },
+                    ],
+                ),
+                AIMessage(content="The imagery took too long."),
+            ],
+        ),
+        tools=[fetch_naip_img, get_places_within_buffer],
+        state_schema=GeoAssistantState,
+        middleware=[ToolCallSchedulerMiddleware(), ToolTimeLimitMiddleware()],
+    )
+    result = await agent.ainvoke(
+        {"messages": [HumanMessage(content="hi")], "naip_img_bytes": None},
+    )
+
+    assert work.stopped.is_set()
+    assert result["naip_img_bytes"] is None
+    timed_out, places = [m for m in result["messages"] if isinstance(m, ToolMessage)]
+    assert timed_out.status == "error"
+    assert "fetch_naip_img was cancelled" in timed_out.content
+    assert places.content == "places"
+    assert result["messages"][-1].content == "The imagery took too long."
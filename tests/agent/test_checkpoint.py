@@ -0,0 +1,71 @@
+"""Tests for the checkpoint stores."""
+
+from typing import Annotated
+
+from conftest import ScriptedChatModel
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.types import Command
+
+from geo_assistant.agent.checkpoint import BlobSerializer, open_checkpointer
+from geo_assistant.agent.state import GeoAssistantState
+
+IMAGE = "A" * 200_000
+
+
+def test_blob_serializer(tmp_path):
+    """Large values round-trip through blob files, once per content."""
+    serde = BlobSerializer(tmp_path, min_bytes=16)
+    image, data = "a" * 32, b"b" * 32
+    checkpoint = {"id": "1", "channel_values": {"naip_img_bytes": image, "place": None}}
+
+    type_, serialized = serde.dumps_typed(checkpoint)
+    assert image.encode() not in serialized
+    assert serde.loads_typed((type_, serialized)) == checkpoint
+    assert serde.loads_typed(serde.dumps_typed(image)) == image
+    assert serde.loads_typed(serde.dumps_typed(data)) == data
+    assert serde.loads_typed(serde.dumps_typed("small")) == "small"
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+@tool
+async def fetch_naip_img(tool_call_id: Annotated[str, InjectedToolCallId]) -> Command:
+    """NAIP."""
+    return Command(
+        update={
+            "naip_img_bytes": IMAGE,
+            "messages": [ToolMessage(content="naip", tool_call_id=tool_call_id)],
+        },
+    )
+
+
+async def test_sqlite_state_blobs(tmp_path):
+    """The image of a thread is stored once, outside its checkpoints."""
+    config = {"configurable": {"thread_id": "1"}}
+    async with open_checkpointer("sqlite", tmp_path) as checkpointer:
+        agent = create_agent(
+            model=ScriptedChatModel(
+                responses=[
+                    AIMessage(
+                        content="",
+                        tool_calls=[{"name": "fetch_naip_img", "args": {}, "id": "1"}],
+                    ),
+                    AIMessage(content="one"),
+                    AIMessage(content="two"),
+                ],
+            ),
+            tools=[fetch_naip_img],
+            state_schema=GeoAssistantState,
+            checkpointer=checkpointer,
+        )
+        await agent.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await agent.ainvoke({"messages": [HumanMessage(content="again")]}, config)
+
+    async with open_checkpointer("sqlite", tmp_path) as checkpointer:
+        state = await checkpointer.aget_tuple(config)
+    assert state.checkpoint["channel_values"]["naip_img_bytes"] == IMAGE
+    assert len(list((tmp_path / "blobs").iterdir())) == 1
+    for path in tmp_path.glob("checkpoints.sqlite*"):
+        assert IMAGE[:1000].encode() not in path.read_bytes()
@@ -0,0 +1,111 @@
+"""Tests for the history compaction middleware."""
+
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from pydantic import Field
+
+from geo_assistant.agent.history import (
+    HistoryCompactionMiddleware,
+    ModelStepStats,
+    compact_history,
+)
+from geo_assistant.agent.state import GeoAssistantState
+
+LARGE_OUTPUT = "place " * 2000
+
+
+class RecordingChatModel(FakeMessagesListChatModel):
+    """Fake chat model that records the messages it is called with."""
+
+    calls: list = Field(default_factory=list)
+
+    def bind_tools(self, tools, **kwargs):
+        """Ignore the tools, the responses are scripted."""
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(messages)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def _turn(i: int, output: str = LARGE_OUTPUT) -> list:
+    call_id = f"call-{i}"
+    return [
+        HumanMessage(f"question {i}"),
+        AIMessage(
+            "",
+            tool_calls=[
+                {"name": "get_place", "args": {}, "id": call_id, "type": "tool_call"},
+            ],
+        ),
+        ToolMessage(output, tool_call_id=call_id),
+        AIMessage(f"answer {i}"),
+    ]
+
+
+def test_compact_history_references_state():
+    """Large tool outputs of previous turns are replaced by state references."""
+    messages = _turn(0) + _turn(1)
+    compacted, dropped = compact_history(
+        messages,
+        token_budget=100_000,
+        tool_output_token_limit=256,
+    )
+
+    assert dropped == 0
+    assert len(compacted) == len(messages)
+    reference = compacted[2].content
+    assert "get_place" in reference
+    assert "place" in reference
+    assert len(reference) < 400
+    # The latest turn is sent whole, and the input is left untouched.
+    assert compacted[6].content == LARGE_OUTPUT
+    assert messages[2].content == LARGE_OUTPUT
+
+
+def test_compact_history_budget():
+    """The oldest turns are dropped to fit the budget, the latest is kept."""
+    messages = [m for i in range(10) for m in _turn(i, output="small")]
+    turn_tokens = count_tokens_approximately(_turn(0, output="small"))
+
+    compacted, dropped = compact_history(messages, token_budget=3 * turn_tokens)
+    assert dropped == 7
+    assert compacted[0].content == "question 7"
+    assert count_tokens_approximately(compacted) <= 3 * turn_tokens
+
+    compacted, dropped = compact_history(messages, token_budget=1)
+    assert dropped == 9
+    assert compacted == messages[-4:]
+
+
+async def test_history_compaction_middleware():
+    """The model gets the compacted history, and its steps are recorded."""
+    model = RecordingChatModel(responses=[AIMessage("done")])
+    stats = ModelStepStats()
+    agent = create_agent(
+        model=model,
+        tools=[],
+        system_prompt="You are a test.",
+        state_schema=GeoAssistantState,
+        middleware=[HistoryCompactionMiddleware(token_budget=500, stats=stats)],
+    )
+    history = [m for i in range(5) for m in _turn(i)]
+
+    result = await agent.ainvoke(
+        {"messages": [*history, HumanMessage("last question")]},
+    )
+
+    # The state keeps the whole history.
+    assert result["messages"][: len(history)] == history
+    (sent,) = model.calls
+    assert "omitted" in sent[0].content
+    assert sent[-1].content == "last question"
+    assert count_tokens_approximately(sent[1:]) <= 500
+
+    step = stats.stats()
+    assert step["count"] == 1
+    assert step["last"]["history_tokens"] > step["last"]["prompt_tokens"]
+    assert step["last"]["dropped_turns"] > 0
+    assert step["latency_seconds"]["max"] >= 0
@@ -0,0 +1,121 @@
+"""Tests for the memory and state size instrumentation."""
+
+import tracemalloc
+from typing import Annotated
+
+import pytest
+from conftest import ScriptedChatModel
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.types import Command
+
+from geo_assistant.agent.checkpoint import open_checkpointer
+from geo_assistant.agent.memory import (
+    ToolMemoryMiddleware,
+    ToolMemoryStats,
+    process_memory,
+    thread_state_sizes,
+    thread_usage,
+)
+from geo_assistant.agent.state import GeoAssistantState
+
+IMAGE = "A" * 200_000
+
+# Kept alive, so that the allocation is retained after the tool call.
+_RETAINED: list[bytes] = []
+
+
+@tool
+async def fetch_naip_img(tool_call_id: Annotated[str, InjectedToolCallId]) -> Command:
+    """NAIP."""
+    _RETAINED.append(bytes(1_000_000))
+    return Command(
+        update={
+            "naip_img_bytes": IMAGE,
+            "messages": [ToolMessage(content="naip", tool_call_id=tool_call_id)],
+        },
+    )
+
+
+def _agent(checkpointer, middleware=(), fetch=True):
+    responses = [AIMessage(content="done")]
+    if fetch:
+        responses.insert(
+            0,
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "fetch_naip_img", "args": {}, "id": "1"}],
+            ),
+        )
+    return create_agent(
+        model=ScriptedChatModel(responses=responses),
+        tools=[fetch_naip_img],
+        state_schema=GeoAssistantState,
+        middleware=list(middleware),
+        checkpointer=checkpointer,
+    )
+
+
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+async def test_thread_usage(store, tmp_path):
+    """Checkpoints are counted per thread and fields sized as stored."""
+    async with open_checkpointer(store, tmp_path) as checkpointer:
+        for thread_id, fetch in (("small", False), ("large", True)):
+            await _agent(checkpointer, fetch=fetch).ainvoke(
+                {"messages": [HumanMessage(content="hi")]},
+                {"configurable": {"thread_id": thread_id}},
+            )
+
+        large, small = await thread_usage(checkpointer)
+        assert (large.thread_id, small.thread_id) == ("large", "small")
+        assert large.checkpoints > small.checkpoints > 0
+        if store == "memory":
+            assert large.bytes > len(IMAGE) > small.bytes
+        else:
+            # The image is stored once in a blob file, outside the checkpoints.
+            assert len(IMAGE) > large.bytes > small.bytes
+
+        sizes = await thread_state_sizes(checkpointer, "large")
+        assert next(iter(sizes)) == "naip_img_bytes"
+        assert sizes["naip_img_bytes"] > len(IMAGE)
+        assert 0 < sizes["messages"] < len(IMAGE)
+        assert await thread_state_sizes(checkpointer, "missing") == {}
+
+
+async def test_sampled_tool_calls_are_traced(tmp_path):
+    """Sampled tool calls record their retained allocations, then stop tracing."""
+    stats = ToolMemoryStats()
+    async with open_checkpointer("memory", tmp_path) as checkpointer:
+        agent = _agent(checkpointer, [ToolMemoryMiddleware(1.0, stats=stats)])
+        await agent.ainvoke(
+            {"messages": [HumanMessage(content="hi")]},
+            {"configurable": {"thread_id": "1"}},
+        )
+
+    assert not tracemalloc.is_tracing()
+    tool_stats = stats.stats()["tools"]["fetch_naip_img"]
+    assert tool_stats["count"] == 1
+    assert tool_stats["retained_bytes"]["max"] >= 1_000_000
+    assert tool_stats["peak_bytes"]["max"] >= 1_000_000
+    assert "test_memory.py" in tool_stats["last"]["top_allocations"][0]["site"]
+
+
+async def test_unsampled_tool_calls_are_not_traced(tmp_path):
+    """Without sampling, the tool calls are not traced."""
+    stats = ToolMemoryStats()
+    async with open_checkpointer("memory", tmp_path) as checkpointer:
+        agent = _agent(checkpointer, [ToolMemoryMiddleware(0.0, stats=stats)])
+        await agent.ainvoke(
+            {"messages": [HumanMessage(content="hi")]},
+            {"configurable": {"thread_id": "1"}},
+        )
+    assert stats.stats() == {"count": 0, "tools": {}}
+
+
+def test_process_memory():
+    """The resident memory of the process is reported."""
+    memory = process_memory()
+    assert memory["rss_bytes"] > 0
+    assert "traced_bytes" not in memory
@@ -0,0 +1,303 @@
+"""Tests for concurrent tool call scheduling."""
+
+import asyncio
+import time
+from typing import Annotated
+
+from conftest import ScriptedChatModel
+from geojson_pydantic import Feature, Point
+from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt import InjectedState
+from langgraph.types import Command
+
+from geo_assistant.agent.scheduler import (
+    ToolCallSchedulerMiddleware,
+    later_writers,
+    merge_state_updates,
+    plan_tool_call_waves,
+)
+from geo_assistant.agent.state import GeoAssistantState
+
+POINT = Feature(
+    type="Feature",
+    geometry=Point(type="Point", coordinates=[-9.1393, 38.7223]),
+    properties={"name": "Neighbourhood Cafe Lisbon"},
+)
+
+
+def _call(name: str, call_id: str, **args) -> dict:
+    return {"name": name, "args": args, "id": call_id, "type": "tool_call"}
+
+
+def _agent(responses: list[AIMessage], tools: list, **kwargs):
+    return create_agent(
+        model=ScriptedChatModel(responses=responses),
+        tools=tools,
+        state_schema=GeoAssistantState,
+        middleware=[ToolCallSchedulerMiddleware(**kwargs)],
+    )
+
+
+def test_plan_tool_call_waves():
+    """Independent calls share a wave, dependent calls wait for their inputs."""
+    calls = [
+        _call("get_place", "1"),
+        _call("get_search_area", "2"),
+        _call("get_places_within_buffer", "3"),
+        _call("fetch_naip_img", "4"),
+        _call("summarize_sat_img", "5"),
+    ]
+    waves = plan_tool_call_waves(calls)
+    assert [[call["id"] for call in wave] for wave in waves] == [
+        ["1"],
+        ["2"],
+        ["3", "4"],
+        ["5"],
+    ]
+
+
+def test_plan_tool_call_waves_unknown_tool_is_serialized():
+    """Tools without declared state access never run alongside other calls."""
+    calls = [
+        _call("get_places_within_buffer", "1"),
+        _call("some_other_tool", "2"),
+        _call("fetch_naip_img", "3"),
+    ]
+    waves = plan_tool_call_waves(calls)
+    assert [[call["id"] for call in wave] for wave in waves] == [["1"], ["2"], ["3"]]
+
+
+def test_later_writers():
+    """Only later calls writing the same fields, or undeclared, overwrite a call."""
+    calls = [
+        _call("summarize_sat_img", "1"),
+        _call("get_place", "2"),
+        _call("some_other_tool", "3"),
+        _call("get_places_within_buffer", "4"),
+        _call("get_place", "5"),
+    ]
+    assert later_writers(calls, 0) == []
+    assert later_writers(calls, 1) == [2, 4]
+    assert later_writers(calls, 2) == [3, 4]
+    assert later_writers(calls, 3) == []
+
+
+def test_merge_state_updates():
+    """Messages are concatenated and other fields are last-writer-wins."""
+    merged = merge_state_updates(
+        [
+            {"messages": ["a"], "place": 1},
+            {"messages": ["b"], "place": 2, "search_area": 3},
+        ],
+    )
+    assert merged == {"messages": ["a", "b"], "place": 2, "search_area": 3}
+
+
+async def test_independent_tool_calls_run_concurrently():
+    """Tool calls reading the same search area overlap in time."""
+    intervals = {}
+
+    async def _record(name: str) -> None:
+        start = time.perf_counter()
+        await asyncio.sleep(0.2)
+        intervals[name] = (start, time.perf_counter())
+
+    @tool
+    async def get_places_within_buffer(
+        place: str,
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Places."""
+        await _record("get_places_within_buffer")
+        return Command(
+            update={
+                "places_within_buffer": None,
+                "messages": [ToolMessage(content="places", tool_call_id=tool_call_id)],
+            },
+        )
+
+    @tool
+    async def fetch_naip_img(
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """NAIP."""
+        await _record("fetch_naip_img")
+        return Command(
+            update={
+                "naip_img_bytes": "abc",
+                "messages": [ToolMessage(content="naip", tool_call_id=tool_call_id)],
+            },
+        )
+
+    agent = _agent(
+        [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    _call("get_places_within_buffer", "1", place="cafe"),
+                    _call("fetch_naip_img", "2"),
+                ],
+            ),
+            AIMessage(content="done"),
+        ],
+        [get_places_within_buffer, fetch_naip_img],
+    )
+    result = await agent.ainvoke({"messages": [HumanMessage(content="hi")]})
+
+    places, naip = intervals["get_places_within_buffer"], intervals["fetch_naip_img"]
+    assert places[0] < naip[1] and naip[0] < places[1]
+    assert result["naip_img_bytes"] == "abc"
+    tool_messages = [m for m in result["messages"] if isinstance(m, ToolMessage)]
+    assert [m.tool_call_id for m in tool_messages] == ["1", "2"]
+
+
+async def test_dependent_tool_call_sees_earlier_update():
+    """A call reading `place` waits for the call writing it in the same turn."""
+
+    @tool
+    async def get_place(
+        place_name: str,
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Place."""
+        await asyncio.sleep(0.1)
+        return Command(
+            update={
+                "place": POINT,
+                "messages": [ToolMessage(content="place", tool_call_id=tool_call_id)],
+            },
+        )
+
+    @tool
+    async def get_search_area(
+        state: Annotated[GeoAssistantState, InjectedState],
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Search area."""
+        return Command(
+            update={
+                "search_area": state["place"],
+                "messages": [ToolMessage(content="area", tool_call_id=tool_call_id)],
+            },
+        )
+
+    agent = _agent(
+        [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    _call("get_place", "1", place_name="cafe"),
+                    _call("get_search_area", "2"),
+                ],
+            ),
+            AIMessage(content="done"),
+        ],
+        [get_place, get_search_area],
+    )
+    result = await agent.ainvoke(
+        {"messages": [HumanMessage(content="hi")], "place": None},
+    )
+
+    assert result["search_area"] == POINT
+
+
+async def test_conflicting_writes_keep_last_call():
+    """Two calls writing the same field keep the value of the later call."""
+
+    @tool
+    async def get_place(
+        place_name: str,
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Place."""
+        # The first call finishes last if both were run concurrently.
+        await asyncio.sleep(0.1 if place_name == "first" else 0)
+        feature = POINT.model_copy(update={"properties": {"name": place_name}})
+        return Command(
+            update={
+                "place": feature,
+                "messages": [ToolMessage(content="place", tool_call_id=tool_call_id)],
+            },
+        )
+
+    agent = _agent(
+        [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    _call("get_place", "1", place_name="first"),
+                    _call("get_place", "2", place_name="second"),
+                ],
+            ),
+            AIMessage(content="done"),
+        ],
+        [get_place],
+    )
+    result = await agent.ainvoke({"messages": [HumanMessage(content="hi")]})
+
+    assert result["place"].properties["name"] == "second"
+
+
+async def test_cancelled_run_batch_is_dropped():
+    """A turn whose tool calls were not all dispatched does not leak its batch."""
+    held = asyncio.Event()
+
+    class HoldSecondCall(AgentMiddleware):
+        async def awrap_tool_call(self, request, handler):
+            if request.tool_call["id"] == "2":
+                held.set()
+                await asyncio.Event().wait()
+            return await handler(request)
+
+    @tool
+    async def get_place(
+        place_name: str,
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """Place."""
+        return Command(
+            update={
+                "place": POINT,
+                "messages": [ToolMessage(content="place", tool_call_id=tool_call_id)],
+            },
+        )
+
+    scheduler = ToolCallSchedulerMiddleware()
+    agent = create_agent(
+        model=ScriptedChatModel(
+            responses=[
+                AIMessage(
+                    content="",
+                    tool_calls=[
+                        _call("get_place", "1", place_name="cafe"),
+                        _call("get_place", "2", place_name="cafe"),
+                    ],
+                ),
+                AIMessage(
+                    content="",
+                    tool_calls=[_call("get_place", "3", place_name="cafe")],
+                ),
+                AIMessage(content="done"),
+            ],
+        ),
+        tools=[get_place],
+        state_schema=GeoAssistantState,
+        middleware=[HoldSecondCall(), scheduler],
+        checkpointer=InMemorySaver(),
+    )
+    config = {"configurable": {"thread_id": "thread"}}
+    run = asyncio.create_task(
+        agent.ainvoke({"messages": [HumanMessage(content="hi")]}, config),
+    )
+    await held.wait()
+    run.cancel()
+    await asyncio.gather(run, return_exceptions=True)
+
+    await agent.ainvoke({"messages": [HumanMessage(content="again")]}, config)
+
+    assert scheduler._batches == {}
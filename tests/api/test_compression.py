@@ -0,0 +1,94 @@
+"""Tests for streaming compression of chat responses."""
+
+import zlib
+
+import pytest
+import zstandard
+
+from geo_assistant.api.compression import (
+    compress_stream,
+    negotiate_encoding,
+    parse_encodings,
+)
+
+LINES = [
+    b'{"state": {"search_area": {"type": "Feature", "coordinates": [1.0, 2.0]}}}\n',
+    b'{"state": {"messages": [{"type": "ai", "content": "Hello"}]}}\n',
+    b'{"state": {"search_area": {"type": "Feature", "coordinates": [1.0, 2.0]}}}\n',
+]
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("zstd;q=0.5, gzip", "gzip"),
+        ("zstd;q=0, gzip;q=0.1", "gzip"),
+        ("*", "zstd"),
+        ("*;q=0, gzip", "gzip"),
+        ("br", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding, expected):
+    """The preferred encoding among the best accepted ones is picked."""
+    assert negotiate_encoding(accept_encoding, ["zstd", "gzip"]) == expected
+
+
+def test_negotiate_encoding_disabled():
+    """Nothing is negotiated when compression is disabled."""
+    assert negotiate_encoding("zstd, gzip", []) is None
+
+
+def test_parse_encodings():
+    """Configured encodings are parsed in order, unsupported ones rejected."""
+    assert parse_encodings(" gzip, zstd ") == ["gzip", "zstd"]
+    assert parse_encodings("") == []
+    with pytest.raises(ValueError, match="'br'"):
+        parse_encodings("zstd,br")
+
+
+def _decompressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.decompressobj(31)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_compress_stream_flushes_lines(encoding):
+    """Every line can be decoded as soon as its compressed chunk arrives."""
+
+    async def lines():
+        for line in LINES:
+            yield line
+
+    decompressor = _decompressor(encoding)
+    decoded = []
+    async for chunk in compress_stream(lines(), encoding):
+        decoded.append(decompressor.decompress(chunk))
+
+    assert decoded[: len(LINES)] == LINES
+    assert b"".join(decoded) == b"".join(LINES)
+    if encoding == "gzip":
+        assert decompressor.eof
+
+
+async def test_compress_stream_closes_source():
+    """Closing the compressed stream closes the source, e.g. to release its run."""
+    closed = False
+
+    async def lines():
+        nonlocal closed
+        try:
+            for line in LINES:
+                yield line
+        finally:
+            closed = True
+
+    stream = compress_stream(lines(), "zstd")
+    await anext(stream)
+    await stream.aclose()
+    assert closed
@@ -0,0 +1,79 @@
+"""Tests for the cancellation of chat runs when the client disconnects."""
+
+import asyncio
+import time
+from typing import Annotated
+
+from conftest import ScriptedChatModel
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import InjectedToolCallId
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+
+from geo_assistant.agent.cancellation import to_thread_cancellable
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.api.app import stream_chat
+
+
+class FakeRequest:
+    """Request whose client disconnects when told to."""
+
+    def __init__(self):
+        """Start connected."""
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        """Whether the client has gone."""
+        return self.disconnected
+
+
+async def test_disconnect_cancels_running_tools(blocking_work):
+    """A disconnect stops the blocking work of running tool calls promptly."""
+    work = blocking_work
+
+    @tool
+    async def fetch_naip_img(
+        tool_call_id: Annotated[str, InjectedToolCallId],
+    ) -> Command:
+        """NAIP."""
+        await to_thread_cancellable(work, interrupt=work.interrupted.set)
+        return Command(
+            update={
+                "messages": [ToolMessage(content="naip", tool_call_id=tool_call_id)],
+            },
+        )
+
+    chatbot = create_agent(
+        model=ScriptedChatModel(
+            responses=[
+                AIMessage(
+                    content="",
+                    tool_calls=[{"name": "fetch_naip_img", "args": {}, "id": "1"}],
+                ),
+                AIMessage(content="done"),
+            ],
+        ),
+        tools=[fetch_naip_img],
+        state_schema=GeoAssistantState,
+        checkpointer=InMemorySaver(),
+    )
+    request = FakeRequest()
+    stream = stream_chat(
+        {"messages": [{"type": "human", "content": "hi"}]},
+        "0b3d4e9e-3b2c-4c59-9c55-2d8a4f1b5e6a",
+        chatbot,
+        request,
+    )
+
+    # The model's tool call, the tool then blocks.
+    assert b'"fetch_naip_img"' in await anext(stream)
+    await asyncio.to_thread(work.started.wait)
+
+    request.disconnected = True
+    start = time.perf_counter()
+    assert [chunk async for chunk in stream] == []
+    assert work.stopped.is_set()
+    assert work.interrupted.is_set()
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,96 @@
+"""Tests for the chat stream encoders."""
+
+import base64
+import json
+
+import pytest
+from geojson_pydantic import Feature, FeatureCollection
+from langchain_core.messages import AIMessage
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.api.encoders import (
+    decode_msgpack_frames,
+    encode_msgpack,
+    encode_ndjson,
+    negotiate_format,
+)
+from geo_assistant.api.schemas.chat import ChatResponse
+
+PLACE = Feature(
+    type="Feature",
+    geometry={"type": "Point", "coordinates": [-9.1393, 38.7223]},
+    properties={"name": "Neighbourhood Cafe Lisbon"},
+)
+IMAGE = b"\xff\xd8\xff\xe0 not really a jpeg"
+
+
+def _drop_none(value):
+    if isinstance(value, dict):
+        return {k: _drop_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_drop_none(v) for v in value]
+    return value
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        (None, "ndjson"),
+        ("*/*", "ndjson"),
+        ("application/x-ndjson", "ndjson"),
+        ("application/vnd.msgpack", "msgpack"),
+        ("application/msgpack, application/x-ndjson;q=0.5", "msgpack"),
+        ("application/vnd.msgpack;q=0.5, application/x-ndjson", "ndjson"),
+    ],
+)
+def test_negotiate_format(accept, expected):
+    """MessagePack is streamed only when preferred by the client."""
+    assert negotiate_format(accept) == expected
+
+
+def test_encode_msgpack_matches_ndjson():
+    """MessagePack frames carry the NDJSON content, with raw image bytes."""
+    states = [
+        {"messages": [AIMessage("Hello")]},
+        {
+            "messages": [],
+            "place": PLACE,
+            "places_within_buffer": FeatureCollection(
+                type="FeatureCollection",
+                features=[PLACE],
+            ),
+        },
+        {
+            "messages": [],
+            "naip_img_bytes": base64.b64encode(IMAGE).decode(),
+            "naip_cube": "0" * 40,
+        },
+    ]
+
+    stream = b"".join(encode_msgpack("thread", state) for state in states)
+    frames = decode_msgpack_frames(stream)
+    lines = [json.loads(encode_ndjson("thread", state)) for state in states]
+
+    assert len(frames) == len(lines)
+    assert frames[2]["state"]["naip_img_bytes"] == IMAGE
+    frames[2]["state"]["naip_img_bytes"] = base64.b64encode(IMAGE).decode()
+    # Unset optional GeoJSON members are nil instead of missing.
+    assert _drop_none(frames) == _drop_none(lines)
+
+
+def test_encode_ndjson_is_a_chat_response():
+    """NDJSON lines, dumped without validation, read back as ChatResponse."""
+    state = {
+        "messages": [AIMessage("Hello")],
+        "place": PLACE,
+        "places_within_buffer": FeatureCollection(
+            type="FeatureCollection",
+            features=[PLACE],
+        ),
+    }
+
+    line = encode_ndjson("thread", state)
+
+    assert line.endswith(b"\n")
+    expected = ChatResponse(thread_id="thread", state=GeoAssistantState(**state))
+    assert json.loads(line) == json.loads(expected.model_dump_json())
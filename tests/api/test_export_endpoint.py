@@ -0,0 +1,130 @@
+"""Tests for the export of the Overture places of a category in an area."""
+
+import io
+import json
+
+import geopandas as gpd
+import pyarrow as pa
+from geojson_pydantic import Feature
+from httpx import ASGITransport, AsyncClient
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from shapely.geometry import Point, mapping
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.api.app import app
+from geo_assistant.tools.overture import area_digest
+
+THREAD_ID = "0b3d4e9e-3b2c-4c59-9c55-2d8a4f1b5e6a"
+AREA = mapping(Point(-9.1393, 38.7223).buffer(0.005))
+
+
+async def _chatbot(*search_areas: Feature | None):
+    chatbot = create_agent(
+        model=FakeMessagesListChatModel(responses=[AIMessage(content="done")]),
+        state_schema=GeoAssistantState,
+        checkpointer=InMemorySaver(),
+    )
+    for search_area in search_areas:
+        await chatbot.ainvoke(
+            {"messages": [HumanMessage(content="hi")], "search_area": search_area},
+            {"configurable": {"thread_id": THREAD_ID}},
+        )
+    return chatbot
+
+
+async def test_export_needs_an_area(monkeypatch):
+    """The area is a thread's search area or a geometry."""
+    monkeypatch.setattr(app.state, "chatbot", await _chatbot(None), raising=False)
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        response = await client.get("/export/places", params={"category": "cafe"})
+        assert response.status_code == 422
+
+        response = await client.get(
+            "/export/places",
+            params={"category": "cafe", "geometry": '{"type": "Point"}'},
+        )
+        assert response.status_code == 422
+
+        response = await client.get(
+            "/export/places",
+            params={"category": "cafe", "thread_id": THREAD_ID},
+        )
+        assert response.status_code == 404
+
+        response = await client.get(
+            "/export/places",
+            params={"category": "cafe", "thread_id": THREAD_ID, "area": "0" * 16},
+        )
+        assert response.status_code == 404
+
+
+async def test_export_places(monkeypatch, local_places):
+    """The places of the thread's search area stream as GeoParquet or Arrow."""
+    search_area = Feature(type="Feature", geometry=AREA, properties={})
+    monkeypatch.setattr(
+        app.state,
+        "chatbot",
+        await _chatbot(search_area),
+        raising=False,
+    )
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        response = await client.get(
+            "/export/places",
+            params={"category": "cafes", "thread_id": THREAD_ID},
+        )
+        assert response.headers["content-type"] == "application/vnd.apache.parquet"
+        assert "places-cafe.parquet" in response.headers["content-disposition"]
+        places = gpd.read_parquet(io.BytesIO(response.content))
+        assert set(places["name"]) == {"Neighbourhood Cafe Lisbon", "Cafe Alfama"}
+        assert places.geometry.iloc[0].geom_type == "Point"
+
+        response = await client.get(
+            "/export/places",
+            params={"category": "bar", "geometry": json.dumps(AREA), "format": "arrow"},
+        )
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table["name"].to_pylist() == []
+
+
+async def test_export_pins_the_counted_search_area(monkeypatch, local_places):
+    """An export handle refers to its search area after the thread's has moved."""
+    counted = Feature(type="Feature", geometry=AREA, properties={})
+    moved = Feature(
+        type="Feature",
+        geometry=mapping(Point(0, 0).buffer(0.005)),
+        properties={},
+    )
+    monkeypatch.setattr(
+        app.state,
+        "chatbot",
+        await _chatbot(counted, moved),
+        raising=False,
+    )
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        latest = await client.get(
+            "/export/places",
+            params={"category": "cafe", "thread_id": THREAD_ID},
+        )
+        pinned = await client.get(
+            "/export/places",
+            params={
+                "category": "cafe",
+                "thread_id": THREAD_ID,
+                "area": area_digest(counted.geometry),
+            },
+        )
+
+    assert len(gpd.read_parquet(io.BytesIO(latest.content))) == 0
+    assert len(gpd.read_parquet(io.BytesIO(pinned.content))) == 2
@@ -0,0 +1,41 @@
+"""Tests for the memory metrics and debug endpoints."""
+
+from httpx import ASGITransport, AsyncClient
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.api import app as app_module
+from geo_assistant.api.app import app
+
+
+async def test_memory_endpoints(monkeypatch):
+    """Metrics aggregate the threads, the debug endpoint lists them when enabled."""
+    chatbot = create_agent(
+        model=FakeMessagesListChatModel(responses=[AIMessage(content="done")]),
+        state_schema=GeoAssistantState,
+        checkpointer=InMemorySaver(),
+    )
+    await chatbot.ainvoke(
+        {"messages": [HumanMessage(content="hi")]},
+        {"configurable": {"thread_id": "1"}},
+    )
+    monkeypatch.setattr(app.state, "chatbot", chatbot, raising=False)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        metrics = (await client.get("/metrics/memory")).json()
+        assert metrics["process"]["rss_bytes"] > 0
+        assert metrics["threads"]["count"] == 1
+        assert metrics["threads"]["checkpoints"] > 0
+
+        assert (await client.get("/debug/memory")).status_code == 404
+        monkeypatch.setattr(app_module, "DEBUG_ENDPOINTS", True)
+        (thread,) = (await client.get("/debug/memory")).json()["threads"]
+        assert thread["thread_id"] == "1"
+        assert thread["bytes"] > 0
+        assert list(thread["fields"]) == ["messages"]
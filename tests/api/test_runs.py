@@ -0,0 +1,98 @@
+"""Tests for the graph run queue."""
+
+import asyncio
+
+import pytest
+
+from geo_assistant.api.runs import RunQueue, RunQueueFullError, ThreadBusyError
+
+
+async def test_runs_of_a_thread_are_serialized():
+    """A thread's second run waits for its first run to be released."""
+    queue = RunQueue(max_concurrency=4, max_queued=4, max_queued_per_thread=1)
+    first = await queue.acquire("a")
+
+    second = asyncio.create_task(queue.acquire("a"))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+    assert queue.stats()["queued"] == 1
+
+    first.release()
+    ticket = await second
+    assert ticket.wait > 0
+    ticket.release()
+    assert queue.stats() | {"wait_seconds": None} == queue.stats() | {
+        "running": 0,
+        "queued": 0,
+        "threads": 0,
+        "completed": 2,
+        "wait_seconds": None,
+    }
+
+
+async def test_duplicate_runs_are_rejected():
+    """Runs beyond the per-thread limit are rejected with a retry delay."""
+    queue = RunQueue(max_concurrency=4, max_queued=4, max_queued_per_thread=0)
+    ticket = await queue.acquire("a")
+
+    with pytest.raises(ThreadBusyError) as exc_info:
+        await queue.acquire("a")
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+
+    # Other threads are not affected.
+    (await queue.acquire("b")).release()
+    ticket.release()
+    assert queue.stats()["rejected"] == {"ThreadBusyError": 1}
+
+
+async def test_full_queue_is_rejected():
+    """Runs are rejected once every slot is busy and the queue is full."""
+    queue = RunQueue(max_concurrency=1, max_queued=1, max_queued_per_thread=1)
+    running = await queue.acquire("a")
+    queued = asyncio.create_task(queue.acquire("b"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(RunQueueFullError) as exc_info:
+        await queue.acquire("c")
+    assert exc_info.value.status_code == 503
+
+    running.release()
+    (await queued).release()
+    (await queue.acquire("c")).release()
+    assert queue.stats()["wait_seconds"]["count"] == 3
+
+
+async def test_cancelled_wait_leaves_no_trace():
+    """A run cancelled while queued frees its place in the queue."""
+    queue = RunQueue(max_concurrency=1, max_queued=1, max_queued_per_thread=1)
+    running = await queue.acquire("a")
+    queued = asyncio.create_task(queue.acquire("b"))
+    await asyncio.sleep(0.01)
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    running.release()
+
+    stats = queue.stats()
+    assert (stats["running"], stats["queued"], stats["threads"]) == (0, 0, 0)
+    (await queue.acquire("b")).release()
+
+
+async def test_concurrency_limit():
+    """No more than `max_concurrency` runs execute at the same time."""
+    queue = RunQueue(max_concurrency=2, max_queued=10, max_queued_per_thread=1)
+    peak = 0
+
+    async def run(thread_id):
+        nonlocal peak
+        ticket = await queue.acquire(thread_id)
+        peak = max(peak, queue.running)
+        await asyncio.sleep(0.01)
+        ticket.release()
+
+    await asyncio.gather(*(run(str(i)) for i in range(8)))
+
+    assert peak == 2
+    assert queue.stats()["completed"] == 8
@@ -0,0 +1,106 @@
+"""Multi-worker tests for the shared conversation store."""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from geo_assistant.agent.checkpoint import open_checkpointer
+from geo_assistant.agent.graph import create_graph
+from geo_assistant.api.runs import RunQueue
+
+WORKERS = 2
+THREADS = 4
+TURNS = 5
+# Simulated LLM latency per turn, in seconds.
+MODEL_LATENCY = 0.05
+
+
+class CountingChatModel(BaseChatModel):
+    """Replies with the number of human messages of the conversation so far."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+    def bind_tools(self, tools, **kwargs):
+        """Tools are never called."""
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        seen = sum(isinstance(m, HumanMessage) for m in messages)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(f"seen {seen}"))],
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(MODEL_LATENCY)
+        return self._generate(messages)
+
+
+async def _run_turns(state_dir: Path, worker: int) -> None:
+    """Run TURNS turns on each shared thread, like a chat API worker."""
+    async with open_checkpointer("sqlite", state_dir) as checkpointer:
+        graph = await create_graph(model=CountingChatModel(), checkpointer=checkpointer)
+        queue = RunQueue(
+            max_queued=THREADS * TURNS,
+            max_queued_per_thread=TURNS,
+            lock_dir=state_dir / "locks",
+        )
+
+        async def turn(thread_id: str, i: int) -> None:
+            ticket = await queue.acquire(thread_id)
+            try:
+                await graph.ainvoke(
+                    {"messages": [HumanMessage(f"worker {worker} turn {i}")]},
+                    {"configurable": {"thread_id": thread_id}},
+                )
+            finally:
+                ticket.release()
+
+        await asyncio.gather(
+            *(turn(f"thread-{t}", i) for t in range(THREADS) for i in range(TURNS)),
+        )
+
+
+def run_worker(state_dir: Path, worker: int) -> tuple[float, float]:
+    """Entry point of a worker process, returns the start and end wall times."""
+    start = time.time()
+    asyncio.run(_run_turns(state_dir, worker))
+    return start, time.time()
+
+
+async def _thread_messages(state_dir: Path) -> dict[str, list]:
+    async with open_checkpointer("sqlite", state_dir) as checkpointer:
+        graph = await create_graph(model=CountingChatModel(), checkpointer=checkpointer)
+        return {
+            f"thread-{t}": (
+                await graph.aget_state({"configurable": {"thread_id": f"thread-{t}"}})
+            ).values["messages"]
+            for t in range(THREADS)
+        }
+
+
+def test_multi_worker_throughput(tmp_path):
+    """
+    Workers sharing the SQLite store serve the same threads without losing or
+    interleaving turns.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=WORKERS, mp_context=context) as pool:
+        # Timed in the workers, their imports would dominate otherwise.
+        times = list(pool.map(run_worker, [tmp_path] * WORKERS, range(WORKERS)))
+    elapsed = max(end for _, end in times) - min(start for start, _ in times)
+
+    # Turns of different threads overlap, across and within the workers.
+    assert elapsed < WORKERS * THREADS * TURNS * MODEL_LATENCY
+
+    for messages in asyncio.run(_thread_messages(tmp_path)).values():
+        replies = [m.content for m in messages if isinstance(m, AIMessage)]
+        # Every turn saw all the turns before it, whichever worker ran them.
+        assert replies == [f"seen {n}" for n in range(1, WORKERS * TURNS + 1)]
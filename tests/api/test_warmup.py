@@ -0,0 +1,69 @@
+"""Tests for the start-up warm-up and the /ready endpoint."""
+
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from geo_assistant.api.app import app
+from geo_assistant.api.warmup import Readiness, configured_components, warm_up
+
+
+async def test_warm_up_reports_components():
+    """Components are timed, failures are reported without blocking readiness."""
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.05)
+
+    async def broken():
+        raise ConnectionError("Ollama is not running")
+
+    readiness = Readiness(["slow", "broken"])
+    task = asyncio.create_task(warm_up(readiness, {"slow": slow, "broken": broken}))
+    await started.wait()
+    assert not readiness.ready
+    assert readiness.report()["status"] == "warming_up"
+    await task
+
+    report = readiness.report()
+    assert report["ready"]
+    assert report["status"] == "degraded"
+    assert report["components"]["slow"]["status"] == "ok"
+    assert report["components"]["slow"]["seconds"] >= 0.05
+    assert report["components"]["broken"] == {
+        "status": "error",
+        "error": "Ollama is not running",
+        "seconds": pytest.approx(0, abs=0.05),
+    }
+
+
+def test_configured_components():
+    """Unknown components are rejected, none disables the warm-up."""
+    assert configured_components([]) == {}
+    assert list(configured_components(["duckdb", "stac"])) == ["duckdb", "stac"]
+    with pytest.raises(ValueError, match="Unknown warm-up components"):
+        configured_components(["redis"])
+
+
+async def test_ready_endpoint():
+    """/ready responds 503 while warming up, then 200."""
+
+    async def component():
+        await asyncio.sleep(0)
+
+    app.state.readiness = Readiness(["component"])
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        response = await client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["components"] == {"component": {"status": "pending"}}
+
+        await warm_up(app.state.readiness, {"component": component})
+        response = await client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"
+    del app.state.readiness
@@ -0,0 +1,170 @@
+"""Tests for the headless batch pipeline."""
+
+import asyncio
+import json
+from collections import Counter
+
+import geopandas as gpd
+from geojson_pydantic import Feature
+
+from geo_assistant.batch.pipeline import (
+    GeoParquetWriter,
+    JsonlWriter,
+    Site,
+    buffer,
+    read_sites,
+    run_batch,
+)
+
+
+def _place(site: Site) -> Feature:
+    return Feature(
+        type="Feature",
+        geometry={"type": "Point", "coordinates": [-9.1393, 38.7223]},
+        properties={"name": site.params["place"]},
+    )
+
+
+class FakeStages:
+    """Stages that track their concurrency, the geocoder fails on 'nowhere'."""
+
+    def __init__(self):
+        """Initialize counters."""
+        self.running: Counter[str] = Counter()
+        self.max_running: Counter[str] = Counter()
+        self.calls: Counter[str] = Counter()
+
+    def stage(self, name: str, delay: float):
+        """A stage sleeping for `delay` seconds."""
+
+        async def run(site: Site) -> None:
+            self.calls[name] += 1
+            self.running[name] += 1
+            self.max_running[name] = max(self.max_running[name], self.running[name])
+            try:
+                await asyncio.sleep(delay)
+                if name == "geocode":
+                    if site.params["place"] == "nowhere":
+                        raise ValueError("No place found")
+                    site.state["place"] = _place(site)
+                else:
+                    site.result["summary"] = f"{name} of {site.site_id}"
+            finally:
+                self.running[name] -= 1
+
+        return run
+
+    def stages(self) -> dict:
+        """Geocode, then a slower NAIP stage."""
+        return {
+            "geocode": self.stage("geocode", 0.01),
+            "naip": self.stage("naip", 0.02),
+        }
+
+
+def _sites(places: list[str]) -> list[Site]:
+    return [
+        Site(site_id=str(i), params={"place": place}) for i, place in enumerate(places)
+    ]
+
+
+async def test_run_batch(tmp_path):
+    """Sites are streamed through bounded stages, failures skip later stages."""
+    fake = FakeStages()
+    output = tmp_path / "results.jsonl"
+    places = ["Lisbon", "nowhere", *[f"site {i}" for i in range(18)]]
+    stats = await run_batch(
+        _sites(places),
+        JsonlWriter(output),
+        fake.stages(),
+        workers={"geocode": 4, "naip": 2},
+    )
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 20
+    failed = next(r for r in records if r["query"] == "nowhere")
+    assert failed["status"] == "error"
+    assert failed["failed_stage"] == "geocode"
+    assert failed["error"] == "No place found"
+    ok = next(r for r in records if r["query"] == "Lisbon")
+    assert ok["status"] == "ok"
+    assert ok["place"]["type"] == "Point"
+    assert ok["summary"] == "naip of 0"
+
+    assert fake.calls == {"geocode": 20, "naip": 19}
+    assert fake.max_running == {"geocode": 4, "naip": 2}
+    assert stats["geocode"]["sites"] == 20
+    assert stats["geocode"]["errors"] == 1
+    assert stats["naip"]["sites"] == 19
+    assert stats["naip"]["sites_per_second"] > 0
+
+
+async def test_resume(tmp_path):
+    """Sites already in the output are skipped, failed ones retried on demand."""
+    output = tmp_path / "results.jsonl"
+    places = ["Lisbon", "nowhere", "Porto"]
+    done = Site(site_id="0", params={"place": "Lisbon"})
+    done.state["place"] = _place(done)
+    output.write_text(
+        json.dumps(done.record())
+        + "\n"
+        # Interrupted while writing.
+        + '{"site_id": "1", "sta',
+    )
+
+    fake = FakeStages()
+    await run_batch(_sites(places), JsonlWriter(output), fake.stages())
+    assert fake.calls["geocode"] == 2
+    assert JsonlWriter(output).done() == {"0", "1", "2"}
+    assert JsonlWriter(output).done(retry_errors=True) == {"0", "2"}
+
+    fake = FakeStages()
+    await run_batch(_sites(places), JsonlWriter(output), fake.stages())
+    assert fake.calls["geocode"] == 0
+    await run_batch(
+        _sites(places),
+        JsonlWriter(output),
+        fake.stages(),
+        retry_errors=True,
+    )
+    assert fake.calls["geocode"] == 1
+
+
+async def test_geoparquet_output(tmp_path):
+    """GeoParquet parts hold the place and search area geometries."""
+    fake = FakeStages()
+    output = tmp_path / "results"
+    writer = GeoParquetWriter(output, batch_size=2)
+    stages = {"geocode": fake.stage("geocode", 0), "buffer": buffer}
+    sites = _sites(["Lisbon", "Porto", "nowhere"])
+    for site in sites:
+        site.params["buffer_km"] = "0.5"
+    await run_batch(sites, writer, stages)
+
+    assert sorted(p.name for p in output.iterdir()) == [
+        "part-00000.parquet",
+        "part-00001.parquet",
+    ]
+    results = gpd.read_parquet(output).set_index("query")
+    assert results.crs == "EPSG:4326"
+    assert results.loc["Lisbon", "geometry"].geom_type == "Point"
+    assert results.loc["Lisbon", "search_area"].contains(
+        results.loc["Lisbon", "geometry"],
+    )
+    assert results.loc["nowhere", "geometry"] is None
+    assert GeoParquetWriter(output).done(retry_errors=True) == {"0", "1"}
+
+
+def test_read_sites(tmp_path):
+    """CSV columns override the defaults, empty cells don't."""
+    path = tmp_path / "sites.csv"
+    path.write_text("site_id,place,buffer_km\na,Lisbon,2\n,Porto,\n")
+    sites = read_sites(path, {"buffer_km": 1.0, "category": "cafe"})
+    assert [site.site_id for site in sites] == ["a", "2"]
+    assert sites[0].params == {
+        "site_id": "a",
+        "place": "Lisbon",
+        "buffer_km": "2",
+        "category": "cafe",
+    }
+    assert sites[1].params["buffer_km"] == 1.0
@@ -0,0 +1,211 @@
+"""Shared test fixtures."""
+
+import datetime
+import threading
+from pathlib import Path
+
+import dask.array as da
+import geopandas as gpd
+import numpy as np
+import pystac
+import pytest
+import rasterio
+import xarray as xr
+from geojson_pydantic import Feature
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from odc.geo.geobox import GeoBox
+from pyproj import Transformer
+from pystac.extensions.eo import Band, EOExtension
+from pystac.extensions.raster import RasterBand
+from rasterio.transform import from_origin
+from shapely.geometry import Point, box, mapping
+
+from geo_assistant.raster import streaming
+from geo_assistant.vector.extensions import connect
+
+NAIP_CRS = "EPSG:26918"
+NAIP_ORIGIN = (325_000, 4_310_000)
+NAIP_SIZE = 1_000
+
+
+def _lonlat_bounds(x0: float, y0: float, x1: float, y1: float) -> tuple:
+    """Longitude/latitude bounds of a box in the NAIP CRS."""
+    to_lonlat = Transformer.from_crs(NAIP_CRS, "EPSG:4326", always_xy=True)
+    corners = [to_lonlat.transform(x, y) for x in (x0, x1) for y in (y0, y1)]
+    lons, lats = zip(*corners, strict=True)
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def _make_naip_item(
+    path: Path,
+    item_id: str,
+    acquired: datetime.datetime,
+    data: np.ndarray,
+) -> pystac.Item:
+    """
+    Write a 4 band uint8 array as a NAIP-like COG and return its STAC item, with
+    the band metadata of Planetary Computer items returned by `_search_naip_items`.
+    """
+    x0, y1 = NAIP_ORIGIN
+    with rasterio.open(
+        path,
+        "w",
+        driver="COG",
+        width=NAIP_SIZE,
+        height=NAIP_SIZE,
+        count=4,
+        dtype="uint8",
+        crs=NAIP_CRS,
+        transform=from_origin(x0, y1, 1.0, 1.0),
+    ) as dst:
+        dst.write(data)
+
+    bbox = _lonlat_bounds(x0, y1 - NAIP_SIZE, x0 + NAIP_SIZE, y1)
+    item = pystac.Item(
+        id=item_id,
+        geometry=mapping(box(*bbox)),
+        bbox=list(bbox),
+        datetime=acquired,
+        properties={"proj:code": NAIP_CRS},
+    )
+    item.add_asset(
+        "image",
+        pystac.Asset(href=str(path), media_type=pystac.MediaType.COG),
+    )
+    EOExtension.ext(item.assets["image"], add_if_missing=True).bands = [
+        Band.create(name=name, common_name=name)
+        for name in ("red", "green", "blue", "nir")
+    ]
+    # Added by `_search_naip_items` for Planetary Computer items.
+    item.assets["image"].ext.add("raster")
+    item.assets["image"].ext.raster.bands = [RasterBand.create() for _ in range(4)]
+    return item
+
+
+@pytest.fixture
+def naip_item(tmp_path):
+    """STAC item of a local 1000x1000 px, 1 m, 4 band NAIP-like COG."""
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, (4, NAIP_SIZE, NAIP_SIZE), dtype="uint8")
+    return _make_naip_item(
+        tmp_path / "naip.tif",
+        "naip_test",
+        datetime.datetime(2021, 6, 1, tzinfo=datetime.UTC),
+        data,
+    )
+
+
+@pytest.fixture
+def naip_items_multi_year(tmp_path):
+    """
+    STAC items of two acquisitions of the `naip_item` footprint, 2018 with
+    constant values of 50 and 2021 with constant values of 200.
+    """
+    return [
+        _make_naip_item(
+            tmp_path / f"naip_{year}.tif",
+            f"naip_test_{year}",
+            datetime.datetime(year, 6, 1, tzinfo=datetime.UTC),
+            np.full((4, NAIP_SIZE, NAIP_SIZE), value, dtype="uint8"),
+        )
+        for year, value in [(2018, 50), (2021, 200)]
+    ]
+
+
+@pytest.fixture
+def naip_aoi():
+    """Search area of about 300x200 m inside the `naip_item` footprint."""
+    x0, y1 = NAIP_ORIGIN
+    bbox = _lonlat_bounds(x0 + 100, y1 - 300, x0 + 400, y1 - 100)
+    return Feature(type="Feature", geometry=mapping(box(*bbox)), properties={})
+
+
+@pytest.fixture
+def naip_cube(tmp_path, monkeypatch):
+    """Id of a random RGB cube written to a temporary cube cache, on the `naip_item` footprint."""
+    monkeypatch.setattr(streaming, "CACHE_DIR", tmp_path / "cache")
+    x0, y1 = NAIP_ORIGIN
+    geobox = GeoBox.from_bbox(
+        (x0, y1 - NAIP_SIZE, x0 + NAIP_SIZE, y1),
+        crs=NAIP_CRS,
+        resolution=1,
+    )
+    rng = np.random.default_rng(2)
+    data = rng.integers(1, 256, (3, NAIP_SIZE, NAIP_SIZE), dtype="uint8")
+    cube = xr.DataArray(
+        da.from_array(data, chunks=(3, 512, 512)),
+        dims=("band", "y", "x"),
+    )
+    path = streaming.cube_cache_path(["naip_test"], geobox)
+    streaming.write_cube(cube, geobox, path)
+    return path.stem
+
+
+class ScriptedChatModel(FakeMessagesListChatModel):
+    """Fake chat model that replays AI messages and accepts tool binding."""
+
+    def bind_tools(self, tools, **kwargs):
+        """Ignore the tools, the responses are scripted."""
+        return self
+
+
+class BlockingWork:
+    """Blocking function returning once interrupted, or after `seconds`."""
+
+    def __init__(self, seconds: float = 10):
+        """Initialize the events."""
+        self.seconds = seconds
+        self.started = threading.Event()
+        self.interrupted = threading.Event()
+        self.stopped = threading.Event()
+
+    def __call__(self) -> str:
+        """Block until interrupted."""
+        self.started.set()
+        try:
+            if self.interrupted.wait(self.seconds):
+                raise InterruptedError("interrupted")
+            return "done"
+        finally:
+            self.stopped.set()
+
+
+@pytest.fixture
+def blocking_work():
+    """Blocking work for a worker thread, stopped by setting `interrupted`."""
+    return BlockingWork()
+
+
+@pytest.fixture
+def local_places(tmp_path, monkeypatch):
+    """Overture-like places in a local GeoParquet file, set as the local source."""
+    try:
+        connect(["spatial"]).close()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    points = [(-9.1393, 38.7223), (-9.1395, 38.7225), (-9.1500, 38.7300)]
+    places = gpd.GeoDataFrame(
+        {
+            "id": ["cafe-1", "cafe-2", "bar-1"],
+            "names": [
+                {"primary": "Neighbourhood Cafe Lisbon"},
+                {"primary": "Cafe Alfama"},
+                {"primary": "Bar Alto"},
+            ],
+            "confidence": [0.9, 0.8, 0.7],
+            "websites": [["https://example.com"], None, None],
+            "socials": [None, None, None],
+            "categories": [
+                {"primary": "cafe", "alternate": ["coffee_shop"]},
+                {"primary": "cafe", "alternate": None},
+                {"primary": "bar", "alternate": None},
+            ],
+            "bbox": [{"xmin": x, "xmax": x, "ymin": y, "ymax": y} for x, y in points],
+            "geometry": [Point(x, y) for x, y in points],
+        },
+        crs="EPSG:4326",
+    )
+    places.to_parquet(tmp_path / "places.parquet")
+    monkeypatch.setenv("OVERTURE_SOURCE", "local")
+    monkeypatch.setenv("OVERTURE_LOCAL_PATH", str(tmp_path / "*.parquet"))
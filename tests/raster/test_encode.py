@@ -0,0 +1,108 @@
+"""Tests for contrast stretching and image encoding."""
+
+import base64
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from geo_assistant.raster.encode import (
+    encode_image,
+    fit_image,
+    image_mime_type,
+    image_size,
+    resize_to_fit,
+    stretch_limits,
+    stretch_to_uint8,
+)
+
+
+@pytest.fixture
+def rgb_uint8():
+    """Random 256x256 RGB uint8 raster."""
+    rng = np.random.default_rng(42)
+    return rng.integers(0, 256, size=(256, 256, 3), dtype="uint8")
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16", "float32"])
+def test_stretch_limits_match_percentiles(dtype):
+    """Sampled stretch limits are close to full-array percentiles."""
+    rng = np.random.default_rng(0)
+    arr = rng.normal(120, 30, size=(1024, 1024, 3)).clip(0, 255).astype(dtype)
+
+    vmin, vmax = stretch_limits(arr, max_pixels=100_000)
+
+    assert vmin == pytest.approx(np.percentile(arr, 2), abs=2)
+    assert vmax == pytest.approx(np.percentile(arr, 98), abs=2)
+
+
+def test_stretch_limits_constant_raster():
+    """Constant rasters do not produce an inverted stretch."""
+    vmin, vmax = stretch_limits(np.full((8, 8, 3), 7, dtype="uint8"))
+    assert vmin <= vmax
+
+
+def test_stretch_to_uint8_in_place(rgb_uint8):
+    """uint8 rasters are stretched in place."""
+    out = stretch_to_uint8(rgb_uint8, 10, 200)
+    assert out.dtype == np.uint8
+    assert np.shares_memory(out, rgb_uint8)
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16", "float32"])
+def test_stretch_to_uint8_matches_float_stretch(rgb_uint8, dtype):
+    """The stretch matches the float32 reference implementation."""
+    arr = rgb_uint8.astype(dtype)
+    vmin, vmax = 10.0, 200.0
+    expected = (
+        np.clip((arr.astype("float32") - vmin) / (vmax - vmin + 1e-6), 0, 1) * 255
+    ).astype("uint8")
+
+    out = stretch_to_uint8(arr, vmin, vmax)
+
+    assert np.abs(out.astype(int) - expected.astype(int)).max() <= 1
+
+
+@pytest.mark.parametrize("format", ["jpeg", "webp", "png"])
+def test_encode_image(rgb_uint8, format):
+    """Encoded images decode back to the input size and are detected correctly."""
+    data = encode_image(rgb_uint8, format=format, quality=80)
+
+    img = Image.open(BytesIO(data))
+    assert img.format.lower() == format
+    assert img.size == (256, 256)
+    assert image_mime_type(base64.b64encode(data).decode()) == f"image/{format}"
+
+
+def test_encode_image_unsupported_format(rgb_uint8):
+    """Unknown formats are rejected."""
+    with pytest.raises(ValueError):
+        encode_image(rgb_uint8, format="gif")
+
+
+@pytest.mark.parametrize("format", ["jpeg", "png"])
+def test_image_size(rgb_uint8, format):
+    """The size is read from the headers of the encoded image."""
+    img_base64 = base64.b64encode(encode_image(rgb_uint8[:, :200], format)).decode()
+    assert image_size(img_base64) == (200, 256)
+    assert image_size(base64.b64encode(b"not an image").decode()) is None
+
+
+def test_resize_to_fit(rgb_uint8):
+    """Rasters are shrunk to the maximum size, keeping their aspect ratio."""
+    assert resize_to_fit(rgb_uint8, 512) is rgb_uint8
+    resized = resize_to_fit(rgb_uint8[:, :128], 64)
+    assert resized.shape == (64, 32, 3)
+    assert resized.dtype == np.uint8
+
+
+@pytest.mark.parametrize("format", ["jpeg", "png"])
+def test_fit_image(rgb_uint8, format):
+    """Images larger than the maximum size are resized and re-encoded."""
+    data = encode_image(rgb_uint8, format)
+    assert fit_image(data, 256) is data
+
+    fitted = Image.open(BytesIO(fit_image(data, 100, "jpeg", 80)))
+    assert fitted.format == "JPEG"
+    assert fitted.size == (100, 100)
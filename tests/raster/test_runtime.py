@@ -0,0 +1,61 @@
+"""Tests for the shared raster I/O runtime."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from odc.loader._rio import capture_rio_env
+
+from geo_assistant.raster import runtime
+from geo_assistant.raster.runtime import LoadExecutor, configure_raster_io
+from geo_assistant.tools import naip
+
+
+def test_load_executor_cancels_its_own_reads():
+    """Shutting a load down cancels its pending reads, not those of other loads."""
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        load, other = LoadExecutor(pool), LoadExecutor(pool)
+        running = load.submit(release.wait)
+        pending = load.submit(lambda: "load")
+        other_pending = other.submit(lambda: "other")
+
+        load.shutdown(wait=False, cancel_futures=True)
+        assert pending.cancelled()
+        with pytest.raises(RuntimeError, match="after shutdown"):
+            load.submit(lambda: "late")
+
+        release.set()
+        assert running.result() is True
+        assert other_pending.result() == "other"
+        assert pool.submit(lambda: "pool").result() == "pool"
+
+
+def test_configure_raster_io():
+    """Every load captures the GDAL options, with the odc-stac cloud defaults."""
+    configure_raster_io()
+    env = capture_rio_env()
+    for key, value in runtime.GDAL_OPTIONS.items():
+        assert env[key] == value
+    assert env["GDAL_HTTP_MAX_RETRY"] == "10"
+
+
+def test_load_runs_on_the_shared_pool(naip_item, naip_aoi):
+    """Eager loads read their chunks on the shared raster threads."""
+    threads = set()
+    executor = runtime.load_executor()
+    submit = executor.submit
+
+    def record_thread(fn, /, *args, **kwargs):
+        def run():
+            threads.add(threading.current_thread().name)
+            return fn(*args, **kwargs)
+
+        return submit(run)
+
+    executor.submit = record_thread
+    ds = naip._load_naip_cube([naip_item], naip_aoi.geometry, executor=executor)
+
+    assert ds.sizes["time"] == 1
+    assert threads
+    assert all(name.startswith("raster-io") for name in threads)
@@ -0,0 +1,122 @@
+"""Tests for the signing of Planetary Computer assets with cached SAS tokens."""
+
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pystac
+import pytest
+
+from geo_assistant.raster.signing import TokenCache
+
+BLOB_HREF = "https://naipeuwest.blob.core.windows.net/naip/v002/tile.tif"
+PREVIEW_HREF = "https://planetarycomputer.microsoft.com/api/data/v1/item/preview.png"
+
+
+class TokenStandIn(ThreadingHTTPServer):
+    """Local SAS token service, handing out numbered tokens valid for `ttl` s."""
+
+    def __init__(self, ttl: float):
+        """Serve tokens on a free port."""
+        super().__init__(("127.0.0.1", 0), _TokenHandler)
+        self.ttl = ttl
+        self.requests: list[str] = []
+
+    @property
+    def sas_url(self) -> str:
+        """URL of the token endpoint."""
+        return f"http://127.0.0.1:{self.server_address[1]}/api/sas/v1/token"
+
+
+class _TokenHandler(BaseHTTPRequestHandler):
+    server: TokenStandIn
+
+    def do_GET(self):
+        self.server.requests.append(self.path.rsplit("/", 1)[-1])
+        expiry = datetime.datetime.now(datetime.UTC) + datetime.timedelta(
+            seconds=self.server.ttl,
+        )
+        body = json.dumps(
+            {
+                "msft:expiry": expiry.isoformat(),
+                "token": f"sv=2021&sig={len(self.server.requests)}",
+            },
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def token_service():
+    """Stand-in token service handing out tokens valid for an hour."""
+    server = TokenStandIn(ttl=3600)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _item() -> pystac.Item:
+    item = pystac.Item(
+        id="naip_test",
+        geometry=None,
+        bbox=None,
+        datetime=datetime.datetime(2021, 6, 1, tzinfo=datetime.UTC),
+        properties={},
+    )
+    item.add_asset("image", pystac.Asset(href=BLOB_HREF))
+    item.add_asset("rendered_preview", pystac.Asset(href=PREVIEW_HREF))
+    return item
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_items_are_signed_with_the_cached_token(token_service):
+    """Blob assets are signed locally, the token is requested once."""
+    cache = TokenCache(token_service.sas_url)
+    first, second = cache.sign_items([_item(), _item()], "naip")
+    cache.sign_items([_item()], "naip")
+
+    assert first.assets["image"].href == f"{BLOB_HREF}?sv=2021&sig=1"
+    assert second.assets["image"].href == first.assets["image"].href
+    assert first.assets["rendered_preview"].href == PREVIEW_HREF
+    assert token_service.requests == ["naip"]
+
+    # Signed assets are not signed twice.
+    assert cache.sign_items([first], "naip")[0].assets["image"].href.count("?") == 1
+
+
+def test_token_close_to_expiry_is_refreshed_in_the_background(token_service):
+    """The cached token is used while a new one is requested in the background."""
+    token_service.ttl = 300
+    cache = TokenCache(token_service.sas_url, refresh_seconds=600)
+    assert cache.token("naip").token.endswith("sig=1")
+
+    token_service.ttl = 3600
+    assert cache.token("naip").token.endswith("sig=1")
+    _wait_for(lambda: len(token_service.requests) == 2)
+    _wait_for(lambda: cache.token("naip").token.endswith("sig=2"))
+    cache.token("naip")
+    assert len(token_service.requests) == 2
+
+
+def test_expiring_token_is_replaced_before_use(token_service):
+    """A token about to expire is not used, a new one is requested first."""
+    token_service.ttl = 10
+    cache = TokenCache(token_service.sas_url)
+    assert cache.token("naip").token.endswith("sig=1")
+    assert cache.token("naip").token.endswith("sig=2")
+    assert token_service.requests == ["naip", "naip"]
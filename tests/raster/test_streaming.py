@@ -0,0 +1,171 @@
+"""Tests for chunked raster cube processing."""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
+import dask.array as da
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from odc.geo.geobox import GeoBox
+
+from geo_assistant.raster import streaming
+from geo_assistant.raster.encode import histogram_stretch_limits, stretch_limits
+from geo_assistant.raster.streaming import (
+    defer_cube,
+    evict_cubes,
+    read_chips,
+    read_preview,
+    read_stretch_limits,
+    write_cube,
+    write_deferred_cube,
+)
+
+
+@pytest.fixture
+def cube():
+    """Dask-backed 3x700x900 uint8 cube in 256 px chunks."""
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 256, (3, 700, 900), dtype="uint8")
+    return xr.DataArray(
+        da.from_array(data, chunks=(1, 256, 256)),
+        dims=("band", "y", "x"),
+    )
+
+
+@pytest.fixture
+def geobox():
+    """Geobox matching the `cube` fixture."""
+    return GeoBox.from_bbox((0, 0, 900, 700), crs="EPSG:32618", resolution=1)
+
+
+def test_write_cube(tmp_path, cube, geobox):
+    """The cube is written unchanged with its stretch limits."""
+    path = tmp_path / "cube.tif"
+
+    vmin, vmax = write_cube(cube, geobox, path, parallel_chunks=2)
+
+    with rasterio.open(path) as src:
+        np.testing.assert_array_equal(src.read(), cube.values)
+        assert src.crs == "EPSG:32618"
+        assert src.overviews(1)
+    hist = np.bincount(cube.values.ravel(), minlength=256)
+    hist[0] = 0
+    expected = histogram_stretch_limits(hist)
+    assert (vmin, vmax) == expected
+    assert read_stretch_limits(path) == expected
+    assert [p.name for p in tmp_path.iterdir()] == ["cube.tif"]
+
+
+def test_write_cube_stretch_ignores_nodata(tmp_path, geobox):
+    """Limits of a cube clipped to a circular AOI match the in-memory stretch."""
+    rng = np.random.default_rng(3)
+    values = rng.normal(150, 10, (3, 700, 900)).round()
+    y, x = np.mgrid[:700, :900]
+    values[:, (y - 350) ** 2 + (x - 450) ** 2 > 300**2] = np.nan
+    cube = xr.DataArray(
+        da.from_array(np.nan_to_num(values).astype("uint8"), chunks=(1, 256, 256)),
+        dims=("band", "y", "x"),
+    )
+    path = tmp_path / "cube.tif"
+
+    vmin, vmax = write_cube(cube, geobox, path)
+
+    expected = stretch_limits(np.moveaxis(values, 0, -1).astype("float32"))
+    assert (vmin, vmax) == pytest.approx(expected, abs=1)
+    with rasterio.open(path) as src:
+        assert src.nodata == 0
+        # The corners stay nodata at every overview level.
+        assert src.read(1, out_shape=(70, 90))[0, 0] == 0
+    # Edge pixels of the preview are not darkened by the nodata around them.
+    preview = read_preview(path, 90)
+    assert preview[preview > 0].min() > 90
+
+
+def test_evict_cubes(tmp_path):
+    """The least recently used cubes are removed beyond the size limit."""
+    for age, name in enumerate(["new", "kept", "old", "oldest"]):
+        path = tmp_path / f"{name}.tif"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1_000_000 - age, 1_000_000 - age))
+    (tmp_path / "partial.tmp.tif").write_bytes(b"x" * 100)
+
+    evicted = evict_cubes(tmp_path, max_bytes=250, keep=tmp_path / "oldest.tif")
+
+    assert sorted(path.name for path in evicted) == ["kept.tif", "old.tif"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "new.tif",
+        "oldest.tif",
+        "partial.tmp.tif",
+    ]
+
+
+def test_write_cube_evicts(tmp_path, cube, geobox, monkeypatch):
+    """Writing a cube evicts older cubes beyond NAIP_CACHE_MAX_MB."""
+    monkeypatch.setattr(streaming, "CACHE_MAX_MB", 1.5)
+    write_cube(cube, geobox, tmp_path / "first.tif")
+    write_cube(cube, geobox, tmp_path / "second.tif")
+
+    assert [path.name for path in tmp_path.iterdir()] == ["second.tif"]
+
+
+def test_write_cube_cancelled(tmp_path, cube, geobox):
+    """A cancelled write stops before the next chunks and leaves no file."""
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        write_cube(cube, geobox, tmp_path / "cube.tif", cancel=cancel)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_deferred_cube(tmp_path, cube, geobox, monkeypatch):
+    """In-memory cubes are written on first use, the oldest are dropped."""
+    monkeypatch.setattr(streaming, "DEFERRED_CUBES_MAX", 2)
+    monkeypatch.setattr(streaming, "_DEFERRED_CUBES", OrderedDict())
+    in_memory = cube.compute()
+    paths = [tmp_path / f"{name}.tif" for name in ("dropped", "first", "second")]
+    for path in paths:
+        defer_cube(in_memory, geobox, path)
+    assert list(tmp_path.iterdir()) == []
+
+    assert not write_deferred_cube(paths[0])
+    assert write_deferred_cube(paths[1])
+    # Written once, then read from the cache.
+    assert write_deferred_cube(paths[1])
+    assert [path.name for path in tmp_path.iterdir()] == ["first.tif"]
+
+
+def test_read_preview(tmp_path, cube, geobox):
+    """Previews are decimated to the requested maximum size."""
+    path = tmp_path / "cube.tif"
+    write_cube(cube, geobox, path)
+
+    preview = read_preview(path, 300)
+
+    assert preview.shape == (233, 300, 3)
+    assert preview.dtype == np.uint8
+
+
+def test_read_chips(tmp_path, cube, geobox):
+    """Chips cover the image at full resolution, or decimated to fit max_chips."""
+    path = tmp_path / "cube.tif"
+    write_cube(cube, geobox, path)
+
+    chips = read_chips(path, 256, 16)
+
+    assert [(row, col) for row, col, _ in chips] == [
+        (row, col) for row in range(3) for col in range(4)
+    ]
+    np.testing.assert_array_equal(
+        chips[0][2],
+        np.moveaxis(cube.values[:, :256, :256], 0, -1),
+    )
+    assert chips[-1][2].shape == (700 - 512, 900 - 768, 3)
+
+    decimated = read_chips(path, 256, 4)
+
+    assert len(decimated) <= 4
+    assert all(max(arr.shape[:2]) <= 256 for _, _, arr in decimated)
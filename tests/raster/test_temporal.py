@@ -0,0 +1,55 @@
+"""Tests for temporal composites."""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from geo_assistant.raster.temporal import temporal_composite
+
+
+@pytest.fixture
+def cube():
+    """
+    Dask-backed (time, y, x) RGB cube of three acquisitions with nodata gaps.
+
+    Pixel (0, 0) is valid in every acquisition, (0, 1) only in the first two,
+    (1, 0) only in the last and (1, 1) in none.
+    """
+    values = np.array(
+        [
+            [[10, 20], [0, 0]],
+            [[30, 40], [0, 0]],
+            [[60, 0], [90, 0]],
+        ],
+        dtype="uint8",
+    )
+    return xr.Dataset(
+        {band: (("time", "y", "x"), values) for band in ("red", "green", "blue")},
+        coords={"time": np.array(["2016", "2018", "2021"], dtype="datetime64[ns]")},
+    ).chunk({"time": 1, "y": 1, "x": 1})
+
+
+@pytest.mark.parametrize(
+    ("composite", "expected"),
+    [
+        ("first", [[10, 20], [0, 0]]),
+        ("latest", [[60, 40], [90, 0]]),
+        ("median", [[30, 30], [90, 0]]),
+        ("change", [[50, 20], [0, 0]]),
+    ],
+)
+def test_temporal_composite(cube, composite, expected):
+    """Composites reduce the valid values of each pixel over time."""
+    result = temporal_composite(cube, composite)
+
+    assert "time" not in result.dims
+    assert result["red"].chunks is not None, "Expected a lazy result"
+    red = result["red"].values
+    assert red.dtype == np.uint8
+    np.testing.assert_array_equal(red, expected)
+
+
+def test_temporal_composite_unsupported(cube):
+    """Unknown composites are rejected."""
+    with pytest.raises(ValueError, match="Unsupported temporal composite"):
+        temporal_composite(cube, "mean")
@@ -0,0 +1,64 @@
+"""Tests for XYZ tile rendering."""
+
+import math
+import shutil
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+from rasterio.errors import RasterioIOError
+
+from geo_assistant.raster.streaming import cube_path, evict_cubes
+from geo_assistant.raster.tiles import render_tile, tile_bounds
+
+# Inside the `naip_cube` footprint.
+LON, LAT = -77.0128, 38.9171
+
+
+def lonlat_tile(lon: float, lat: float, z: int) -> tuple[int, int, int]:
+    """XYZ tile containing a longitude/latitude."""
+    n = 2**z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+def test_tile_bounds():
+    """Tile bounds split the Web Mercator world in quadrants."""
+    world = tile_bounds(0, 0, 0)
+    assert world == pytest.approx(
+        (-20037508.34, -20037508.34, 20037508.34, 20037508.34),
+    )
+    assert tile_bounds(1, 0, 0) == pytest.approx((-20037508.34, 0, 0, 20037508.34))
+
+
+@pytest.mark.parametrize("z", [12, 15, 18])
+def test_render_tile(naip_cube, z):
+    """Tiles over the cube are opaque RGBA PNGs, at every zoom level."""
+    png = render_tile(cube_path(naip_cube), *lonlat_tile(LON, LAT, z))
+
+    img = Image.open(BytesIO(png))
+    assert img.size == (256, 256)
+    assert img.mode == "RGBA"
+    alpha = np.asarray(img)[..., 3]
+    assert alpha.any()
+    if z == 18:
+        assert alpha.all()
+
+
+def test_render_tile_outside(naip_cube):
+    """Tiles not intersecting the cube are not rendered."""
+    assert render_tile(cube_path(naip_cube), *lonlat_tile(2.35, 48.85, 16)) is None
+
+
+def test_render_tile_evicted(naip_cube, tmp_path):
+    """Tiles of an evicted cube are dropped from the tile cache."""
+    path = tmp_path / cube_path(naip_cube).name
+    shutil.copy(cube_path(naip_cube), path)
+    index = lonlat_tile(LON, LAT, 15)
+    assert render_tile(path, *index) is not None
+
+    assert evict_cubes(tmp_path, max_bytes=0) == [path]
+    with pytest.raises(RasterioIOError):
+        render_tile(path, *index)
@@ -1,5 +1,6 @@
 """Tests for chat API endpoint."""
 
+import asyncio
 from uuid import uuid4
 
 import pytest
@@ -8,6 +9,8 @@ from httpx import ASGITransport, AsyncClient
 
 from geo_assistant.agent.graph import create_graph
 from geo_assistant.api.app import app
+from geo_assistant.api.encoders import decode_msgpack_frames
+from geo_assistant.api.runs import RunQueue
 
 
 @pytest_asyncio.fixture
@@ -15,6 +18,7 @@ async def initialized_app():
     """Initialize the app's chatbot before testing."""
     # Manually initialize the chatbot as the lifespan would
     app.state.chatbot = await create_graph()
+    app.state.run_queue = RunQueue()
     yield app
     # Cleanup if needed
     if hasattr(app.state, "chatbot"):
@@ -54,3 +58,132 @@ async def test_call_api(initialized_app):
         content = response.text
         assert content is not None
         assert len(content) > 0
+
+
+async def test_tiles(initialized_app, naip_cube):
+    """Tiles of a cube are served by cube id and by thread, with cache headers."""
+    thread_id = uuid4()
+    await initialized_app.state.chatbot.aupdate_state(
+        {"configurable": {"thread_id": str(thread_id)}},
+        {"naip_cube": naip_cube},
+    )
+    z, x, y = 16, 18748, 25065
+    async with AsyncClient(
+        transport=ASGITransport(app=initialized_app),
+        base_url="http://test",
+    ) as client:
+        by_cube = await client.get(f"/tiles/{z}/{x}/{y}", params={"cube": naip_cube})
+        by_thread = await client.get(
+            f"/tiles/{z}/{x}/{y}",
+            params={"thread_id": str(thread_id)},
+        )
+        revalidated = await client.get(
+            f"/tiles/{z}/{x}/{y}",
+            params={"thread_id": str(thread_id)},
+            headers={"If-None-Match": by_thread.headers["etag"]},
+        )
+        outside = await client.get("/tiles/16/0/0", params={"cube": naip_cube})
+        unknown = await client.get(
+            f"/tiles/{z}/{x}/{y}",
+            params={"thread_id": str(uuid4())},
+        )
+
+    assert by_cube.status_code == 200
+    assert by_cube.headers["content-type"] == "image/png"
+    assert "immutable" in by_cube.headers["cache-control"]
+    assert by_thread.content == by_cube.content
+    assert by_thread.headers["cache-control"] == "no-cache"
+    assert revalidated.status_code == 304
+    assert outside.status_code == 204
+    assert unknown.status_code == 404
+
+
+class SlowChatbot:
+    """Stand-in graph streaming a single empty update after a delay."""
+
+    async def astream(self, **kwargs):
+        """Stream updates like the compiled agent graph."""
+        await asyncio.sleep(0.2)
+        yield {"model": {"messages": []}}
+
+
+async def test_chat_duplicate_submit(initialized_app):
+    """A second run on a busy thread is rejected with 429 and Retry-After."""
+    initialized_app.state.chatbot = SlowChatbot()
+    initialized_app.state.run_queue = RunQueue(max_queued_per_thread=0)
+    body = {
+        "agent_state_input": {"messages": [{"content": "Hi", "type": "human"}]},
+        "thread_id": str(uuid4()),
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=initialized_app),
+        base_url="http://test",
+    ) as client:
+        first, second = await asyncio.gather(
+            client.post("/chat", json=body),
+            client.post("/chat", json=body),
+        )
+        metrics = (await client.get("/metrics/runs")).json()
+
+    statuses = sorted([first.status_code, second.status_code])
+    assert statuses == [200, 429]
+    rejected = first if first.status_code == 429 else second
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert metrics["completed"] == 1
+    assert metrics["running"] == 0
+    assert metrics["rejected"] == {"ThreadBusyError": 1}
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "gzip"])
+async def test_chat_compressed(initialized_app, encoding):
+    """The chat stream is compressed with the negotiated encoding."""
+    initialized_app.state.chatbot = SlowChatbot()
+    body = {
+        "agent_state_input": {"messages": [{"content": "Hi", "type": "human"}]},
+        "thread_id": str(uuid4()),
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=initialized_app),
+        base_url="http://test",
+    ) as client:
+        response = await client.post(
+            "/chat",
+            json=body,
+            headers={"Accept-Encoding": encoding},
+        )
+        identity = await client.post(
+            "/chat",
+            json=body,
+            headers={"Accept-Encoding": "identity"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["x-accel-buffering"] == "no"
+    assert "content-encoding" not in identity.headers
+    # Decoded by httpx.
+    assert response.text == identity.text
+    assert response.json()["state"]["messages"] == []
+
+
+async def test_chat_msgpack(initialized_app):
+    """The chat stream is sent as MessagePack frames when preferred."""
+    initialized_app.state.chatbot = SlowChatbot()
+    body = {
+        "agent_state_input": {"messages": [{"content": "Hi", "type": "human"}]},
+        "thread_id": str(uuid4()),
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=initialized_app),
+        base_url="http://test",
+    ) as client:
+        response = await client.post(
+            "/chat",
+            json=body,
+            headers={"Accept": "application/vnd.msgpack"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.msgpack"
+    (frame,) = decode_msgpack_frames(response.content)
+    assert frame == {"thread_id": body["thread_id"], "state": {"messages": []}}
@@ -3,6 +3,7 @@
 from geojson_pydantic import Feature, Point
 from langchain_core.tools.base import ToolCall
 from pytest import fixture
+from shapely.geometry import shape
 
 from geo_assistant.agent.state import GeoAssistantState
 from geo_assistant.tools.buffer import get_search_area
@@ -48,3 +49,6 @@ async def test_get_search_area(geo_assistant_fixture):
     # Verify the buffer was created around the correct place
     search_area = command.update["search_area"]
     assert search_area.geometry.type == "Polygon"
+    assert shape(search_area.geometry).contains(
+        shape(geo_assistant_fixture["place"].geometry),
+    )
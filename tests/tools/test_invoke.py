@@ -0,0 +1,39 @@
+"""Tests for running the tools outside of the agent graph."""
+
+import pytest
+from geojson_pydantic import Feature
+
+from geo_assistant.agent.state import GeoAssistantState
+from geo_assistant.tools.buffer import get_search_area
+from geo_assistant.tools.invoke import invoke_tool
+
+
+async def test_invoke_tool():
+    """The state update is returned, a missing field raises the tool's message."""
+    place = Feature(
+        type="Feature",
+        geometry={"type": "Point", "coordinates": [-9.1393, 38.7223]},
+        properties={"name": "Lisbon"},
+    )
+    state = GeoAssistantState(messages=[], place=place, search_area=None)
+    update = await invoke_tool(
+        get_search_area,
+        {"buffer_size_km": 1.0, "state": state},
+        "search_area",
+    )
+    assert update["search_area"].properties == {"name": "Lisbon"}
+
+    state["place"] = None
+    args = {"buffer_size_km": 1.0, "state": state}
+    with pytest.raises(ValueError, match=r"^No place defined"):
+        await invoke_tool(get_search_area, args, "search_area")
+    with pytest.raises(
+        ValueError,
+        match=r"^get_search_area found nothing for \{'place': 'Atlantis'\}: No place",
+    ):
+        await invoke_tool(
+            get_search_area,
+            args,
+            "search_area",
+            context={"place": "Atlantis"},
+        )
@@ -1,14 +1,26 @@
 """Tests for NAIP tool."""
 
+import asyncio
+import base64
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from types import NoneType
 
+import numpy as np
 import pytest
+import xarray as xr
 from geojson_pydantic import Feature
 from langchain_core.tools.base import ToolCall
+from PIL import Image
 from shapely.geometry import box, mapping
 
+from geo_assistant.agent.cancellation import to_thread_cancellable
 from geo_assistant.agent.state import GeoAssistantState
-from geo_assistant.tools.naip import fetch_naip_img
+from geo_assistant.raster import streaming
+from geo_assistant.tools import naip
+from geo_assistant.tools.naip import _encode_rgb, fetch_naip_img
 
 
 @pytest.mark.asyncio
@@ -87,3 +99,164 @@ async def test_fetch_naip_too_large():
     assert "naip_img_bytes" in result.update
     assert result.update["naip_img_bytes"] is None, "Expected no JPEG bytes in result"
     assert isinstance(result.update["naip_img_bytes"], NoneType)
+
+
+def test_encode_rgb():
+    """An RGB image is stretched and encoded as an image."""
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(
+        {
+            band: (("y", "x"), rng.integers(0, 256, (64, 48), "uint8"))
+            for band in ("red", "green", "blue")
+        },
+    )
+
+    img_base64 = _encode_rgb(ds)
+
+    img = Image.open(BytesIO(base64.b64decode(img_base64)))
+    assert img.size == (48, 64)
+    assert img.mode == "RGB"
+
+
+async def test_fetch_naip_streaming(monkeypatch, tmp_path, naip_item, naip_aoi):
+    """Streaming mode writes the cube to the cache and returns a bounded preview."""
+    monkeypatch.setattr(naip, "_search_naip_items", lambda *args: [naip_item])
+    monkeypatch.setattr(naip, "PROCESSING_MODE", "streaming")
+    monkeypatch.setattr(naip, "MAX_IMAGE_SIZE", 128)
+    monkeypatch.setattr(streaming, "CACHE_DIR", tmp_path / "cache")
+    tool_call = ToolCall(
+        name="fetch_naip_img",
+        args={
+            "start_date": "2021-01-01",
+            "end_date": "2021-12-31",
+            "state": GeoAssistantState(search_area=naip_aoi, messages=[]),
+        },
+        type="tool_call",
+        id="test_tool_call_id",
+    )
+
+    result = await fetch_naip_img.ainvoke(tool_call)
+
+    img = Image.open(BytesIO(base64.b64decode(result.update["naip_img_bytes"])))
+    assert max(img.size) == 128
+    assert len(list((tmp_path / "cache").glob("*.tif"))) == 1
+
+
+@pytest.mark.parametrize(
+    ("composite", "expected"),
+    [("first", 50), ("latest", 200), ("median", 125), ("change", 150)],
+)
+async def test_fetch_naip_composite(
+    monkeypatch,
+    tmp_path,
+    naip_items_multi_year,
+    naip_aoi,
+    composite,
+    expected,
+):
+    """Temporal composites reduce every acquisition of the date range."""
+    monkeypatch.setattr(
+        naip,
+        "_search_naip_items",
+        lambda *args: naip_items_multi_year,
+    )
+    captured = {}
+
+    def encode_rgb(ds):
+        captured["ds"] = ds.compute()
+        return _encode_rgb(ds)
+
+    monkeypatch.setattr(naip, "_encode_rgb", encode_rgb)
+    monkeypatch.setattr(streaming, "CACHE_DIR", tmp_path / "cache")
+    tool_call = ToolCall(
+        name="fetch_naip_img",
+        args={
+            "start_date": "2018-01-01",
+            "end_date": "2021-12-31",
+            "composite": composite,
+            "state": GeoAssistantState(search_area=naip_aoi, messages=[]),
+        },
+        type="tool_call",
+        id="test_tool_call_id",
+    )
+
+    result = await fetch_naip_img.ainvoke(tool_call)
+
+    assert result.update["naip_img_bytes"] is not None
+    # Written to the cube cache once its tiles are requested.
+    path = streaming.cube_path(result.update["naip_cube"])
+    assert not path.exists()
+    assert streaming.write_deferred_cube(path)
+    assert "time" not in captured["ds"].dims
+    assert (captured["ds"]["red"].values == expected).all()
+    if composite != "first":
+        assert "2018-06-01, 2021-06-01" in result.update["messages"][0].content
+
+
+async def test_fetch_naip_change_single_acquisition(monkeypatch, naip_item, naip_aoi):
+    """A change composite needs at least two acquisitions."""
+    monkeypatch.setattr(naip, "_search_naip_items", lambda *args: [naip_item])
+    tool_call = ToolCall(
+        name="fetch_naip_img",
+        args={
+            "start_date": "2021-01-01",
+            "end_date": "2021-12-31",
+            "composite": "change",
+            "state": GeoAssistantState(search_area=naip_aoi, messages=[]),
+        },
+        type="tool_call",
+        id="test_tool_call_id",
+    )
+
+    result = await fetch_naip_img.ainvoke(tool_call)
+
+    assert result.update["naip_img_bytes"] is None
+    assert "at least two" in result.update["messages"][0].content
+
+
+class GatedExecutor(ThreadPoolExecutor):
+    """Single thread pool whose chunk reads wait until released."""
+
+    def __init__(self):
+        """Start with no read."""
+        super().__init__(max_workers=1)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.reads = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Submit a read waiting for `release`."""
+
+        def read(*args, **kwargs):
+            self.reads += 1
+            self.started.set()
+            self.release.wait(5)
+            return fn(*args, **kwargs)
+
+        return super().submit(read, *args, **kwargs)
+
+
+async def test_load_naip_cube_cancelled(naip_item, naip_aoi):
+    """Cancelling a load cancels the chunk reads that have not started."""
+    executor = GatedExecutor()
+    load = asyncio.create_task(
+        to_thread_cancellable(
+            naip._load_naip_cube,
+            [naip_item],
+            naip_aoi.geometry,
+            False,
+            executor,
+            interrupt=functools.partial(
+                executor.shutdown,
+                wait=False,
+                cancel_futures=True,
+            ),
+        ),
+    )
+    assert await asyncio.to_thread(executor.started.wait, 5)
+    load.cancel()
+    asyncio.get_running_loop().call_later(0.1, executor.release.set)
+
+    with pytest.raises(asyncio.CancelledError):
+        await load
+    assert executor.reads == 1
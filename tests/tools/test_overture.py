@@ -1,15 +1,29 @@
 """Tests for Overture tool."""
 
+import asyncio
 import os
+import queue
+import socket
+import threading
+import time
+from collections import defaultdict
 
+import duckdb
 import geopandas as gpd
 import pytest
 from geojson_pydantic import Feature, Point
 from langchain_core.tools.base import ToolCall
 from shapely.geometry import Point as ShapelyPoint
 
+from geo_assistant.agent import cancellation
 from geo_assistant.agent.state import GeoAssistantState
-from geo_assistant.tools.overture import get_place
+from geo_assistant.tools import overture
+from geo_assistant.tools.overture import (
+    area_digest,
+    export_places_within_buffer,
+    get_place,
+)
+from geo_assistant.vector import extensions
 from src.geo_assistant.tools.overture import get_places_within_buffer
 
 
@@ -90,3 +104,159 @@ async def test_get_places_within_buffer(geo_assistant_with_buffer_fixture):
     )
 
     assert "places_within_buffer" in command.update
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    """Fail any attempt to resolve or connect to a host, or install an extension."""
+
+    def disabled(*args, **kwargs):
+        raise OSError("Networking is disabled")
+
+    monkeypatch.setattr(socket, "getaddrinfo", disabled)
+    monkeypatch.setattr(socket.socket, "connect", disabled)
+    monkeypatch.setattr(extensions, "DUCKDB_EXTENSION_INSTALL", "off")
+
+
+async def test_overture_tools_offline(
+    no_network,
+    local_places,
+    geo_assistant_with_buffer_fixture,
+):
+    """The Overture tools query a local file with provisioned extensions only."""
+    command = await get_place.ainvoke(
+        ToolCall(
+            name="get_place",
+            type="tool_call",
+            id="test_id",
+            args={"place_name": "Neighbourhood Cafe Lisbon"},
+        ),
+    )
+    assert command.update["place"].properties["name"] == "Neighbourhood Cafe Lisbon"
+
+    command = await get_places_within_buffer.ainvoke(
+        ToolCall(
+            name="get_places_within_buffer",
+            type="tool_call",
+            id="test_id_places_within_buffer",
+            args={
+                "place": "cafe",
+                "state": geo_assistant_with_buffer_fixture,
+                "tool_call_id": "test_id_places_within_buffer",
+            },
+        ),
+    )
+    names = {
+        feature.properties["name"]
+        for feature in command.update["places_within_buffer"].features
+    }
+    assert names == {"Neighbourhood Cafe Lisbon", "Cafe Alfama"}
+
+
+async def test_export_places_within_buffer(
+    local_places,
+    geo_assistant_with_buffer_fixture,
+):
+    """The agent gets the count of the places and the handle of their export."""
+    command = await export_places_within_buffer.ainvoke(
+        ToolCall(
+            name="export_places_within_buffer",
+            type="tool_call",
+            id="test_id_export",
+            args={"place": "cafes", "state": geo_assistant_with_buffer_fixture},
+        ),
+        {"configurable": {"thread_id": "1"}},
+    )
+    digest = area_digest(geo_assistant_with_buffer_fixture["search_area"].geometry)
+    assert (
+        command.update["places_export"]
+        == f"/export/places?thread_id=1&area={digest}&category=cafe"
+    )
+    assert "Found 2 places of category cafe" in command.update["messages"][0].content
+
+
+async def test_cancelled_query_is_interrupted(monkeypatch):
+    """Cancelling a query interrupts its scan and returns the connection."""
+    monkeypatch.setenv("OVERTURE_SOURCE", "local")
+    pools = defaultdict(queue.SimpleQueue)
+    pools["local"].put(duckdb.connect())
+    monkeypatch.setattr(overture, "_CONNECTION_POOLS", pools)
+
+    def scan(connection, data_path):
+        return connection.execute(
+            "SELECT count(*) FROM range(100_000_000_000) t(x) WHERE x % 7 = 3",
+        ).fetchall()
+
+    task = asyncio.create_task(overture._run_query(scan))
+    await asyncio.sleep(0.2)
+    start = time.perf_counter()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert time.perf_counter() - start < 1
+
+    # Back in the pool, and not interrupted any longer.
+    assert pools["local"].qsize() == 1
+    with overture.pooled_connection() as connection:
+        assert connection.execute("SELECT 42").fetchone() == (42,)
+
+
+async def test_export_places_without_search_area():
+    """Exporting before a search area is set is answered, not an error."""
+    command = await export_places_within_buffer.ainvoke(
+        ToolCall(
+            name="export_places_within_buffer",
+            type="tool_call",
+            id="test_id_export",
+            args={"place": "cafes", "state": GeoAssistantState(messages=[])},
+        ),
+        {"configurable": {"thread_id": "1"}},
+    )
+    assert "places_export" not in command.update
+    assert "No search area" in command.update["messages"][0].content
+
+
+async def test_places_export_returns_connection(monkeypatch):
+    """
+    The pooled connection is returned before the download, and the export
+    is only closed once a read outliving its cancellation returns.
+    """
+    monkeypatch.setenv("OVERTURE_SOURCE", "local")
+    monkeypatch.setattr(cancellation, "CANCEL_GRACE_SECONDS", 0.1)
+    pools = defaultdict(queue.SimpleQueue)
+    pools["local"].put(duckdb.connect())
+    monkeypatch.setattr(overture, "_CONNECTION_POOLS", pools)
+    release = threading.Event()
+    cursors = []
+
+    def export_places(cursor, data_path, place, geometry, export_format):
+        cursors.append(cursor)
+        yield b"first"
+        # A read that ignores the interrupts.
+        release.wait()
+        yield b"second"
+
+    monkeypatch.setattr(overture, "_export_places", export_places)
+    stream = overture.stream_places_export(
+        "cafe",
+        Point(type="Point", coordinates=[0, 0]),
+        "arrow",
+    )
+    assert await anext(stream) == b"first"
+    assert pools["local"].qsize() == 1
+
+    task = asyncio.create_task(anext(stream))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.sleep(0.2)
+    # Past the grace period, still waiting for the read before closing.
+    assert not task.done()
+    cursors[0].execute("SELECT 42")
+
+    release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(duckdb.ConnectionException):
+        cursors[0].execute("SELECT 42")
+    with overture.pooled_connection() as connection:
+        assert connection.execute("SELECT 42").fetchone() == (42,)
@@ -1,14 +1,29 @@
 """Tests for the satellite image summarization tool."""
 
+import asyncio
 import base64
 import uuid
+from io import BytesIO
+from types import SimpleNamespace
 
+import dask.array as da
+import numpy as np
 import pytest
 import requests
+import xarray as xr
 from langchain_core.tools.base import ToolCall
+from odc.geo.geobox import GeoBox
+from PIL import Image
 
 from geo_assistant.agent.state import GeoAssistantState
-from geo_assistant.tools.summarize import summarize_sat_img
+from geo_assistant.raster import streaming
+from geo_assistant.tools import summarize
+from geo_assistant.tools.summarize import (
+    ChipSummaryStats,
+    image_url,
+    model_input_size,
+    summarize_sat_img,
+)
 
 # Sample test data
 TEST_IMAGE_URL = "https://petapixel.com/assets/uploads/2022/08/French-Officials-Use-Satellite-Photos-and-AI-to-Spot-Unregistered-Pools-1536x806.jpg"
@@ -48,3 +63,122 @@ async def test_summarize_sat_img(img_url, summary):
 
     print(command.update.get("messages"))
     assert summary in command.update.get("messages")[-1].content
+
+
+@pytest.mark.parametrize(
+    "model,size",
+    [
+        ("gemma3:4b", 896),
+        ("ollama/llava:7b", 672),
+        ("llama3.2-vision:11b", 1120),
+        ("unknown-vision:1b", 1024),
+    ],
+)
+def test_model_input_size(model, size):
+    """Input sizes are looked up by model name prefix."""
+    assert model_input_size(model) == size
+
+
+def test_image_url():
+    """Images are shrunk to the model input size, fitting ones are kept."""
+    rgb = np.random.default_rng(0).integers(0, 256, (600, 800, 3), dtype="uint8")
+    url = image_url(rgb, 400, 85)
+    prefix, img_base64 = url.split(";base64,")
+    assert prefix == "data:image/jpeg"
+    assert Image.open(BytesIO(base64.b64decode(img_base64))).size == (400, 300)
+
+    assert image_url(url, 400, 85) is url
+    smaller = image_url(url, 200, 85)
+    assert Image.open(BytesIO(base64.b64decode(smaller.split(",")[1]))).size == (
+        200,
+        150,
+    )
+    assert image_url(TEST_IMAGE_URL, 200, 85) == TEST_IMAGE_URL
+
+
+class FakeSummaryAgent:
+    """Summary agent answering with a counter, tracking concurrent calls."""
+
+    def __init__(self):
+        """Start without calls."""
+        self.ollama_model = SimpleNamespace(model="ollama/fake")
+        self.image_size = 1024
+        self.image_quality = 85
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.aggregated: list[list[str]] = []
+
+    async def acall(self, img_url: str):
+        """Describe a chip."""
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return SimpleNamespace(answer=f"chip {self.calls}")
+
+    async def aaggregate(self, chip_descriptions: list[str]):
+        """Merge the chip descriptions."""
+        self.aggregated.append(chip_descriptions)
+        return SimpleNamespace(answer=f"{len(chip_descriptions)} tiles")
+
+
+@pytest.fixture
+def naip_cube(tmp_path, monkeypatch):
+    """Id of a cached 3x1000x1000 uint8 cube."""
+    monkeypatch.setattr(streaming, "CACHE_DIR", tmp_path)
+    data = np.random.default_rng(0).integers(0, 256, (3, 1000, 1000), dtype="uint8")
+    streaming.write_cube(
+        xr.DataArray(
+            da.from_array(data, chunks=(1, 512, 512)),
+            dims=("band", "y", "x"),
+        ),
+        GeoBox.from_bbox((0, 0, 1000, 1000), crs="EPSG:32618", resolution=1),
+        streaming.cube_path("cube"),
+    )
+    return "cube"
+
+
+@pytest.mark.asyncio
+async def test_summarize_sat_img_tiled(naip_cube, monkeypatch):
+    """Chips are summarized concurrently, merged, and cached between calls."""
+    agent = FakeSummaryAgent()
+    monkeypatch.setattr(summarize, "_SUMMARIZER_AGENT", agent)
+    monkeypatch.setattr(summarize, "SUMMARY_MODE", "tiled")
+    monkeypatch.setattr(summarize, "SUMMARY_CHIP_SIZE", 256)
+    monkeypatch.setattr(summarize, "_CHIP_CACHE", summarize.OrderedDict())
+    monkeypatch.setattr(summarize, "CHIP_SUMMARY_STATS", ChipSummaryStats())
+
+    async def invoke():
+        return await summarize_sat_img.ainvoke(
+            ToolCall(
+                name="summarize_sat_img",
+                type="tool_call",
+                args={
+                    "state": GeoAssistantState(
+                        naip_img_bytes="preview",
+                        naip_cube=naip_cube,
+                        messages=[],
+                    ),
+                },
+                id=str(uuid.uuid4()),
+            ),
+        )
+
+    message = (await invoke()).update["messages"][-1]
+
+    assert message.content == "16 tiles"
+    assert agent.calls == 16
+    assert 1 < agent.max_running <= summarize.SUMMARY_CONCURRENCY
+    assert agent.aggregated[0][0].startswith("Tile row 1, column 1: chip ")
+    assert agent.aggregated[0][-1].startswith("Tile row 4, column 4: ")
+    chips = message.artifact["chips"]
+    assert [(chip["row"], chip["col"]) for chip in chips[:2]] == [(0, 0), (0, 1)]
+    assert not any(chip["cached"] for chip in chips)
+
+    message = (await invoke()).update["messages"][-1]
+
+    assert agent.calls == 16
+    assert agent.aggregated[1] == agent.aggregated[0]
+    assert all(chip["cached"] for chip in message.artifact["chips"])
@@ -0,0 +1,114 @@
+"""Tests for the Overture category taxonomy and clustered extracts."""
+
+import duckdb
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+from geo_assistant.vector.categories import (
+    CategoryIndex,
+    build_category_table,
+    category_filter,
+    cluster_places,
+    load_category_index,
+)
+
+CATEGORIES = ["cafe", "italian_restaurant", "bakery", "bar", "coffee_shop"]
+
+
+@pytest.fixture
+def places_path(tmp_path):
+    """Overture-like places of a few categories, as GeoParquet."""
+    # DuckDB writes row groups of at least 2048 rows.
+    rows = 4 * 4096
+    places = gpd.GeoDataFrame(
+        {
+            "id": [f"place-{i}" for i in range(rows)],
+            "categories": [
+                {
+                    "primary": CATEGORIES[i % 4],
+                    "alternate": ["coffee_shop"] if i % 4 == 0 else None,
+                }
+                for i in range(rows)
+            ],
+            "bbox": [
+                {"xmin": i, "xmax": i, "ymin": -i, "ymax": -i} for i in range(rows)
+            ],
+            "geometry": [Point(i, -i) for i in range(rows)],
+        },
+        crs="EPSG:4326",
+    )
+    path = tmp_path / "places.parquet"
+    places.to_parquet(path)
+    return path
+
+
+def test_build_category_table(places_path, tmp_path):
+    """Primary and alternate categories are counted."""
+    output = tmp_path / "categories.parquet"
+    assert build_category_table(str(places_path), output) == 5
+
+    counts = {
+        category: (primary, alternate)
+        for category, primary, alternate in duckdb.execute(
+            "SELECT * FROM read_parquet(?)",
+            [str(output)],
+        ).fetchall()
+    }
+    assert counts == {
+        "bakery": (4096, 0),
+        "bar": (4096, 0),
+        "cafe": (4096, 0),
+        "italian_restaurant": (4096, 0),
+        "coffee_shop": (0, 4096),
+    }
+    # Alternate-only categories can't be queried on the primary category.
+    assert set(load_category_index(output).counts) == set(CATEGORIES[:4])
+
+
+@pytest.mark.parametrize(
+    ("term", "category"),
+    [
+        ("Cafe", "cafe"),
+        ("coffee shops", "cafe"),
+        ("Pubs", "bar"),
+        ("bakeries", "bakery"),
+        ("Italian Restaurants", "italian_restaurant"),
+        ("italian restaurnt", "italian_restaurant"),
+        ("bakerys", "bakery"),
+        ("zoo", "zoo"),
+    ],
+)
+def test_resolve(term, category):
+    """Terms resolve through synonyms, singulars, then fuzzy matches."""
+    index = CategoryIndex({"cafe": 10, "italian_restaurant": 5, "bakery": 2})
+    assert index.resolve(term) == category
+
+
+def test_cluster_places(places_path, tmp_path):
+    """Clustered row groups each hold one category, with the GeoParquet metadata."""
+    output = tmp_path / "clustered.parquet"
+    cluster_places(str(places_path), output, row_group_size=4096)
+
+    row_groups = duckdb.execute(
+        """
+        SELECT stats_min_value, stats_max_value FROM parquet_metadata(?)
+        WHERE path_in_schema = 'primary_category'
+        """,
+        [str(output)],
+    ).fetchall()
+    assert row_groups == [(category, category) for category in sorted(CATEGORIES[:4])]
+
+    clustered = gpd.read_parquet(output)
+    original = gpd.read_parquet(places_path)
+    assert clustered.crs == original.crs
+    assert sorted(clustered.geometry.to_wkt()) == sorted(original.geometry.to_wkt())
+
+    connection = duckdb.connect()
+    assert (
+        category_filter(connection, str(places_path), "cafe")
+        == "categories.primary = 'cafe'"
+    )
+    assert (
+        category_filter(connection, str(output), "cafe") == "primary_category = 'cafe'"
+    )
@@ -0,0 +1,96 @@
+"""Tests for geometry compaction."""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from geojson_pydantic import Feature, FeatureCollection
+from shapely.geometry import Point
+
+from geo_assistant.vector.compact import (
+    compact_feature,
+    compact_feature_collection,
+    compact_geometry,
+    geometry_bounds,
+)
+
+CENTER = (-9.1393, 38.7223)
+
+
+def _buffer(km: float) -> dict:
+    gdf = gpd.GeoSeries([Point(*CENTER)], crs="EPSG:4326").to_crs(epsg=3857)
+    return shapely.geometry.mapping(gdf.buffer(km * 1000).to_crs(epsg=4326).iloc[0])
+
+
+@pytest.mark.parametrize("km", [0.1, 0.5, 2, 10, 50])
+@pytest.mark.parametrize("tolerance_m", [0, 10, 100])
+def test_compact_geometry_contains(km, tolerance_m):
+    """
+    Compacted search areas are smaller, still contain the exact buffer, and
+    keep their area within the tolerance of it.
+    """
+    exact = _buffer(km)
+    compacted = compact_geometry(exact, precision=6, tolerance_m=tolerance_m)
+
+    exact_shape = shapely.geometry.shape(exact)
+    compacted_shape = shapely.geometry.shape(compacted)
+    assert compacted_shape.contains(exact_shape)
+    assert len(json.dumps(compacted)) < len(json.dumps(exact))
+    assert shapely.get_num_coordinates(compacted_shape) <= shapely.get_num_coordinates(
+        exact_shape,
+    )
+    # A ring of twice the tolerance at most around the buffer, in degrees.
+    ring = 2 * (tolerance_m + 1) / 111_320
+    assert compacted_shape.difference(exact_shape).area < exact_shape.length * ring
+
+
+def test_compact_geometry_simplifies():
+    """A small buffer loses most of its vertices with the default tolerance."""
+    compacted = compact_geometry(_buffer(0.5), tolerance_m=25)
+    assert shapely.get_num_coordinates(shapely.geometry.shape(compacted)) < 20
+
+
+def test_compact_geometry_precision():
+    """Coordinates are rounded to the given number of decimal digits."""
+    compacted = compact_geometry(
+        {"type": "Point", "coordinates": [-9.139312345678, 38.722398765432]},
+        precision=5,
+    )
+    assert compacted["coordinates"] == [-9.13931, 38.7224]
+
+    coordinates = np.array(compact_geometry(_buffer(2), precision=4)["coordinates"])
+    np.testing.assert_array_equal(coordinates, coordinates.round(4))
+
+
+def test_compact_feature_collection():
+    """Places get quantized geometries, their properties are unchanged."""
+    place = Feature(
+        type="Feature",
+        geometry={"type": "Point", "coordinates": [-9.139312345678, 38.722398765432]},
+        properties={"name": "Lisbon"},
+    )
+    collection = FeatureCollection(type="FeatureCollection", features=[place])
+
+    compacted = compact_feature_collection(collection, precision=3)
+
+    assert compacted.features[0].geometry.coordinates == (-9.139, 38.722)
+    assert compacted.features[0].properties == {"name": "Lisbon"}
+    # The input collection is left untouched.
+    assert collection.features[0] is place
+    assert compact_feature_collection(None) is None
+
+
+def test_compact_feature_none():
+    """Missing features and geometries are passed through."""
+    assert compact_feature(None) is None
+    feature = Feature(type="Feature", geometry=None, properties={})
+    assert compact_feature(feature) is feature
+
+
+def test_geometry_bounds():
+    """Bounds are those of the geometry, for the bbox prefilter."""
+    minx, miny, maxx, maxy = geometry_bounds(_buffer(1))
+    assert minx < CENTER[0] < maxx
+    assert miny < CENTER[1] < maxy
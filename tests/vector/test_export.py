@@ -0,0 +1,59 @@
+"""Tests for the streaming export of query results."""
+
+import io
+
+import duckdb
+import geopandas as gpd
+import pyarrow as pa
+import pytest
+import shapely
+
+from geo_assistant.vector.export import write_batches
+
+
+@pytest.fixture
+def places_reader():
+    """Factory of record batch readers of 1000 points, 300 rows per batch."""
+    connection = duckdb.connect()
+    points = pa.table(
+        {
+            "id": pa.array(range(1000)),
+            "geometry": pa.array(
+                [shapely.Point(i / 100, i / 100).wkb for i in range(1000)],
+                pa.binary(),
+            ),
+        },
+    )
+    connection.register("points", points)
+    yield lambda: connection.execute(
+        "SELECT id, 'place ' || id AS name, geometry FROM points",
+    ).fetch_record_batch(300)
+    connection.close()
+
+
+def test_write_arrow_stream(places_reader):
+    """Batches are written to the Arrow IPC stream as they are read."""
+    chunks = list(write_batches(places_reader(), "arrow"))
+    assert len(chunks) > 4
+
+    table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+    assert table.num_rows == 1000
+    assert table.column_names == ["id", "name", "geometry"]
+    assert shapely.from_wkb(table["geometry"][5].as_py()) == shapely.Point(0.05, 0.05)
+
+
+def test_write_geoparquet(places_reader):
+    """The GeoParquet file has a row group per batch and its geometry metadata."""
+    data = b"".join(write_batches(places_reader(), "parquet"))
+
+    places = gpd.read_parquet(io.BytesIO(data))
+    assert len(places) == 1000
+    assert places.crs == "OGC:CRS84"
+    assert places.geometry.iloc[5] == shapely.Point(0.05, 0.05)
+    assert pa.parquet.ParquetFile(io.BytesIO(data)).num_row_groups == 4
+
+
+def test_unsupported_format(places_reader):
+    """Only Arrow and GeoParquet are supported."""
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        list(write_batches(places_reader(), "csv"))
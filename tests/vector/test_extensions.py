@@ -0,0 +1,24 @@
+"""Tests for the provisioned DuckDB extensions."""
+
+import pytest
+
+from geo_assistant.vector import extensions, s3cache
+from geo_assistant.vector.extensions import connect, required_extensions
+
+
+def test_required_extensions(monkeypatch):
+    """The httpfs extension is only loaded to read from S3 without the cache."""
+    assert required_extensions("local") == ["spatial"]
+    assert required_extensions("s3") == ["spatial", "httpfs"]
+    monkeypatch.setattr(s3cache, "S3_CACHE", "disk")
+    assert required_extensions("s3") == ["spatial"]
+
+
+def test_connect_without_provisioned_extension(tmp_path, monkeypatch):
+    """Missing extensions are reported instead of downloaded when install is off."""
+    monkeypatch.setattr(extensions, "DUCKDB_EXTENSION_INSTALL", "off")
+    connection = connect([], extension_dir=tmp_path)
+    assert connection.execute("SELECT 42").fetchone() == (42,)
+    with pytest.raises(RuntimeError, match="'spatial' is not provisioned"):
+        connect(["spatial"], extension_dir=tmp_path)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,181 @@
+"""Tests for the persistent cache of the Overture files read from S3."""
+
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+import duckdb
+import pandas as pd
+import pytest
+
+from geo_assistant.vector import s3cache
+from geo_assistant.vector.s3cache import (
+    BLOCK_SIZE,
+    CachedS3FileSystem,
+    S3Cache,
+    cached_url,
+)
+
+RELEASE = "release/2025-11-19.0/theme=places/type=place"
+
+
+class S3StandIn(ThreadingHTTPServer):
+    """Local S3-compatible server of the files of a directory, per bucket."""
+
+    def __init__(self, root: Path):
+        """Serve `root`, whose subdirectories are buckets, on a free port."""
+        super().__init__(("127.0.0.1", 0), _S3Handler)
+        self.root = root
+        self.requests: Counter[str] = Counter()
+
+    @property
+    def endpoint(self) -> str:
+        """URL of the server."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    """ListObjectsV2 and ranged GetObject requests."""
+
+    server: S3StandIn
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        if not key:
+            self.server.requests["list"] += 1
+            self._list(bucket, parse_qs(url.query).get("prefix", [""])[0])
+        else:
+            self.server.requests["get"] += 1
+            self._get(self.server.root / bucket / key)
+
+    def _list(self, bucket: str, prefix: str):
+        directory = self.server.root / bucket / prefix
+        contents, prefixes = [], []
+        for path in sorted(directory.iterdir()) if directory.is_dir() else []:
+            key = path.relative_to(self.server.root / bucket).as_posix()
+            if path.is_dir():
+                prefixes.append(
+                    f"<CommonPrefixes><Prefix>{escape(key)}/</Prefix></CommonPrefixes>",
+                )
+            else:
+                contents.append(
+                    f"<Contents><Key>{escape(key)}</Key><Size>{path.stat().st_size}</Size>"
+                    f'<ETag>"{path.stat().st_mtime_ns}"</ETag>'
+                    "<LastModified>2025-11-19T00:00:00.000Z</LastModified></Contents>",
+                )
+        body = (
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"{''.join(contents)}{''.join(prefixes)}</ListBucketResult>"
+        ).encode()
+        self._send(200, body)
+
+    def _get(self, path: Path):
+        data = path.read_bytes()
+        start, _, end = self.headers["Range"].removeprefix("bytes=").partition("-")
+        self._send(206, data[int(start) : int(end) + 1])
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def s3_stand_in(tmp_path, monkeypatch):
+    """Places of a release, as files in a bucket of a local S3 stand-in, cached."""
+    monkeypatch.setattr(s3cache, "S3_CACHE", "disk")
+    release = tmp_path / "bucket" / "overture" / RELEASE
+    release.mkdir(parents=True)
+    for part in range(2):
+        pd.DataFrame(
+            {
+                "id": [f"place-{part}-{i}" for i in range(50_000)],
+                "categories": [
+                    {"primary": ["cafe", "bar"][i % 2], "alternate": None}
+                    for i in range(50_000)
+                ],
+            },
+        ).to_parquet(release / f"part-{part}.parquet")
+
+    server = S3StandIn(tmp_path / "bucket")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def _count_cafes(fs: CachedS3FileSystem) -> int:
+    connection = duckdb.connect()
+    connection.register_filesystem(fs)
+    url = cached_url(f"s3://overture/{RELEASE}/*")
+    (count,) = connection.execute(
+        f"SELECT count(*) FROM read_parquet('{url}') WHERE categories.primary = 'cafe'",
+    ).fetchone()
+    connection.close()
+    return count
+
+
+def test_repeated_queries_hit_disk(s3_stand_in, tmp_path):
+    """Listings and blocks are read from S3 once, then from disk across restarts."""
+    cache_path = tmp_path / "cache" / "s3.sqlite"
+    fs = CachedS3FileSystem(S3Cache(cache_path, 2**30), s3_stand_in.endpoint)
+    assert _count_cafes(fs) == 50_000
+    assert s3_stand_in.requests["list"] >= 1
+    assert s3_stand_in.requests["get"] >= 2
+    fetched = s3_stand_in.requests.copy()
+
+    # Same process.
+    assert _count_cafes(fs) == 50_000
+    # New process, with a new filesystem on the same cache.
+    restarted = CachedS3FileSystem(S3Cache(cache_path, 2**30), s3_stand_in.endpoint)
+    assert _count_cafes(restarted) == 50_000
+    assert s3_stand_in.requests == fetched
+    assert restarted.cache.stats()["block_misses"] == 0
+
+
+def test_blocks_are_evicted(s3_stand_in, tmp_path):
+    """Least recently used blocks are evicted beyond the size limit."""
+    # Room for the single block of one of the files.
+    max_bytes = max(path.stat().st_size for path in s3_stand_in.root.rglob("*.parquet"))
+    cache = S3Cache(tmp_path / "s3.sqlite", max_bytes=max_bytes)
+    fs = CachedS3FileSystem(cache, s3_stand_in.endpoint)
+    assert _count_cafes(fs) == 50_000
+    stats = cache.stats()
+    assert stats["blocks"] == 1
+    assert stats["bytes"] <= max_bytes
+    assert stats["evictions"] == 1
+
+
+def test_read_range(s3_stand_in, tmp_path):
+    """Ranges spanning blocks are assembled from cached and fetched blocks."""
+    (s3_stand_in.root / "overture" / "blob").write_bytes(
+        bytes(range(256)) * (3 * BLOCK_SIZE // 256),
+    )
+    fs = CachedS3FileSystem(
+        S3Cache(tmp_path / "s3.sqlite", 2**30),
+        s3_stand_in.endpoint,
+    )
+    with fs.open("overture/blob") as f:
+        f.seek(BLOCK_SIZE - 10)
+        assert f.read(20) == (bytes(range(256)) * 2)[246:266]
+    with fs.open("overture/blob") as f:
+        f.seek(10)
+        assert len(f.read()) == 3 * BLOCK_SIZE - 10
+    # The second and third blocks were fetched by one request.
+    assert s3_stand_in.requests["get"] == 2
+
+
+def test_cached_url(monkeypatch):
+    """Only S3 URLs are read through the cache, when enabled."""
+    assert cached_url("s3://bucket/key/*") == "s3://bucket/key/*"
+    monkeypatch.setattr(s3cache, "S3_CACHE", "disk")
+    assert cached_url("s3://bucket/key/*") == "s3cache://bucket/key/*"
+    assert cached_url("data/overture/*") == "data/overture/*"